@@ -0,0 +1,543 @@
+"""
+Waters Automation Portal Driver - asyncio interface
+
+Asynchronous counterpart of AutomationPortalDriver for schedulers that run the
+portal alongside other instruments in one event loop. TCP uses asyncio streams;
+serial uses a non-blocking adapter around pyserial. Response framing and parsing
+are shared with the blocking driver through portal_protocol.
+
+Based on Waters Automation Portal PC Protocol Specification (715008839).
+"""
+
+import asyncio
+import logging
+import socket
+import sys
+import time
+from typing import Optional, Dict, Any
+
+import serial
+
+import config
+from portal_telemetry import Telemetry, CommandSpan, build_span, complete_move_span, OUTCOME_PENDING
+from automation_portal_driver import AutomationPortalError, PortalCommandError
+from portal_recorder import FrameRecorder, RECORD_TX, RECORD_RX
+from portal_protocol import FrameDecoder, PortalResponse, status_dict, move_result, encode_command
+from portal_timing import CommandTimingPolicy
+
+
+class AsyncPortalTransport:
+    """Base class for framed asyncio Automation Portal transports."""
+
+    def __init__(self):
+        self.decoder = FrameDecoder()
+        # FrameRecorder receiving every write and read (None: not recording)
+        self.recorder = None
+
+    async def write(self, data: bytes) -> None:
+        """Write raw command bytes to the connection."""
+        if self.recorder is not None:
+            self.recorder.record(RECORD_TX, data)
+        await self._write(data)
+
+    async def _write(self, data: bytes) -> None:
+        raise NotImplementedError
+
+    async def _read_chunk(self, timeout: float) -> bytes:
+        """Read available bytes, waiting up to timeout seconds. Returns b'' on timeout."""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        """Close the underlying connection."""
+        raise NotImplementedError
+
+    async def read_frame(self, timeout: float) -> Optional[bytes]:
+        """
+        Return the next complete response frame.
+
+        Args:
+            timeout: Maximum time to wait for a frame in seconds
+
+        Returns:
+            Frame bytes without terminator, or None if no complete frame arrived in time
+        """
+        frame = self.decoder.next_frame()
+        if frame is not None:
+            return frame
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            chunk = await self._read_chunk(remaining)
+            if not chunk:
+                return None
+            if self.recorder is not None:
+                self.recorder.record(RECORD_RX, chunk)
+            if self.decoder.feed(chunk):
+                return self.decoder.next_frame()
+
+
+class AsyncTcpTransport(AsyncPortalTransport):
+    """Framed transport over asyncio TCP streams."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        super().__init__()
+        self.reader = reader
+        self.writer = writer
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+    @classmethod
+    async def open(cls, host: str, port: int, timeout: float) -> 'AsyncTcpTransport':
+        """Connect to host:port and return a transport for the stream."""
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        return cls(reader, writer)
+
+    async def _write(self, data: bytes) -> None:
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def _read_chunk(self, timeout: float) -> bytes:
+        try:
+            chunk = await asyncio.wait_for(self.reader.read(config.DATA_BUFFER_SIZE), timeout)
+        except asyncio.TimeoutError:
+            return b''
+        if not chunk:
+            raise ConnectionError("Connection closed by Automation Portal")
+        return chunk
+
+    async def close(self) -> None:
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+class AsyncSerialAdapter(AsyncPortalTransport):
+    """
+    Non-blocking framed transport over a pyserial port.
+
+    On POSIX the port is switched to non-blocking reads and the event loop is
+    woken by readiness of the port's file descriptor. Where that is not
+    available (Windows COM ports) the blocking read runs in the default executor.
+    """
+
+    def __init__(self, serial_port):
+        super().__init__()
+        self.serial_port = serial_port
+        self._fd = None
+        if sys.platform != 'win32' and hasattr(serial_port, 'fileno'):
+            self._fd = serial_port.fileno()
+            self.serial_port.timeout = 0
+
+    async def _write(self, data: bytes) -> None:
+        self.serial_port.write(data)
+
+    async def _read_chunk(self, timeout: float) -> bytes:
+        if self._fd is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._blocking_read, timeout)
+
+        data = self.serial_port.read(self.serial_port.in_waiting)
+        if data:
+            return data
+
+        loop = asyncio.get_running_loop()
+        readable = loop.create_future()
+        loop.add_reader(self._fd, lambda: readable.done() or readable.set_result(None))
+        try:
+            await asyncio.wait_for(readable, timeout)
+        except asyncio.TimeoutError:
+            return b''
+        finally:
+            loop.remove_reader(self._fd)
+        return self.serial_port.read(self.serial_port.in_waiting or 1)
+
+    def _blocking_read(self, timeout: float) -> bytes:
+        self.serial_port.timeout = timeout
+        return self.serial_port.read(self.serial_port.in_waiting or 1)
+
+    async def close(self) -> None:
+        self.serial_port.close()
+
+
+class AsyncAutomationPortalDriver:
+    """
+    asyncio driver for Waters Automation Portal - Sample Transfer Operations Only.
+
+    Exposes the same command surface as AutomationPortalDriver with coroutine
+    methods, so the portal can share an event loop with other instruments.
+    """
+
+    def __init__(self,
+                 port: str = None,
+                 baudrate: int = None,
+                 timeout: float = None,
+                 host: str = None,
+                 tcp_port: int = None,
+                 comm_mode: str = None,
+                 timing_policy: CommandTimingPolicy = None,
+                 telemetry: Telemetry = None,
+                 recorder: FrameRecorder = None):
+        """
+        Initialize the asyncio Waters Automation Portal driver.
+
+        Args:
+            port: Serial port for communication (e.g., 'COM1' on Windows)
+            baudrate: Communication baudrate (default from config)
+            timeout: Timeout for communication in seconds
+            host: IP address for TCP/IP communication
+            tcp_port: TCP port for network communication
+            comm_mode: Communication mode ('serial' or 'tcp')
+            timing_policy: Per-command timeout and poll policy (default from config.PORTAL_TIMEOUTS)
+            telemetry: Receives a CommandSpan for every command (default: no telemetry)
+            recorder: FrameRecorder logging every frame sent and received (default: not recording)
+        """
+        self.port = port or config.DEFAULT_PORT
+        self.baudrate = baudrate or config.DEFAULT_BAUDRATE
+        self.timeout = timeout or config.DEFAULT_TIMEOUT
+        self.host = host or config.DEFAULT_TCP_HOST
+        self.tcp_port = tcp_port or config.DEFAULT_TCP_PORT
+        self.comm_mode = comm_mode or config.COMM_MODE_SERIAL
+        self.timing_policy = timing_policy or CommandTimingPolicy()
+        self.telemetry = telemetry
+        self.recorder = recorder
+        self._move_span: Optional[CommandSpan] = None
+
+        self.transport: Optional[AsyncPortalTransport] = None
+        self.is_connected = False
+        self.sequence_number = 0
+        self._lock = asyncio.Lock()
+
+        self.logger = logging.getLogger(__name__)
+
+    async def connect(self) -> bool:
+        """
+        Establish connection to the Automation Portal.
+
+        Returns:
+            True if connection successful, False otherwise
+        """
+        try:
+            if self.comm_mode == config.COMM_MODE_SERIAL:
+                serial_port = serial.Serial(
+                    port=self.port,
+                    baudrate=self.baudrate,
+                    timeout=self.timeout,
+                    bytesize=serial.EIGHTBITS,
+                    parity=serial.PARITY_NONE,
+                    stopbits=serial.STOPBITS_ONE
+                )
+                self.transport = AsyncSerialAdapter(serial_port)
+                self.logger.info(f"Connected via serial to {self.port}")
+
+            elif self.comm_mode == config.COMM_MODE_TCP:
+                self.transport = await AsyncTcpTransport.open(self.host, self.tcp_port, self.timeout)
+                self.logger.info(f"Connected via TCP to {self.host}:{self.tcp_port}")
+
+            else:
+                raise AutomationPortalError(f"Invalid communication mode: {self.comm_mode}")
+
+            if self.recorder is not None:
+                self.recorder.start_session(comm_mode=self.comm_mode, port=self.port, host=self.host,
+                                            tcp_port=self.tcp_port)
+                self.transport.recorder = self.recorder
+
+            self.is_connected = True
+            return True
+
+        except Exception as e:
+            self.logger.error(f"Connection failed: {e}")
+            self.is_connected = False
+            return False
+
+    async def disconnect(self) -> None:
+        """Disconnect from the Automation Portal."""
+        if self.transport:
+            try:
+                await self.transport.close()
+                self.logger.info("Disconnected from Automation Portal")
+            except Exception as e:
+                self.logger.error(f"Error during disconnect: {e}")
+            finally:
+                self.transport = None
+                self.is_connected = False
+
+    def _get_next_sequence(self) -> int:
+        """Get the next sequence number for commands."""
+        self.sequence_number = (self.sequence_number % 255) + 1
+        return self.sequence_number
+
+    async def _send_command(self, command: str, retries: int = None) -> str:
+        """
+        Send a command to the Automation Portal and return the response.
+
+        Args:
+            command: Command string to send
+            retries: Number of retry attempts
+
+        Returns:
+            Response from the system
+
+        Raises:
+            AutomationPortalError: If communication fails
+        """
+        return (await self._exchange(command, retries)).text
+
+    async def _exchange(self, command: str, retries: int = None) -> PortalResponse:
+        """
+        Send a command and return the parsed response frames.
+
+        Args:
+            command: Command string to send
+            retries: Number of retry attempts
+
+        Returns:
+            PortalResponse holding every frame received for the command
+
+        Raises:
+            AutomationPortalError: If communication fails
+            PortalCommandError: If the portal reports a fatal error
+        """
+        if not self.is_connected or not self.transport:
+            raise AutomationPortalError("Not connected to Automation Portal")
+
+        if retries is None:
+            retries = config.MAX_RETRIES
+
+        delay = config.RETRY_BACKOFF_INITIAL
+        bytes_sent = 0
+        for attempt in range(retries + 1):
+            sent_at = time.monotonic()
+            try:
+                # One exchange on the wire at a time
+                async with self._lock:
+                    data = encode_command(command)
+                    await self.transport.write(data)
+                    bytes_sent += len(data)
+                    response = await self._read_response(command)
+
+            except Exception as e:
+                if attempt < retries:
+                    self.logger.warning(f"Command failed (attempt {attempt + 1}), retrying: {e}")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, config.RETRY_DELAY)
+                    continue
+                if self.telemetry:
+                    self._record_span(command, None, sent_at, attempt, bytes_sent)
+                raise AutomationPortalError(f"Communication error after {retries + 1} attempts: {e}")
+
+            self.logger.debug("Sent: %s | Received: %s", command, response)
+
+            # Transient errors are retried quickly, fatal ones are never retried
+            error = response.error_info
+            if error is not None:
+                if error.fatal:
+                    if self.telemetry:
+                        self._record_span(command, response, sent_at, attempt, bytes_sent)
+                    raise PortalCommandError(error)
+                if error.transient and attempt < retries:
+                    self.logger.warning(f"{error} (attempt {attempt + 1}), retrying")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, config.RETRY_DELAY)
+                    continue
+            if self.telemetry:
+                self._record_span(command, response, sent_at, attempt, bytes_sent)
+            return response
+
+        return PortalResponse(command)
+
+    def _record_span(self, command: str, response: Optional[PortalResponse], sent_at: float, retries: int,
+                     bytes_sent: int) -> None:
+        """Emit the span of an exchange; a move's span is held until the move finishes."""
+        span = build_span(command, response, sent_at, retries, bytes_sent)
+        if span.outcome == OUTCOME_PENDING:
+            self._move_span = span
+        else:
+            self.telemetry.emit(span)
+
+    async def _read_response(self, command: str) -> PortalResponse:
+        """Read frames until the Completed/Error frame for command arrives or the timeout expires."""
+        response = PortalResponse(command)
+        deadline = time.monotonic() + self.timing_policy.read_timeout(command, self.timeout)
+
+        while True:
+            frame = await self.transport.read_frame(deadline - time.monotonic())
+            if frame is None or response.add(frame):
+                break
+
+        return response
+
+    async def get_status(self) -> Dict[str, Any]:
+        """
+        Get the current status of the Automation Portal.
+
+        Returns:
+            Dictionary containing status information (see AutomationPortalDriver.get_status)
+        """
+        try:
+            return status_dict(await self._exchange("GetStatus"))
+        except Exception as e:
+            self.logger.error(f"Error getting status: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    async def initialize(self) -> bool:
+        """
+        Initialize the Automation Portal system.
+
+        Returns:
+            True if initialization successful, False otherwise
+        """
+        try:
+            started = time.monotonic()
+            response = await self._exchange("Initialize")
+
+            if response.error:
+                # Try with sequence if simple command failed
+                seq = self._get_next_sequence()
+                response = await self._exchange(f"Initialize({seq})")
+
+                if response.error:
+                    self.logger.error(f"Initialize command failed: {response.error_info or response}")
+                    return False
+
+            return await self._wait_for_move("Initialize", response, started)
+
+        except Exception as e:
+            self.logger.error(f"Error during initialization: {e}")
+            return False
+
+    async def extract_drawer(self, tray_position: int) -> bool:
+        """
+        Extract a drawer from the specified sample manager tray position.
+
+        Args:
+            tray_position: Tray position (0 or 1)
+
+        Returns:
+            True if extraction successful, False otherwise
+        """
+        if tray_position not in [0, 1]:
+            raise ValueError("Tray position must be 0 or 1")
+
+        try:
+            started = time.monotonic()
+            response = await self._exchange(f"Extract({tray_position})")
+            if response.error:
+                self.logger.error(f"Extract command failed immediately: {response.error_info or response}")
+                return False
+
+            if await self._wait_for_move("Extract", response, started):
+                self.logger.info(f"Drawer extracted successfully from position {tray_position}")
+                return True
+            return False
+
+        except Exception as e:
+            self.logger.error(f"Error extracting drawer: {e}")
+            return False
+
+    async def insert_drawer(self, tray_position: int) -> bool:
+        """
+        Insert a drawer into the specified sample manager tray position.
+
+        Args:
+            tray_position: Tray position (0 or 1)
+
+        Returns:
+            True if insertion successful, False otherwise
+        """
+        if tray_position not in [0, 1]:
+            raise ValueError("Tray position must be 0 or 1")
+
+        try:
+            started = time.monotonic()
+            response = await self._exchange(f"Insert({tray_position})")
+            if response.error:
+                self.logger.error(f"Insert command failed immediately: {response.error_info or response}")
+                return False
+
+            if await self._wait_for_move("Insert", response, started):
+                self.logger.info(f"Drawer inserted successfully to position {tray_position}")
+                return True
+            return False
+
+        except Exception as e:
+            self.logger.error(f"Error inserting drawer: {e}")
+            return False
+
+    async def _wait_for_move(self, command: str, response: PortalResponse, started: float) -> bool:
+        """Poll GetStatus on the timing policy's schedule until a move completes, fails or times out."""
+        max_wait_time = self.timing_policy.timeout(command)
+        deadline = started + max_wait_time
+        last_response = response
+
+        # The move's own Completed frame may already have arrived with the acknowledgement
+        result = True if response.completed else None
+
+        interval = None
+        while result is None and time.monotonic() < deadline:
+            interval = self.timing_policy.next_interval(command, time.monotonic() - started, interval)
+            await asyncio.sleep(min(interval, max(0.0, deadline - time.monotonic())))
+            last_response = await self._exchange("GetStatus")
+            result = move_result(last_response, command)
+
+        if self.telemetry and self._move_span is not None:
+            self.telemetry.emit(complete_move_span(self._move_span, result, last_response, started))
+            self._move_span = None
+        if result is True:
+            self.timing_policy.record(command, time.monotonic() - started)
+            self.logger.info(f"{command} completed successfully")
+            return True
+        if result is False:
+            self.logger.error(f"{command} operation failed: {last_response}")
+            return False
+
+        self.logger.error(f"{command} operation timed out after {max_wait_time} seconds")
+        return False
+
+    async def report_version(self) -> str:
+        """
+        Get the system version information.
+
+        Returns:
+            Version information string
+        """
+        try:
+            return (await self._exchange("ReportVersion")).text
+        except Exception as e:
+            self.logger.error(f"Error getting version: {e}")
+            return f"Error: {e}"
+
+    async def reset_system(self) -> bool:
+        """
+        Reset the Automation Portal system.
+
+        Returns:
+            True if reset successful, False otherwise
+        """
+        try:
+            response = await self._exchange("ResetSystem")
+            success = response.completed
+            if success:
+                self.logger.info("System reset completed")
+            else:
+                self.logger.error(f"System reset failed: {response}")
+            return success
+        except Exception as e:
+            self.logger.error(f"Error resetting system: {e}")
+            return False
+
+    async def __aenter__(self):
+        """Async context manager entry."""
+        if await self.connect():
+            return self
+        raise AutomationPortalError("Failed to connect to Automation Portal")
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Async context manager exit."""
+        await self.disconnect()
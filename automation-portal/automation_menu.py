@@ -5,15 +5,17 @@ Provides an easy-to-use interface for automation portal operations
 """
 
 import sys
+import argparse
 import logging
 from automation_portal_driver import AutomationPortalDriver
+from portal_recorder import FrameRecorder
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 class AutomationPortalMenu:
-    def __init__(self):
-        self.driver = AutomationPortalDriver()
+    def __init__(self, driver=None):
+        self.driver = driver or AutomationPortalDriver()
         self.connected = False
     
     def clear_screen(self):
@@ -30,6 +32,10 @@ class AutomationPortalMenu:
     def print_status_bar(self):
         """Print current connection status"""
         status_msg = "🟢 Connected" if self.connected else "🔴 Disconnected"
+        # Last known state from the driver's status cache; never touches the wire
+        snapshot = self.driver.cached_status() if self.connected else None
+        if snapshot is not None:
+            status_msg += f" | {snapshot.system_state} | {snapshot.door_status} | {snapshot.status}"
         print(f"Status: {status_msg}")
         print("-" * 60)
     
@@ -154,6 +160,31 @@ class AutomationPortalMenu:
         except Exception as e:
             print(f"❌ Insert error: {e}")
     
+    def batch_exchange(self):
+        """Exchange plates at several positions in one sequence"""
+        if not self.connected:
+            print("❌ Not connected. Please connect first.")
+            return
+        
+        try:
+            positions = input("Enter positions in order (e.g. 0 1 0): ").split()
+            if not positions or any(pos not in ['0', '1'] for pos in positions):
+                print("❌ Invalid positions. Each must be 0 or 1.")
+                return
+            
+            def swap_plate(position):
+                input(f"🔄 Drawer from position {position} is out. Swap the plate, then press Enter...")
+            
+            print(f"🔄 Running {len(positions)} exchange(s)...")
+            report = self.driver.exchange_drawers([int(pos) for pos in positions], handoff=swap_plate)
+            for exchange in report['exchanges']:
+                mark = "✅" if exchange['success'] else "❌"
+                detail = exchange['error'] or f"{sum(exchange['timings'].values()):.1f}s"
+                print(f"   {mark} Position {exchange['tray_position']}: {exchange['stage']} ({detail})")
+            print(f"📊 {report['completed']}/{len(positions)} exchanged in {report['elapsed_seconds']}s")
+        except Exception as e:
+            print(f"❌ Batch exchange error: {e}")
+    
     def get_version_info(self):
         """Get system version information"""
         if not self.connected:
@@ -178,6 +209,7 @@ class AutomationPortalMenu:
         print("  7. Disconnect")
         print("  8. Clear Screen")
         print("  9. Exit")
+        print(" 10. Batch Plate Exchange (extract, swap, insert)")
         print()
     
     def run(self):
@@ -190,7 +222,7 @@ class AutomationPortalMenu:
             self.show_menu()
             
             try:
-                choice = input("Enter your choice (1-9): ").strip()
+                choice = input("Enter your choice (1-10): ").strip()
                 
                 if choice == '1':
                     self.connect()
@@ -214,8 +246,10 @@ class AutomationPortalMenu:
                         self.disconnect()
                     print("👋 Goodbye!")
                     sys.exit(0)
+                elif choice == '10':
+                    self.batch_exchange()
                 else:
-                    print("❌ Invalid choice. Please enter 1-9.")
+                    print("❌ Invalid choice. Please enter 1-10.")
                 
                 input("\nPress Enter to continue...")
                 
@@ -229,5 +263,21 @@ class AutomationPortalMenu:
                 input("\nPress Enter to continue...")
 
 if __name__ == "__main__":
-    menu = AutomationPortalMenu()
+    parser = argparse.ArgumentParser(description="Waters Automation Portal interactive menu")
+    parser.add_argument('--port', help="Serial port (e.g. COM4, or a simulator pty)")
+    parser.add_argument('--host', help="Portal IP address for TCP mode")
+    parser.add_argument('--tcp-port', type=int, help="Portal TCP port (selects TCP mode)")
+    parser.add_argument('--server', help="Use a running portal_server.py (socket path or host:port)")
+    parser.add_argument('--record', help="Append all wire traffic to this recording (see portal_recorder.py)")
+    args = parser.parse_args()
+    
+    if args.server:
+        from portal_server import PortalClient
+        driver = PortalClient(args.server)
+    else:
+        comm_mode = 'tcp' if args.tcp_port or args.host else None
+        recorder = FrameRecorder(args.record) if args.record else None
+        driver = AutomationPortalDriver(port=args.port, host=args.host, tcp_port=args.tcp_port, comm_mode=comm_mode,
+                                        recorder=recorder)
+    menu = AutomationPortalMenu(driver)
     menu.run()
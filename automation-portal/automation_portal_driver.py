@@ -9,12 +9,25 @@ Based on Waters Automation Portal PC Protocol Specification (715008839).
 """
 
 import serial
-import socket
 import time
 import logging
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Optional, Dict, Any, List, Union
 import config
+from portal_protocol import (PortalResponse, PortalFrame, PortalStatus, PortalErrorInfo, status_dict,
+                             move_result, command_name, encode_command, MOVE_COMMANDS)
+from portal_transport import PortalTransport, SerialTransport, TcpTransport
+from portal_recorder import FrameRecorder, ReplayTransport
+from portal_pipeline import CommandPipeline, PendingCommand
+from portal_supervisor import PortalConnectionSupervisor
+from portal_exchange import run_exchanges, DrawerExchange, HandoffCallback
+from portal_telemetry import Telemetry, CommandSpan, build_span, complete_move_span, OUTCOME_PENDING
+from portal_status_monitor import PortalStatusMonitor
+from portal_move_analytics import MoveAnalytics
+from portal_timing import CommandTimingPolicy
+from portal_wire_lock import WireLock, command_priority, PRIORITY_QUERY
 
 
 class AutomationPortalError(Exception):
@@ -22,6 +35,19 @@ class AutomationPortalError(Exception):
     pass
 
 
+class PortalCommandError(AutomationPortalError):
+    """Raised when the portal answers a command with a fatal Error frame."""
+    
+    def __init__(self, error: PortalErrorInfo):
+        super().__init__(str(error))
+        self.error = error
+
+
+def _is_link_error(error: Exception) -> bool:
+    """True for I/O errors that mean the connection itself is gone."""
+    return isinstance(error, OSError) and not isinstance(error, TimeoutError)
+
+
 class AutomationPortalDriver:
     """
     Driver for Waters Automation Portal - Sample Transfer Operations Only.
@@ -38,17 +64,33 @@ class AutomationPortalDriver:
                  timeout: float = None,
                  host: str = None,
                  tcp_port: int = None,
-                 comm_mode: str = None):
+                 comm_mode: str = None,
+                 timing_policy: CommandTimingPolicy = None,
+                 pipelined: bool = False,
+                 status_cache_ttl: float = None,
+                 telemetry: Telemetry = None,
+                 recorder: FrameRecorder = None,
+                 replay_speed: float = 1.0):
         """
         Initialize the Waters Automation Portal driver.
         
         Args:
-            port: Serial port for communication (e.g., 'COM1' on Windows)
+            port: Serial port for communication (e.g., 'COM1' on Windows); in replay
+                mode, the recording to replay
             baudrate: Communication baudrate (default from config)
             timeout: Timeout for communication in seconds
             host: IP address for TCP/IP communication
             tcp_port: TCP port for network communication
-            comm_mode: Communication mode ('serial' or 'tcp')
+            comm_mode: Communication mode ('serial', 'tcp' or 'replay')
+            timing_policy: Per-command timeout and poll policy (default from config.PORTAL_TIMEOUTS)
+            pipelined: Tag commands with sequence numbers and keep several in flight,
+                so status reads are answered while a move runs (requires firmware
+                that echoes sequence numbers)
+            status_cache_ttl: Seconds a GetStatus snapshot is reused by get_status() and
+                the is_* predicates (default config.STATUS_CACHE_TTL, 0 disables)
+            telemetry: Receives a CommandSpan for every command (default: no telemetry)
+            recorder: FrameRecorder logging every frame sent and received (default: not recording)
+            replay_speed: Replay speed relative to the recording in replay mode (0: no delays)
         """
         # Communication settings
         self.port = port or config.DEFAULT_PORT
@@ -57,24 +99,49 @@ class AutomationPortalDriver:
         self.host = host or config.DEFAULT_TCP_HOST
         self.tcp_port = tcp_port or config.DEFAULT_TCP_PORT
         self.comm_mode = comm_mode or config.COMM_MODE_SERIAL
+        self.timing_policy = timing_policy or CommandTimingPolicy()
+        self.pipelined = pipelined
+        self.status_cache_ttl = config.STATUS_CACHE_TTL if status_cache_ttl is None else status_cache_ttl
+        self.telemetry = telemetry
+        self.recorder = recorder
+        self.replay_speed = replay_speed
         
         # Connection state
         self.connection = None
         self.is_connected = False
         self.sequence_number = 0
+        self.transport: Optional[PortalTransport] = None
+        self.status_monitor: Optional[PortalStatusMonitor] = None
+        # Per-phase move timing, fed by the status monitor; kept across monitor restarts
+        portal = f"{self.host}:{self.tcp_port}" if self.comm_mode == config.COMM_MODE_TCP else self.port
+        self.move_analytics = MoveAnalytics(portal)
+        self.pipeline: Optional[CommandPipeline] = None
+        self.supervisor: Optional[PortalConnectionSupervisor] = None
+        self.last_exchange_at = 0.0
+        self._move_span: Optional[CommandSpan] = None
+        # Serializes command/response exchanges between threads sharing this driver;
+        # queries are served before commands so status reads are not held up
+        self._io_lock = WireLock()
+        # Move Completed/Error frames read by another thread's exchange, by move name
+        self._late_move_frames: Dict[str, PortalFrame] = {}
+        self._late_move_frame_event = threading.Event()
+        # Consumers sharing the connection through session()
+        self._session_lock = threading.Lock()
+        self._sessions = 0
+        self._session_connected = False
+        
+        # Last parsed GetStatus snapshot; movement commands invalidate it
+        self._status_lock = threading.Lock()
+        self._status_snapshot: Optional[PortalStatus] = None
+        self._status_snapshot_at = 0.0
+        self._status_invalidated_at = 0.0
         
         # Instrument information (placeholder until connected)
         self.instrument_id = "Waters Automation Portal"
         self.available_modules = ["Sample Transfer", "Automation Portal"]
         
-        # Setup logging
+        # Logging is configured by the application (see automation_menu.py)
         self.logger = logging.getLogger(__name__)
-        if not self.logger.handlers:
-            handler = logging.StreamHandler()
-            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-            handler.setFormatter(formatter)
-            self.logger.addHandler(handler)
-            self.logger.setLevel(logging.DEBUG)
     
     def connect(self) -> bool:
         """
@@ -93,17 +160,31 @@ class AutomationPortalDriver:
                     parity=serial.PARITY_NONE,
                     stopbits=serial.STOPBITS_ONE
                 )
+                self.transport = SerialTransport(self.connection)
                 self.logger.info(f"Connected via serial to {self.port}")
                 
             elif self.comm_mode == config.COMM_MODE_TCP:
-                self.connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.connection.settimeout(self.timeout)
-                self.connection.connect((self.host, self.tcp_port))
+                self.transport = TcpTransport.open(self.host, self.tcp_port, self.timeout)
+                self.connection = self.transport.sock
                 self.logger.info(f"Connected via TCP to {self.host}:{self.tcp_port}")
                 
+            elif self.comm_mode == config.COMM_MODE_REPLAY:
+                self.transport = ReplayTransport.open(self.port, self.replay_speed)
+                self.connection = self.transport
+                self.logger.info(f"Replaying {self.port} at speed {self.replay_speed}")
+                
             else:
                 raise AutomationPortalError(f"Invalid communication mode: {self.comm_mode}")
             
+            if self.recorder is not None:
+                self.recorder.start_session(comm_mode=self.comm_mode, port=self.port, host=self.host,
+                                            tcp_port=self.tcp_port, pipelined=self.pipelined)
+                self.transport.recorder = self.recorder
+            
+            if self.pipelined:
+                self.pipeline = CommandPipeline(self.transport, on_failure=self._report_link_failure)
+                self.pipeline.start()
+            
             self.is_connected = True
             return True
             
@@ -114,6 +195,16 @@ class AutomationPortalDriver:
     
     def disconnect(self) -> None:
         """Disconnect from the Automation Portal."""
+        self.stop_supervisor()
+        self.stop_status_monitor()
+        self._close_link()
+    
+    def _close_link(self) -> None:
+        """Close the connection, leaving the status monitor and supervisor running."""
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline = None
+        self.invalidate_status()
         if self.connection:
             try:
                 self.connection.close()
@@ -122,8 +213,160 @@ class AutomationPortalDriver:
                 self.logger.error(f"Error during disconnect: {e}")
             finally:
                 self.connection = None
+                self.transport = None
                 self.is_connected = False
     
+    def open_session(self) -> bool:
+        """
+        Join the shared connection, connecting if no consumer is connected yet.
+        
+        Returns:
+            True if the driver is connected
+        """
+        with self._session_lock:
+            if not self.is_connected:
+                if not self.connect():
+                    return False
+                self._session_connected = True
+            self._sessions += 1
+            return True
+    
+    def close_session(self) -> None:
+        """Leave the shared connection; the last session closes a connection it opened."""
+        with self._session_lock:
+            self._sessions = max(0, self._sessions - 1)
+            if self._sessions == 0 and self._session_connected:
+                self._session_connected = False
+                self.disconnect()
+    
+    @contextmanager
+    def session(self):
+        """
+        Share this driver's connection with other consumers.
+        
+        Threads (a UI status poller, a workflow, a scheduler) each use a session
+        instead of opening the port themselves; the connection is opened by the
+        first session and closed when the last one ends.
+        
+        Example:
+            with driver.session():
+                driver.extract_drawer(1)
+        
+        Raises:
+            AutomationPortalError: If the connection cannot be opened
+        """
+        if not self.open_session():
+            raise AutomationPortalError("Not connected to Automation Portal")
+        try:
+            yield self
+        finally:
+            self.close_session()
+    
+    def start_status_monitor(self, idle_interval: float = 2.0,
+                             moving_interval: Optional[float] = 0.5) -> PortalStatusMonitor:
+        """
+        Start a background status monitor for this connection.
+        
+        While the monitor runs, it is the only source of GetStatus polling: move
+        commands wait on its updates instead of polling themselves, and callers can
+        subscribe to state transitions. Its polls also time the phases of every
+        move in move_analytics.
+        
+        Args:
+            idle_interval: Poll interval in seconds while the portal is idle
+            moving_interval: Poll interval in seconds while a move is in progress,
+                or None to follow timing_policy's poll schedule
+            
+        Returns:
+            The running PortalStatusMonitor
+        """
+        if not self.is_connected:
+            raise AutomationPortalError("Not connected to Automation Portal")
+        if self.status_monitor is None:
+            self.status_monitor = PortalStatusMonitor(self, idle_interval, moving_interval, self.move_analytics)
+        self.status_monitor.start()
+        return self.status_monitor
+    
+    def stop_status_monitor(self) -> None:
+        """Stop the background status monitor, if running."""
+        if self.status_monitor is not None:
+            self.status_monitor.stop()
+            self.status_monitor = None
+    
+    def start_supervisor(self, **kwargs) -> PortalConnectionSupervisor:
+        """
+        Start a connection health supervisor for this driver.
+        
+        The supervisor sends heartbeat GetStatus commands while the link is idle,
+        reconnects with jittered backoff after I/O errors or missed heartbeats and
+        re-syncs the portal. While it runs, commands wait for a lost link to come
+        back instead of failing. It may be started before connect() succeeds.
+        
+        Args:
+            **kwargs: PortalConnectionSupervisor arguments (heartbeat_interval, ...)
+            
+        Returns:
+            The running PortalConnectionSupervisor
+        """
+        if self.supervisor is None:
+            self.supervisor = PortalConnectionSupervisor(self, **kwargs)
+        self.supervisor.start()
+        return self.supervisor
+    
+    def stop_supervisor(self) -> None:
+        """Stop the connection supervisor, if running."""
+        if self.supervisor is not None:
+            self.supervisor.stop()
+            self.supervisor = None
+    
+    def _report_link_failure(self, error: Exception) -> None:
+        if self.supervisor is not None:
+            self.supervisor.report_failure(error)
+    
+    def _wait_for_link(self) -> bool:
+        """Wait for the supervisor to restore the link. Returns True if it is back."""
+        supervisor = self.supervisor
+        if supervisor is None or not supervisor.is_running or supervisor.in_supervisor_thread():
+            return False
+        return supervisor.wait_connected() and self.is_connected
+    
+    def invalidate_status(self) -> None:
+        """Drop the cached status snapshot, including any GetStatus already in flight."""
+        with self._status_lock:
+            self._status_snapshot = None
+            self._status_invalidated_at = time.monotonic()
+    
+    def _store_status(self, status: PortalStatus, sent_at: float) -> None:
+        with self._status_lock:
+            # A poll sent before the last invalidation may describe the portal before a move
+            if sent_at >= self._status_invalidated_at and sent_at >= self._status_snapshot_at:
+                self._status_snapshot = status
+                self._status_snapshot_at = sent_at
+    
+    def cached_status(self, max_age: float = None) -> Optional[PortalStatus]:
+        """
+        Return the last GetStatus snapshot without touching the wire.
+        
+        Args:
+            max_age: Maximum snapshot age in seconds (default status_cache_ttl)
+            
+        Returns:
+            PortalStatus, or None if there is no snapshot young enough
+        """
+        if max_age is None:
+            max_age = self.status_cache_ttl
+        with self._status_lock:
+            if self._status_snapshot is None or time.monotonic() - self._status_snapshot_at > max_age:
+                return None
+            return self._status_snapshot
+    
+    def _current_status(self, max_age: float = None) -> Optional[PortalStatus]:
+        """Return a cached snapshot, or poll GetStatus if there is none young enough."""
+        snapshot = self.cached_status(max_age)
+        if snapshot is not None:
+            return snapshot
+        return self._exchange("GetStatus").status
+    
     def _get_next_sequence(self) -> int:
         """Get the next sequence number for commands."""
         self.sequence_number = (self.sequence_number % 255) + 1
@@ -143,61 +386,202 @@ class AutomationPortalDriver:
         Raises:
             AutomationPortalError: If communication fails
         """
-        if not self.is_connected or not self.connection:
-            raise AutomationPortalError("Not connected to Automation Portal")
+        return self._exchange(command, retries).text
+    
+    def _exchange(self, command: str, retries: int = None) -> PortalResponse:
+        """
+        Send a command and return the parsed response frames.
+        
+        Args:
+            command: Command string to send
+            retries: Number of retry attempts
+            
+        Returns:
+            PortalResponse holding every frame received for the command
+            
+        Raises:
+            AutomationPortalError: If communication fails
+            PortalCommandError: If the portal reports a fatal error
+        """
+        if not self.is_connected or not self.transport:
+            if not self._wait_for_link():
+                raise AutomationPortalError("Not connected to Automation Portal")
         
         if retries is None:
             retries = config.MAX_RETRIES
         
-        for attempt in range(retries + 1):
+        if command_name(command) in MOVE_COMMANDS or command_name(command) == 'ResetSystem':
+            self.invalidate_status()
+            self._late_move_frames.pop(command_name(command), None)
+        priority = command_priority(command)
+        is_move = command_name(command) in MOVE_COMMANDS
+        
+        delay = config.RETRY_BACKOFF_INITIAL
+        attempt = 0
+        reconnects = 0
+        bytes_sent = 0
+        while attempt <= retries:
+            sent_at = time.monotonic()
             try:
-                # Prepare command with terminator
-                command_str = command + config.COMMAND_TERMINATOR
-                
-                if self.comm_mode == config.COMM_MODE_SERIAL:
-                    # Serial communication - read multiple lines to get full response
-                    self.connection.write(command_str.encode('utf-8'))
-                    
-                    # Read the full response (may be multiple lines)
-                    response_lines = []
-                    start_time = time.time()
-                    while time.time() - start_time < self.timeout:
-                        if self.connection.in_waiting > 0:
-                            line = self.connection.readline().decode('utf-8').strip()
-                            if line:
-                                response_lines.append(line)
-                                # Check if we have a complete response
-                                if any('Completed(' in line or 'Error(' in line for line in response_lines):
-                                    break
-                        else:
-                            time.sleep(0.01)  # Small delay to prevent busy waiting
-                    
-                    response = '\n'.join(response_lines)
-                    
-                elif self.comm_mode == config.COMM_MODE_TCP:
-                    # TCP communication
-                    self.connection.send(command_str.encode('utf-8'))
-                    response = self.connection.recv(config.DATA_BUFFER_SIZE).decode('utf-8').strip()
-                    
+                if self.pipeline is not None:
+                    if is_move:
+                        self._move_sent(command)
+                    entry = self._pipelined_exchange(command)
+                    bytes_sent += entry.bytes_sent
+                    if entry.error is not None:
+                        raise entry.error
+                    response = entry.response
                 else:
-                    raise AutomationPortalError(f"Invalid communication mode: {self.comm_mode}")
-                
-                self.logger.debug(f"Sent: {command} | Received: {response}")
-                return response
+                    with self._io_lock.hold(priority):
+                        if is_move:
+                            self._move_sent(command)
+                        data = encode_command(command)
+                        self.transport.write(data)
+                        bytes_sent += len(data)
+                        response = self._read_response(command)
                 
             except Exception as e:
+                if _is_link_error(e) and self.supervisor is not None and reconnects <= retries:
+                    self._report_link_failure(e)
+                    if self._wait_for_link():
+                        if is_move:
+                            # The move may already be running: never send it twice, let
+                            # _wait_for_move() follow it through GetStatus instead
+                            self.logger.warning(f"Link lost during {command}, resuming from status")
+                            return PortalResponse(command)
+                        # Resend on the restored link without using up a retry
+                        reconnects += 1
+                        continue
                 if attempt < retries:
                     self.logger.warning(f"Command failed (attempt {attempt + 1}), retrying: {e}")
-                    time.sleep(config.RETRY_DELAY)
-                else:
-                    raise AutomationPortalError(f"Communication error after {retries + 1} attempts: {e}")
+                    time.sleep(delay)
+                    delay = min(delay * 2, config.RETRY_DELAY)
+                    attempt += 1
+                    continue
+                if self.telemetry:
+                    self._record_span(command, None, sent_at, attempt + reconnects, bytes_sent)
+                raise AutomationPortalError(f"Communication error after {retries + 1} attempts: {e}")
+            
+            self.logger.debug("Sent: %s | Received: %s", command, response)
+            
+            # Transient errors are retried quickly, fatal ones are never retried
+            error = response.error_info
+            if error is not None:
+                if error.fatal:
+                    if self.telemetry:
+                        self._record_span(command, response, sent_at, attempt + reconnects, bytes_sent)
+                    raise PortalCommandError(error)
+                if error.transient and attempt < retries:
+                    self.logger.warning(f"{error} (attempt {attempt + 1}), retrying")
+                    time.sleep(delay)
+                    delay = min(delay * 2, config.RETRY_DELAY)
+                    attempt += 1
+                    continue
+            if response.terminal is not None:
+                self.last_exchange_at = time.monotonic()
+            if response.status is not None:
+                self._store_status(response.status, sent_at)
+            if self.telemetry:
+                self._record_span(command, response, sent_at, attempt + reconnects, bytes_sent)
+            return response
+        
+        return PortalResponse(command)
+    
+    def _move_sent(self, command: str) -> None:
+        """Anchor the move's start for move analytics and switch the status monitor to fast polls."""
+        self.move_analytics.move_sent(time.monotonic())
+        if self.status_monitor is not None and self.status_monitor.is_running:
+            self.status_monitor.move_sent(command, self.timing_policy.read_timeout(command, self.timeout))
+    
+    def _record_span(self, command: str, response: Optional[PortalResponse], sent_at: float, retries: int,
+                     bytes_sent: int) -> None:
+        """Emit the span of an exchange; a move's span is held until the move finishes."""
+        span = build_span(command, response, sent_at, retries, bytes_sent)
+        if span.outcome == OUTCOME_PENDING:
+            self._move_span = span
+        else:
+            self.telemetry.emit(span)
+    
+    def _read_response(self, command: str) -> PortalResponse:
+        """
+        Read response frames for a command.
         
-        return ""
+        Returns as soon as the Completed/Error frame for this command arrives or the
+        timeout expires. A move command returns after its acknowledgement when another
+        thread is waiting to query the portal; its completion is then picked up by
+        _wait_for_move(). Frames answering other commands (e.g. a late move
+        completion) are kept in the result but do not end the read; bytes after the
+        terminating frame stay buffered in the transport for the next command.
+        
+        Args:
+            command: Command string that was sent
+            
+        Returns:
+            PortalResponse with the frames received, in order
+        """
+        response = PortalResponse(command)
+        deadline = time.monotonic() + self.timing_policy.read_timeout(command, self.timeout)
+        is_move = command_name(command) in MOVE_COMMANDS
+        
+        while True:
+            remaining = deadline - time.monotonic()
+            yielding = is_move and response.acknowledged
+            if yielding:
+                # The move is running: hand the wire to waiting status reads
+                if self._io_lock.waiting(PRIORITY_QUERY):
+                    break
+                remaining = min(remaining, config.WIRE_YIELD_INTERVAL)
+            data = self.transport.read_frame(remaining)
+            if data is None:
+                if yielding and time.monotonic() < deadline:
+                    continue
+                break
+            if response.add(data):
+                break
+            frame = response.frames[-1]
+            if frame.is_terminal and frame.name in MOVE_COMMANDS:
+                # Completion of a move another thread is waiting on
+                self._late_move_frames[frame.name] = frame
+                self._late_move_frame_event.set()
+        
+        return response
     
-    def get_status(self) -> Dict[str, Any]:
+    def _pipelined_exchange(self, command: str) -> PendingCommand:
+        """
+        Send a command through the pipeline and wait for its response.
+        
+        Other commands wait for their Completed/Error frame. Move commands only wait
+        for their acknowledgement and stay registered in the pipeline, so that
+        _wait_for_move() can wait on their completion frame.
+        
+        Args:
+            command: Command string to send (untagged)
+            
+        Returns:
+            PendingCommand whose response holds the frames received for this
+            command's sequence number; error is set if the pipeline failed
+        """
+        read_timeout = self.timing_policy.read_timeout(command, self.timeout)
+        # A move may have to wait for the previous move to release its slot
+        slot_timeout = self.timing_policy.timeout(command) if command_name(command) in MOVE_COMMANDS else read_timeout
+        entry = self.pipeline.submit(command, slot_timeout)
+        
+        if entry.is_move:
+            entry.acknowledged.wait(read_timeout)
+        elif not entry.wait(read_timeout):
+            self.pipeline.discard(entry)
+        return entry
+    
+    def get_status(self, max_age: float = None) -> Dict[str, Any]:
         """
         Get the current status of the Automation Portal.
         
+        A snapshot younger than max_age (default status_cache_ttl) is returned
+        without a GetStatus round trip; movement commands invalidate it.
+        
+        Args:
+            max_age: Maximum age in seconds of a cached snapshot to accept (0 forces a poll)
+        
         Returns:
             Dictionary containing status information including:
             - success: True if command succeeded
@@ -209,68 +593,10 @@ class AutomationPortalDriver:
             - mac_address: Hardware MAC address
         """
         try:
-            response = self._send_command("GetStatus")
-            self.logger.debug(f"GetStatus raw response: {response}")
-            
-            # Parse the response - from the debug output we can see the format:
-            # GetStatus\r\n\tReceived(26,GetStatus)\r\n\tCompleted(26,GetStatus,OPERATIONAL,Insert(1),Idle,NoDrawerNoTray,DoorClosed,FeederFullyRetracted,172:16:0:4,00:00:C4:06:01:67)\r\n
-            
-            # Parse the response - looking for the Completed line
-            # Format: Completed(43,GetStatus,OPERATIONAL,Insert(1),Idle,NoDrawerNoTray,DoorClosed,FeederFullyRetracted,172:16:0:4,00:00:C4:06:01:67)
-            
-            if "Completed(" in response:
-                # Use regex to parse the response more reliably
-                import re
-                pattern = r'Completed\((\d+),GetStatus,([^,]+),([^,)]+(?:\([^)]*\))?),([^,]+),([^,]+),([^,]+),([^,]+),([^,]+),([^,)]+)\)'
-                match = re.search(pattern, response)
-                
-                if match:
-                    seq, system_state, mode, status, drawer_tray, door, feeder, ip, mac = match.groups()
-                    self.logger.debug(f"Regex parsed: seq={seq}, system={system_state}, mode={mode}, status={status}")
-                    return {
-                        'success': True,
-                        'sequence': int(seq) if seq.isdigit() else 0,
-                        'command': 'GetStatus',
-                        'system_state': system_state,      # OPERATIONAL
-                        'mode': mode,                      # Insert(1)
-                        'status': status,                  # Idle
-                        'drawer_tray_status': drawer_tray, # NoDrawerNoTray
-                        'door_status': door,               # DoorClosed
-                        'feeder_status': feeder,           # FeederFullyRetracted
-                        'ip_address': ip,                  # 172:16:0:4
-                        'mac_address': mac                 # 00:00:C4:06:01:67
-                    }
-                else:
-                    # Fallback: simple manual parsing
-                    self.logger.debug("Regex failed, trying manual parsing")
-                    completed_start = response.find("Completed(")
-                    if completed_start != -1:
-                        content_start = completed_start + 10
-                        content_end = response.find(")", content_start)
-                        if content_end != -1:
-                            content = response[content_start:content_end]
-                            # Try to extract key information manually
-                            if "OPERATIONAL" in content and "DoorClosed" in content:
-                                return {
-                                    'success': True,
-                                    'system_state': 'OPERATIONAL',
-                                    'mode': 'Insert(1)' if 'Insert(1)' in content else 'Unknown',
-                                    'status': 'Idle' if 'Idle' in content else 'Unknown',
-                                    'door_status': 'DoorClosed' if 'DoorClosed' in content else 'Unknown',
-                                    'drawer_tray_status': 'NoDrawerNoTray' if 'NoDrawerNoTray' in content else 'Unknown',
-                                    'feeder_status': 'FeederFullyRetracted' if 'FeederFullyRetracted' in content else 'Unknown',
-                                    'mac_address': content.split(',')[-1] if ',' in content else 'Unknown'
-                                }
-            
-            # If parsing failed, return error but still mark as success since we got a response
-            return {
-                'success': True,
-                'raw_response': response,
-                'system_state': 'Unknown',
-                'mode': 'Unknown', 
-                'status': 'Unknown',
-                'mac_address': 'Unknown'
-            }
+            snapshot = self.cached_status(max_age)
+            if snapshot is not None:
+                return snapshot.as_dict()
+            return status_dict(self._exchange("GetStatus"))
             
         except Exception as e:
             self.logger.error(f"Error getting status: {e}")
@@ -290,45 +616,20 @@ class AutomationPortalDriver:
         """
         try:
             # Send initialize command - try without sequence first
-            response = self._send_command("Initialize")
+            started = time.monotonic()
+            response = self._exchange("Initialize")
             
             # Check immediate response for errors
-            if "Error(" in response:
+            if response.error and self.pipeline is None:
                 # Try with sequence if simple command failed
                 seq = self._get_next_sequence()
-                response = self._send_command(f"Initialize({seq})")
-                
-                if "Error(" in response:
-                    self.logger.error(f"Initialize command failed: {response}")
-                    return False
-            
-            # Wait for completion and check final status
-            max_wait_time = 30  # seconds
-            start_time = time.time()
+                response = self._exchange(f"Initialize({seq})")
             
-            while time.time() - start_time < max_wait_time:
-                status_response = self._send_command("GetStatus")
-                
-                # Check if operation completed successfully
-                if "Completed(" in status_response and "Initialize" in status_response:
-                    self.logger.info("Initialization completed successfully")
-                    return True
-                
-                # Check for error in status
-                if "Error(" in status_response and "Initialize" in status_response:
-                    self.logger.error(f"Initialize operation failed: {status_response}")
-                    return False
-                
-                # Check if system is already operational (might not need initialization)
-                if "OPERATIONAL" in status_response:
-                    self.logger.info("System already operational, initialization not needed")
-                    return True
-                
-                time.sleep(0.5)
+            if response.error:
+                self.logger.error(f"Initialize command failed: {response.error_info or response}")
+                return False
             
-            # Timeout - operation didn't complete
-            self.logger.error(f"Initialize operation timed out after {max_wait_time} seconds")
-            return False
+            return self._wait_for_move("Initialize", response, started)
             
         except Exception as e:
             self.logger.error(f"Error during initialization: {e}")
@@ -349,34 +650,17 @@ class AutomationPortalDriver:
         
         try:
             # Send extract command - format appears to be Extract(tray_position) based on responses
-            response = self._send_command(f"Extract({tray_position})")
+            started = time.monotonic()
+            response = self._exchange(f"Extract({tray_position})")
             
             # Check the immediate response for success/error
-            if "Error(" in response:
-                self.logger.error(f"Extract command failed immediately: {response}")
+            if response.error:
+                self.logger.error(f"Extract command failed immediately: {response.error_info or response}")
                 return False
             
-            # Wait for completion and check final status
-            max_wait_time = 30  # seconds
-            start_time = time.time()
-            
-            while time.time() - start_time < max_wait_time:
-                status_response = self._send_command("GetStatus")
-                
-                # Check if operation completed successfully
-                if "Completed(" in status_response and "Extract" in status_response:
-                    self.logger.info(f"Drawer extracted successfully from position {tray_position}")
-                    return True
-                
-                # Check for error in status
-                if "Error(" in status_response and "Extract" in status_response:
-                    self.logger.error(f"Extract operation failed: {status_response}")
-                    return False
-                
-                time.sleep(0.5)
-            
-            # Timeout - operation didn't complete
-            self.logger.error(f"Extract operation timed out after {max_wait_time} seconds")
+            if self._wait_for_move("Extract", response, started):
+                self.logger.info(f"Drawer extracted successfully from position {tray_position}")
+                return True
             return False
             
         except Exception as e:
@@ -398,40 +682,111 @@ class AutomationPortalDriver:
         
         try:
             # Send insert command - format appears to be Insert(tray_position) based on responses
-            response = self._send_command(f"Insert({tray_position})")
+            started = time.monotonic()
+            response = self._exchange(f"Insert({tray_position})")
             
             # Check the immediate response for success/error
-            if "Error(" in response:
-                self.logger.error(f"Insert command failed immediately: {response}")
+            if response.error:
+                self.logger.error(f"Insert command failed immediately: {response.error_info or response}")
                 return False
             
-            # Wait for completion and check final status
-            max_wait_time = 30  # seconds
-            start_time = time.time()
-            
-            while time.time() - start_time < max_wait_time:
-                status_response = self._send_command("GetStatus")
-                
-                # Check if operation completed successfully
-                if "Completed(" in status_response and "Insert" in status_response:
-                    self.logger.info(f"Drawer inserted successfully to position {tray_position}")
-                    return True
-                
-                # Check for error in status
-                if "Error(" in status_response and "Insert" in status_response:
-                    self.logger.error(f"Insert operation failed: {status_response}")
-                    return False
-                
-                time.sleep(0.5)
-            
-            # Timeout - operation didn't complete
-            self.logger.error(f"Insert operation timed out after {max_wait_time} seconds")
+            if self._wait_for_move("Insert", response, started):
+                self.logger.info(f"Drawer inserted successfully to position {tray_position}")
+                return True
             return False
             
         except Exception as e:
             self.logger.error(f"Error inserting drawer: {e}")
             return False
     
+    def exchange_drawers(self, exchanges: List[Union[int, DrawerExchange]],
+                         handoff: HandoffCallback = None,
+                         stop_on_error: bool = True) -> Dict[str, Any]:
+        """
+        Run several plate exchanges (extract, hand-off, insert) as one sequence.
+        
+        The portal is validated with a single status read up front; the check that
+        each drawer reached the portal runs while the hand-off is in progress.
+        
+        Args:
+            exchanges: Tray positions (0 or 1) or DrawerExchange objects, in order
+            handoff: Called with the tray position while the drawer is out
+                (robot or operator plate swap); None to extract and re-insert directly
+            stop_on_error: Skip the remaining exchanges after a failure
+            
+        Returns:
+            Dictionary with success, completed/failed/skipped counts, elapsed_seconds,
+            plates_per_hour and per-exchange results
+        """
+        return run_exchanges(self, exchanges, handoff, stop_on_error)
+    
+    def _wait_for_move(self, command: str, response: PortalResponse, started: float) -> bool:
+        """
+        Wait until a move command completes, fails or times out.
+        
+        The timeout and poll schedule come from the timing policy, which also
+        learns from each successful completion. In pipelined mode waits for the
+        move's own Completed/Error frame; otherwise waits on the status monitor
+        when one is running, or polls GetStatus.
+        
+        Args:
+            command: Move command being waited on ('Initialize', 'Extract', 'Insert')
+            response: Response to the move command itself
+            started: time.monotonic() when the move command was sent
+            
+        Returns:
+            True if the command completed, False otherwise
+        """
+        max_wait_time = self.timing_policy.timeout(command)
+        deadline = started + max_wait_time
+        last_response = response
+        
+        # The move's own Completed frame may already have arrived with the acknowledgement
+        result = True if response.completed else None
+        
+        if result is None and self.pipeline is not None:
+            entry = self.pipeline.pending_for(response)
+            if entry is not None and not entry.wait(max(0.0, deadline - time.monotonic())):
+                self.pipeline.discard(entry)
+            if response.terminal is not None:
+                result = move_result(response, command)
+        
+        if result is None and self.status_monitor is not None and self.status_monitor.is_running:
+            result = self.status_monitor.wait_for_move(command, deadline - time.monotonic())
+            last_response = self.status_monitor.latest_response
+        
+        interval = None
+        while result is None and time.monotonic() < deadline:
+            interval = self.timing_policy.next_interval(command, time.monotonic() - started, interval)
+            # Sleep until the next poll, or until another thread reads the move's completion
+            self._late_move_frame_event.wait(min(interval, max(0.0, deadline - time.monotonic())))
+            self._late_move_frame_event.clear()
+            late = self._late_move_frames.pop(command_name(command), None)
+            if late is not None:
+                # Read by another thread's exchange while this one was sleeping
+                last_response = PortalResponse(command)
+                last_response.add_frame(late)
+            else:
+                last_response = self._exchange("GetStatus")
+            result = move_result(last_response, command)
+        
+        # Polls made during the move no longer describe the portal
+        self.invalidate_status()
+        if self.telemetry and self._move_span is not None:
+            self.telemetry.emit(complete_move_span(self._move_span, result, last_response, started))
+            self._move_span = None
+        if result is True:
+            self.timing_policy.record(command, time.monotonic() - started)
+            self.logger.info(f"{command} completed successfully")
+            return True
+        if result is False:
+            self.logger.error(f"{command} operation failed: {last_response}")
+            return False
+        
+        # Timeout - operation didn't complete
+        self.logger.error(f"{command} operation timed out after {max_wait_time} seconds")
+        return False
+    
     def report_version(self) -> str:
         """
         Get the system version information.
@@ -440,8 +795,7 @@ class AutomationPortalDriver:
             Version information string
         """
         try:
-            response = self._send_command("ReportVersion")
-            return response
+            return self._exchange("ReportVersion").text
         except Exception as e:
             self.logger.error(f"Error getting version: {e}")
             return f"Error: {e}"
@@ -454,8 +808,8 @@ class AutomationPortalDriver:
             True if reset successful, False otherwise
         """
         try:
-            response = self._send_command("ResetSystem")
-            success = "Completed" in response
+            response = self._exchange("ResetSystem")
+            success = response.completed
             if success:
                 self.logger.info("System reset completed")
             else:
@@ -465,45 +819,35 @@ class AutomationPortalDriver:
             self.logger.error(f"Error resetting system: {e}")
             return False
     
-    def is_drawer_present(self) -> Optional[bool]:
+    def is_drawer_present(self, max_age: float = None) -> Optional[bool]:
         """
         Check if a drawer is currently present.
         
+        Answers from the cached status snapshot when it is younger than max_age.
+        
         Returns:
             True if drawer present, False if not, None if status unknown
         """
         try:
-            status = self.get_status()
-            drawer_status = status.get('drawer_tray_status', '')
-            
-            if drawer_status in ['DrawerAndTray', 'DrawerOnly']:
-                return True
-            elif drawer_status == 'NoDrawerNoTray':
-                return False
-            else:
-                return None
+            status = self._current_status(max_age)
+            return status.drawer_present if status is not None else None
                 
         except Exception as e:
             self.logger.error(f"Error checking drawer presence: {e}")
             return None
     
-    def is_door_open(self) -> Optional[bool]:
+    def is_door_open(self, max_age: float = None) -> Optional[bool]:
         """
         Check if the door is currently open.
         
+        Answers from the cached status snapshot when it is younger than max_age.
+        
         Returns:
             True if door open, False if closed, None if status unknown
         """
         try:
-            status = self.get_status()
-            door_status = status.get('door_status', '')
-            
-            if door_status == 'DoorOpened':
-                return True
-            elif door_status == 'DoorClosed':
-                return False
-            else:
-                return None
+            status = self._current_status(max_age)
+            return status.door_open if status is not None else None
                 
         except Exception as e:
             self.logger.error(f"Error checking door status: {e}")
@@ -604,5 +948,6 @@ def example_context_manager():
 
 if __name__ == "__main__":
     # Run example
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     print("Waters Automation Portal Driver - Sample Transfer Example")
     example_sample_transfer()
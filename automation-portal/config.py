@@ -12,11 +12,24 @@ DEFAULT_TCP_HOST = '192.168.1.100'  # Default Waters instrument IP
 DEFAULT_TCP_PORT = 34567  # Common Waters automation port
 NETWORK_TIMEOUT = 10.0
 
+# Portal server (portal_server.py): Unix socket path or host:port shared by local clients
+PORTAL_SERVER_ADDRESS = '127.0.0.1:34568'
+# Status events queued per subscriber; a subscriber that falls this far behind is disconnected
+PORTAL_SERVER_EVENT_QUEUE = 256
+
 # Protocol settings
 COMMAND_TERMINATOR = '\r'  # Waters uses only CR (not CRLF)
 RESPONSE_TERMINATOR = '\r\n'
 MAX_RETRIES = 3
-RETRY_DELAY = 1.0  # seconds
+RETRY_DELAY = 1.0  # seconds (upper bound of the retry backoff)
+RETRY_BACKOFF_INITIAL = 0.05  # seconds, doubled on each retry up to RETRY_DELAY
+
+# Connection supervisor (AutomationPortalDriver.start_supervisor)
+HEARTBEAT_INTERVAL = 5.0  # seconds of idle link before a heartbeat GetStatus
+HEARTBEAT_MAX_MISSED = 2  # unanswered heartbeats before the link is declared dead
+RECONNECT_BACKOFF_INITIAL = 0.5  # seconds, doubled per failed reconnect attempt
+RECONNECT_BACKOFF_MAX = 30.0  # seconds
+RECONNECT_RESUME_TIMEOUT = 120.0  # seconds a command waits for the link to come back
 
 # System limits and defaults (Waters Acquity UPC typical ranges)
 MAX_FLOW_RATE = 4.0  # mL/min (UPC typical max)
@@ -51,12 +64,15 @@ MODULES = {
 # Communication modes
 COMM_MODE_SERIAL = 'serial'
 COMM_MODE_TCP = 'tcp'
+COMM_MODE_REPLAY = 'replay'     # answer from a portal_recorder.py recording (port is its path)
 DEFAULT_COMM_MODE = COMM_MODE_SERIAL
 
 # Command timeout settings
 COMMAND_TIMEOUT = 10.0  # seconds
 DATA_TIMEOUT = 30.0  # seconds
 STATUS_TIMEOUT = 5.0  # seconds
+STATUS_CACHE_TTL = 1.0  # seconds a GetStatus snapshot is reused; 0 disables the cache
+WIRE_YIELD_INTERVAL = 0.05  # seconds between checks for waiting status reads while a move holds the wire
 
 # Data collection settings
 DEFAULT_SAMPLING_RATE = 10  # Hz
@@ -125,6 +141,10 @@ PORTAL_ERROR_CODES = {
     30: "Timeout on PC command"
 }
 
+# Portal error classification (codes from PORTAL_ERROR_CODES)
+PORTAL_TRANSIENT_ERROR_CODES = [6, 7, 30]  # Communication problem, busy, timeout - retried with backoff
+PORTAL_FATAL_ERROR_CODES = [9, 29]  # Both door sensors active, SM at incorrect angle - never retried
+
 # Portal System Modes
 PORTAL_SYSTEM_MODES = {
     'UNINIT': 'System powered-on or reset',
@@ -178,6 +198,23 @@ PORTAL_MOVE_STATES = {
     'FW_UPGRADE-Idle': 'Firmware upgrade mode idle'
 }
 
+# Move phases whose mechanical failure raises a specific error code (from PORTAL_ERROR_CODES)
+PORTAL_PHASE_ERROR_CODES = {
+    'DoorOpening': 10,
+    'DoorClosing': 11,
+    'FeederCalibrating': 12,
+    'FeederExpanding': 13,
+    'FeederRetracting': 14,
+}
+
+# Move phase analytics (portal_move_analytics.py)
+MOVE_ANALYTICS_WINDOW = 100      # phase durations kept per move and phase
+MOVE_ANALYTICS_BASELINE = 20     # first durations of a phase that form its reference
+MOVE_ANALYTICS_RECENT = 10       # latest durations compared with the reference
+MOVE_ANALYTICS_TOLERANCE = 0.25  # recent median this much above the reference is flagged as degraded
+MOVE_ANALYTICS_MAX_GAP = 1.0     # seconds; phase boundaries bracketed by wider poll gaps are not timed
+                                 # (above the monitor's 0.5 s moving interval plus a slow round trip)
+
 # Portal Communication Settings
 PORTAL_COMM_SETTINGS = {
     'SERIAL_PORT': 'COM4',  # Default RS232 port
@@ -0,0 +1,641 @@
+#!/usr/bin/env python3
+"""
+Waters Automation Portal - Driver benchmarks
+
+Micro-benchmarks for the protocol parser, and end-to-end driver benchmarks run
+against the local portal simulator over a pty (serial driver) and TCP. No
+hardware is required.
+
+    parser      frames parsed per second
+    alloc       memory allocated per status poll, receive path vs. the original
+                readline/decode/strip/join path
+    latency     get_status round-trip p50/p99
+    throughput  sustained commands per second (sequential and pipelined)
+    server      get_status latency through portal_server.py vs. the driver directly
+    cycle       extract_drawer -> insert_drawer cycle time per poll strategy
+    suite       all of the above across transports and poll strategies
+
+Results can be written as JSON and compared against a baseline file; the
+command exits with status 1 when a metric regresses beyond the tolerance.
+
+Usage:
+    python portal_benchmark.py parser --iterations 200000
+    python portal_benchmark.py alloc --iterations 5000
+    python portal_benchmark.py suite --output results.json
+    python portal_benchmark.py suite --baseline results.json --tolerance 0.25
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import re
+import socket
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+import config
+from automation_portal_driver import AutomationPortalDriver
+from portal_server import PortalServer, PortalClient
+from portal_protocol import FrameDecoder, PortalResponse, PortalStatus, parse_frame, status_dict, encode_command
+from portal_simulator import (PortalSimulator, TcpSimulatorServer, PtySimulatorServer,
+                              EXTRACT_PHASES, INSERT_PHASES)
+from portal_timing import CommandTimingPolicy
+
+TRANSPORTS = ('tcp', 'pty')
+
+# How move completion is detected while extract/insert run
+POLL_STRATEGIES = ('adaptive', 'fixed', 'monitor', 'pipelined')
+
+# Metric compared against a baseline per benchmark, and whether higher is better
+PRIMARY_METRICS = {
+    'parser': ('frames_per_second', True),
+    'alloc': ('peak_bytes_per_poll', False),
+    'latency': ('p50_ms', False),
+    'throughput': ('commands_per_second', True),
+    'server': ('overhead_us', False),
+    'cycle': ('mean_cycle_seconds', False),
+}
+
+# A GetStatus exchange as captured from the portal
+SAMPLE_EXCHANGE = (
+    b"GetStatus\r\n"
+    b"\tReceived(26,GetStatus)\r\n"
+    b"\tCompleted(26,GetStatus,OPERATIONAL,Insert(1),Idle,NoDrawerNoTray,DoorClosed,"
+    b"FeederFullyRetracted,172:16:0:4,00:00:C4:06:01:67)\r\n"
+)
+
+SAMPLE_FRAMES = [
+    b"Received(26,GetStatus)",
+    b"Completed(26,GetStatus,OPERATIONAL,Insert(1),Idle,NoDrawerNoTray,DoorClosed,"
+    b"FeederFullyRetracted,172:16:0:4,00:00:C4:06:01:67)",
+    b"Received(27,Extract(1))",
+    b"Error(27,Extract(1),28)",
+]
+
+# GetStatus pattern of the original string-based driver, kept for the parser and alloc comparisons
+_LEGACY_STATUS_PATTERN = re.compile(
+    r'Completed\((\d+),GetStatus,([^,]+),([^,)]+(?:\([^)]*\))?),([^,]+),([^,]+),([^,]+),([^,]+),([^,]+),([^,)]+)\)')
+
+
+def _rate(count: int, elapsed: float) -> float:
+    return count / elapsed if elapsed > 0 else float('inf')
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    """Nearest-rank percentile of samples (q in 0..1)."""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(q * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+class SimulatedPortal:
+    """
+    A PortalSimulator served over TCP and (where available) a pty, with
+    factories for connected drivers on either transport.
+    """
+
+    def __init__(self, time_scale: float = 0.05, latency: float = 0.0, jitter: float = 0.0,
+                 seed: Optional[int] = 1):
+        self.simulator = PortalSimulator(time_scale=time_scale, latency=latency, jitter=jitter, seed=seed)
+        self.tcp_server = TcpSimulatorServer(self.simulator)
+        try:
+            self.pty_server = PtySimulatorServer(self.simulator)
+        except (ImportError, OSError):
+            self.pty_server = None
+
+    def available(self, transport: str) -> bool:
+        return transport == 'tcp' or self.pty_server is not None
+
+    def driver(self, transport: str, **kwargs) -> AutomationPortalDriver:
+        """Create and connect a driver on the given transport."""
+        if transport == 'tcp':
+            driver = AutomationPortalDriver(comm_mode=config.COMM_MODE_TCP, host=self.tcp_server.host,
+                                            tcp_port=self.tcp_server.port, **kwargs)
+        else:
+            driver = AutomationPortalDriver(port=self.pty_server.port_name, **kwargs)
+        if not driver.connect():
+            raise RuntimeError(f"Could not connect to the simulator over {transport}")
+        return driver
+
+    def close(self) -> None:
+        self.simulator.stop()
+        self.tcp_server.close()
+        if self.pty_server is not None:
+            self.pty_server.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def benchmark_parser(iterations: int = 100000) -> Dict[str, Any]:
+    """
+    Measure parser throughput.
+
+    The typed GetStatus parse (frame, status record, dictionary) is compared
+    with the precompiled regex search the original get_status() ran on the
+    response text.
+
+    Args:
+        iterations: Number of passes over the sample frames / exchange
+
+    Returns:
+        Dictionary of frames (or exchanges) processed per second
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for text in SAMPLE_FRAMES:
+            parse_frame(text).command
+    tokenize = _rate(iterations * len(SAMPLE_FRAMES), time.perf_counter() - start)
+
+    status_frame = SAMPLE_FRAMES[1]
+    start = time.perf_counter()
+    for _ in range(iterations):
+        PortalStatus.from_frame(parse_frame(status_frame)).as_dict()
+    status_parses = _rate(iterations, time.perf_counter() - start)
+
+    status_text = status_frame.decode('utf-8')
+    start = time.perf_counter()
+    for _ in range(iterations):
+        _legacy_status_dict(status_text)
+    legacy_status_parses = _rate(iterations, time.perf_counter() - start)
+
+    decoder = FrameDecoder()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        decoder.feed(SAMPLE_EXCHANGE)
+        response = PortalResponse("GetStatus")
+        frame = decoder.next_frame()
+        while frame is not None:
+            response.add(frame)
+            frame = decoder.next_frame()
+        status_dict(response)
+    exchanges = _rate(iterations, time.perf_counter() - start)
+
+    return {
+        'benchmark': 'parser',
+        'iterations': iterations,
+        'frames_per_second': round(tokenize),
+        'status_exchanges_per_second': round(exchanges),
+        'decoded_frames_per_second': round(exchanges * 3),
+        'status_parses_per_second': round(status_parses),
+        'legacy_status_parses_per_second': round(legacy_status_parses),
+    }
+
+
+def _status_poll(decoder: FrameDecoder) -> Dict[str, Any]:
+    # One poll on the current receive path: encode, receive into the decoder, parse
+    encode_command("GetStatus")
+    decoder.feed(SAMPLE_EXCHANGE)
+    response = PortalResponse("GetStatus")
+    frame = decoder.next_frame()
+    while frame is not None and not response.add(frame):
+        frame = decoder.next_frame()
+    return status_dict(response)
+
+
+def _legacy_status_poll(stream: io.BytesIO) -> Dict[str, Any]:
+    # One poll as the original driver did it: per-line readline/decode/strip, join, regex
+    ("GetStatus" + config.COMMAND_TERMINATOR).encode('utf-8')
+    stream.seek(0)
+    response_lines = []
+    line = stream.readline()
+    while line:
+        line = line.decode('utf-8').strip()
+        if line:
+            response_lines.append(line)
+        line = stream.readline()
+    return _legacy_status_dict('\n'.join(response_lines))
+
+
+def _legacy_status_dict(response: str) -> Dict[str, Any]:
+    # get_status() of the original driver: one regex search over the response text
+    seq, system_state, mode, status, drawer_tray, door, feeder, ip, mac = \
+        _LEGACY_STATUS_PATTERN.search(response).groups()
+    return {
+        'success': True, 'sequence': int(seq), 'command': 'GetStatus', 'system_state': system_state,
+        'mode': mode, 'status': status, 'drawer_tray_status': drawer_tray, 'door_status': door,
+        'feeder_status': feeder, 'ip_address': ip, 'mac_address': mac,
+    }
+
+
+def _measure_allocations(poll, iterations: int) -> Dict[str, float]:
+    poll()   # warm caches so steady-state polls are measured
+    peak_total = 0
+    tracemalloc.start()
+    try:
+        retained_before = tracemalloc.get_traced_memory()[0]
+        for _ in range(iterations):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            poll()
+            peak_total += tracemalloc.get_traced_memory()[1] - before
+        retained = tracemalloc.get_traced_memory()[0] - retained_before
+    finally:
+        tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        poll()
+    elapsed = time.perf_counter() - start
+    return {
+        'peak_bytes': peak_total / iterations,
+        'retained_bytes': retained,
+        'polls_per_second': _rate(iterations, elapsed),
+    }
+
+
+def benchmark_allocations(iterations: int = 5000) -> Dict[str, Any]:
+    """
+    Measure memory allocated per status poll.
+
+    A poll is one GetStatus exchange from encoding the command to the status
+    dictionary, without I/O. The current receive path is compared with the
+    original readline/decode/strip/join and regex path, both traced with
+    tracemalloc.
+
+    Args:
+        iterations: Number of measured polls
+
+    Returns:
+        Dictionary with the transient peak bytes allocated per poll, bytes
+        retained after all polls, and polls per second (untraced) for both paths
+    """
+    decoder = FrameDecoder()
+    current = _measure_allocations(lambda: _status_poll(decoder), iterations)
+    stream = io.BytesIO(SAMPLE_EXCHANGE)
+    legacy = _measure_allocations(lambda: _legacy_status_poll(stream), iterations)
+    return {
+        'benchmark': 'alloc',
+        'iterations': iterations,
+        'peak_bytes_per_poll': round(current['peak_bytes']),
+        'legacy_peak_bytes_per_poll': round(legacy['peak_bytes']),
+        'retained_bytes': current['retained_bytes'],
+        'polls_per_second': round(current['polls_per_second']),
+        'legacy_polls_per_second': round(legacy['polls_per_second']),
+    }
+
+
+def benchmark_latency(portal: SimulatedPortal, transport: str, count: int = 500,
+                      pipelined: bool = False) -> Dict[str, Any]:
+    """
+    Measure get_status round-trip latency.
+
+    The status cache is disabled so every call goes to the wire.
+
+    Args:
+        portal: Simulated portal
+        transport: 'tcp' or 'pty'
+        count: Number of measured calls (after 10 warm-up calls)
+        pipelined: Use the driver's pipelined mode
+
+    Returns:
+        Dictionary with p50/p99/mean/max latency in milliseconds
+    """
+    driver = portal.driver(transport, status_cache_ttl=0, pipelined=pipelined)
+    try:
+        for _ in range(10):
+            driver.get_status()
+        samples = []
+        for _ in range(count):
+            start = time.perf_counter()
+            driver.get_status()
+            samples.append(time.perf_counter() - start)
+    finally:
+        driver.disconnect()
+
+    return {
+        'benchmark': 'latency',
+        'transport': transport,
+        'pipelined': pipelined,
+        'count': count,
+        'p50_ms': round(_percentile(samples, 0.50) * 1000, 3),
+        'p99_ms': round(_percentile(samples, 0.99) * 1000, 3),
+        'mean_ms': round(sum(samples) / len(samples) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3),
+    }
+
+
+def _latency_samples(call, count: int) -> List[float]:
+    for _ in range(10):
+        call()
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def benchmark_server(portal: SimulatedPortal, transport: str, count: int = 500) -> Dict[str, Any]:
+    """
+    Measure the latency a PortalServer adds to get_status.
+
+    The same driver is timed directly and through a PortalClient on a local
+    Unix socket (TCP loopback where Unix sockets are unavailable).
+
+    Args:
+        portal: Simulated portal
+        transport: 'tcp' or 'pty' between the driver and the simulator
+        count: Number of measured calls per path
+
+    Returns:
+        Dictionary with direct and served p50 latency in microseconds, the
+        served p50 of a cached status, and the overhead of serving
+    """
+    driver = portal.driver(transport, status_cache_ttl=0)
+    if hasattr(socket, 'AF_UNIX'):
+        address = os.path.join(tempfile.mkdtemp(prefix='portal-bench-'), 'portal.sock')
+    else:
+        address = '127.0.0.1:0'
+    server = PortalServer(driver, address)
+    server.start()
+    try:
+        direct = _latency_samples(lambda: driver.get_status(max_age=0), count)
+        with PortalClient(server.address) as client:
+            served = _latency_samples(lambda: client.get_status(max_age=0), count)
+            driver.status_cache_ttl = 60.0
+            cached = _latency_samples(client.get_status, count)
+    finally:
+        server.close()
+
+    direct_p50 = _percentile(direct, 0.50) * 1e6
+    served_p50 = _percentile(served, 0.50) * 1e6
+    return {
+        'benchmark': 'server',
+        'transport': transport,
+        'count': count,
+        'direct_p50_us': round(direct_p50, 1),
+        'served_p50_us': round(served_p50, 1),
+        'served_cached_p50_us': round(_percentile(cached, 0.50) * 1e6, 1),
+        'overhead_us': round(served_p50 - direct_p50, 1),
+    }
+
+
+def benchmark_throughput(portal: SimulatedPortal, transport: str, duration: float = 2.0,
+                         clients: int = 1, pipelined: bool = False) -> Dict[str, Any]:
+    """
+    Measure sustained GetStatus commands per second.
+
+    Args:
+        portal: Simulated portal
+        transport: 'tcp' or 'pty'
+        duration: Measurement time in seconds
+        clients: Number of threads issuing commands on the one driver
+        pipelined: Use the driver's pipelined mode (lets clients overlap on the wire)
+
+    Returns:
+        Dictionary with commands per second and failure count
+    """
+    driver = portal.driver(transport, status_cache_ttl=0, pipelined=pipelined)
+    counts = [0] * clients
+    failures = [0] * clients
+    deadline = time.monotonic() + duration
+
+    def client(index: int) -> None:
+        while time.monotonic() < deadline:
+            # A timed-out read still reports success, with the state fields 'Unknown'
+            if driver.get_status().get('system_state', 'Unknown') != 'Unknown':
+                counts[index] += 1
+            else:
+                failures[index] += 1
+
+    start = time.perf_counter()
+    try:
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        driver.disconnect()
+
+    return {
+        'benchmark': 'throughput',
+        'transport': transport,
+        'pipelined': pipelined,
+        'clients': clients,
+        'duration': round(elapsed, 3),
+        'commands': sum(counts),
+        'failures': sum(failures),
+        'commands_per_second': round(_rate(sum(counts), elapsed), 1),
+    }
+
+
+def _strategy_driver(portal: SimulatedPortal, transport: str, strategy: str) -> AutomationPortalDriver:
+    """
+    Create a driver for a poll strategy with all timings scaled like the simulator's moves.
+
+    The read window is scaled too, so (as on hardware) a move outlasts its
+    acknowledgement read and completion is detected by the strategy under test.
+    """
+    scale = portal.simulator.time_scale
+    timeout = config.DEFAULT_TIMEOUT * scale
+    if strategy == 'fixed':
+        # The driver's original behaviour: a GetStatus every 0.5 s
+        policy = CommandTimingPolicy(initial_interval=0.5 * scale, max_interval=0.5 * scale, growth=1.0)
+    else:
+        policy = CommandTimingPolicy(initial_interval=0.1 * scale, max_interval=2.0 * scale)
+    driver = portal.driver(transport, timeout=timeout, timing_policy=policy, pipelined=strategy == 'pipelined')
+    if strategy == 'monitor':
+        driver.start_status_monitor(idle_interval=2.0 * scale, moving_interval=0.5 * scale)
+    return driver
+
+
+def benchmark_cycle(portal: SimulatedPortal, transport: str, strategy: str = 'adaptive',
+                    cycles: int = 3) -> Dict[str, Any]:
+    """
+    Measure extract_drawer -> insert_drawer cycle time.
+
+    One unmeasured warm-up cycle runs first, so the adaptive policy has history.
+
+    Args:
+        portal: Simulated portal
+        transport: 'tcp' or 'pty'
+        strategy: Move completion strategy from POLL_STRATEGIES
+        cycles: Number of measured cycles
+
+    Returns:
+        Dictionary with cycle times, the simulator's ideal cycle time and
+        wire commands per cycle
+    """
+    simulator = portal.simulator
+    driver = _strategy_driver(portal, transport, strategy)
+    times = []
+    failures = 0
+    try:
+        if simulator.system_mode != 'OPERATIONAL' and not driver.initialize():
+            raise RuntimeError("Simulator did not initialize")
+        driver.extract_drawer(0)
+        driver.insert_drawer(0)
+
+        commands_before = simulator.command_count
+        for _ in range(cycles):
+            start = time.perf_counter()
+            ok = driver.extract_drawer(0) and driver.insert_drawer(0)
+            times.append(time.perf_counter() - start)
+            failures += 0 if ok else 1
+        commands = simulator.command_count - commands_before
+    finally:
+        driver.disconnect()
+
+    ideal = sum(phase[3] for phase in EXTRACT_PHASES + INSERT_PHASES) * simulator.time_scale
+    mean = sum(times) / len(times)
+    return {
+        'benchmark': 'cycle',
+        'transport': transport,
+        'strategy': strategy,
+        'cycles': cycles,
+        'failures': failures,
+        'ideal_cycle_seconds': round(ideal, 4),
+        'mean_cycle_seconds': round(mean, 4),
+        'min_cycle_seconds': round(min(times), 4),
+        'max_cycle_seconds': round(max(times), 4),
+        'overhead_seconds': round(mean - ideal, 4),
+        'commands_per_cycle': round(commands / cycles, 1),
+    }
+
+
+def run_suite(transports=TRANSPORTS, strategies=POLL_STRATEGIES, count: int = 500, duration: float = 2.0,
+              cycles: int = 3, time_scale: float = 0.05, latency: float = 0.0,
+              iterations: int = 100000) -> List[Dict[str, Any]]:
+    """
+    Run every benchmark across transports and poll strategies.
+
+    Each transport gets a fresh simulator so results do not depend on order.
+
+    Returns:
+        List of result dictionaries; unavailable transports are reported as skipped
+    """
+    results = [benchmark_parser(iterations), benchmark_allocations(max(1, iterations // 20))]
+    for transport in transports:
+        with SimulatedPortal(time_scale=time_scale, latency=latency) as portal:
+            if not portal.available(transport):
+                results.append({'benchmark': 'suite', 'transport': transport, 'skipped': 'not available'})
+                continue
+            for pipelined in (False, True):
+                results.append(benchmark_latency(portal, transport, count, pipelined))
+            results.append(benchmark_server(portal, transport, count))
+            results.append(benchmark_throughput(portal, transport, duration))
+            results.append(benchmark_throughput(portal, transport, duration, clients=4, pipelined=True))
+            for strategy in strategies:
+                results.append(benchmark_cycle(portal, transport, strategy, cycles))
+    return results
+
+
+def _result_key(result: Dict[str, Any]) -> tuple:
+    return tuple(str(result.get(field)) for field in ('benchmark', 'transport', 'strategy', 'pipelined', 'clients'))
+
+
+def compare_results(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]],
+                    tolerance: float = 0.2) -> List[str]:
+    """
+    Compare results with a baseline run.
+
+    Args:
+        results: Current results
+        baseline: Results from an earlier run (same benchmarks)
+        tolerance: Allowed relative change in the wrong direction, e.g. 0.2 for 20%
+
+    Returns:
+        Descriptions of the metrics that regressed
+    """
+    previous = {_result_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        metric, higher_is_better = PRIMARY_METRICS.get(result.get('benchmark'), (None, True))
+        old = previous.get(_result_key(result), {}).get(metric)
+        new = result.get(metric)
+        if metric is None or not old or new is None:
+            continue
+        change = (new - old) / old
+        if (change < -tolerance) if higher_is_better else (change > tolerance):
+            label = ' '.join(part for part in _result_key(result) if part != 'None')
+            regressions.append(f"{label}: {metric} {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Automation Portal driver benchmarks")
+    parser.add_argument('benchmark', choices=['parser', 'alloc', 'latency', 'server', 'throughput', 'cycle', 'suite'],
+                        help="Benchmark to run")
+    parser.add_argument('--iterations', type=int, default=100000, help="Parser iterations per measurement")
+    parser.add_argument('--transport', choices=TRANSPORTS + ('all',), default='all', help="Simulator transport")
+    parser.add_argument('--strategy', choices=POLL_STRATEGIES + ('all',), default='all',
+                        help="Move completion strategy for the cycle benchmark")
+    parser.add_argument('--count', type=int, default=500, help="get_status calls for the latency benchmark")
+    parser.add_argument('--duration', type=float, default=2.0, help="Seconds per throughput measurement")
+    parser.add_argument('--cycles', type=int, default=3, help="Measured extract/insert cycles")
+    parser.add_argument('--time-scale', type=float, default=0.05, help="Simulator move duration multiplier")
+    parser.add_argument('--latency', type=float, default=0.0, help="Simulator response latency in seconds")
+    parser.add_argument('--output', help="Write results to this JSON file")
+    parser.add_argument('--baseline', help="Compare with results from this JSON file")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed regression vs. baseline (fraction)")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format=config.LOG_FORMAT)
+    transports = TRANSPORTS if args.transport == 'all' else (args.transport,)
+    strategies = POLL_STRATEGIES if args.strategy == 'all' else (args.strategy,)
+
+    if args.benchmark == 'parser':
+        results = [benchmark_parser(args.iterations)]
+    elif args.benchmark == 'alloc':
+        results = [benchmark_allocations(args.iterations)]
+    elif args.benchmark == 'suite':
+        results = run_suite(transports, strategies, args.count, args.duration, args.cycles,
+                            args.time_scale, args.latency, args.iterations)
+    else:
+        results = []
+        for transport in transports:
+            with SimulatedPortal(time_scale=args.time_scale, latency=args.latency) as portal:
+                if not portal.available(transport):
+                    continue
+                if args.benchmark == 'latency':
+                    results.append(benchmark_latency(portal, transport, args.count))
+                elif args.benchmark == 'server':
+                    results.append(benchmark_server(portal, transport, args.count))
+                elif args.benchmark == 'throughput':
+                    results.append(benchmark_throughput(portal, transport, args.duration))
+                else:
+                    results.extend(benchmark_cycle(portal, transport, strategy, args.cycles)
+                                   for strategy in strategies)
+
+    if args.output:
+        report = {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print(', '.join(f"{key}: {value}" for key, value in result.items()))
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline.get('results', baseline), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
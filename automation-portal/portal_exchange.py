@@ -0,0 +1,182 @@
+"""
+Waters Automation Portal - Batch drawer exchange
+
+Runs a list of plate exchanges (Extract(n) -> hand-off -> Insert(n)) across
+tray positions 0 and 1 as one sequence. The portal state is validated once with
+a single GetStatus before the batch starts; after that each step's own
+Completed frame (or move wait) is trusted instead of re-reading the status
+around every move. The status read that confirms the drawer reached the portal
+runs in the background while the robot or operator hand-off is in progress, so
+it adds no time to the exchange.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Callable, Iterable, Union
+
+# Called with the tray position while the drawer is out; swap the plate, then return
+HandoffCallback = Callable[[int], None]
+
+# Exchange stages, in order
+STAGE_PENDING = 'pending'
+STAGE_EXTRACT = 'extract'
+STAGE_HANDOFF = 'handoff'
+STAGE_CONFIRM = 'confirm'
+STAGE_INSERT = 'insert'
+STAGE_DONE = 'done'
+STAGE_SKIPPED = 'skipped'
+
+
+class DrawerExchange:
+    """One plate exchange at a tray position."""
+
+    __slots__ = ('tray_position', 'handoff', 'label', 'stage', 'success', 'error', 'timings')
+
+    def __init__(self, tray_position: int, handoff: Optional[HandoffCallback] = None, label: str = None):
+        """
+        Args:
+            tray_position: Sample manager tray position (0 or 1)
+            handoff: Plate swap for this exchange (default: the batch's handoff)
+            label: Name reported in results, e.g. a plate barcode
+        """
+        self.tray_position = tray_position
+        self.handoff = handoff
+        self.label = label or f"tray-{tray_position}"
+        self.stage = STAGE_PENDING
+        self.success = False
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'label': self.label,
+            'tray_position': self.tray_position,
+            'success': self.success,
+            'stage': self.stage,
+            'error': self.error,
+            'timings': {name: round(seconds, 3) for name, seconds in self.timings.items()},
+        }
+
+
+def validate_batch(status, exchanges: List[DrawerExchange]) -> Optional[str]:
+    """
+    Check that a batch can start from the given portal status.
+
+    Args:
+        status: PortalStatus from one GetStatus read, or None if it failed
+        exchanges: Exchanges to run
+
+    Returns:
+        Reason the batch cannot run, or None if it can
+    """
+    for exchange in exchanges:
+        if exchange.tray_position not in (0, 1):
+            return f"{exchange.label}: tray position must be 0 or 1"
+    if status is None:
+        return "Portal status unavailable"
+    if status.system_state != 'OPERATIONAL':
+        return f"Portal not operational ({status.system_state}), initialize first"
+    if not status.is_idle:
+        return f"Portal busy ({status.mode}, {status.status})"
+    if status.drawer_present:
+        return "A drawer is still in the portal; insert it before starting a batch"
+    return None
+
+
+def run_exchanges(driver, exchanges: Iterable[Union[int, DrawerExchange]],
+                  handoff: Optional[HandoffCallback] = None,
+                  stop_on_error: bool = True) -> Dict[str, Any]:
+    """
+    Run plate exchanges as one sequence.
+
+    Args:
+        driver: Connected AutomationPortalDriver
+        exchanges: Tray positions or DrawerExchange objects, in order
+        handoff: Default plate swap, called with the tray position once the drawer is out
+        stop_on_error: Skip the remaining exchanges after a failure
+
+    Returns:
+        Dictionary with success, counts, elapsed time, plates per hour and
+        per-exchange results (stage reached, error, timings)
+    """
+    logger = logging.getLogger(__name__)
+    exchanges = [e if isinstance(e, DrawerExchange) else DrawerExchange(e) for e in exchanges]
+    started = time.monotonic()
+
+    # One status read validates the whole batch
+    try:
+        status = driver._current_status(max_age=0)
+    except Exception as e:
+        logger.error(f"Batch validation failed: {e}")
+        status = None
+    problem = validate_batch(status, exchanges)
+
+    failed = problem is not None
+    if failed:
+        logger.error(f"Drawer exchange batch rejected: {problem}")
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="portal-exchange") as confirmer:
+        for exchange in exchanges:
+            if failed and (stop_on_error or problem is not None):
+                exchange.stage = STAGE_SKIPPED
+                exchange.error = problem or "Skipped after an earlier failure"
+                continue
+            _run_one(driver, exchange, exchange.handoff or handoff, confirmer, logger)
+            failed = failed or not exchange.success
+
+    elapsed = time.monotonic() - started
+    completed = sum(1 for e in exchanges if e.success)
+    return {
+        'success': completed == len(exchanges),
+        'completed': completed,
+        'failed': sum(1 for e in exchanges if not e.success and e.stage != STAGE_SKIPPED),
+        'skipped': sum(1 for e in exchanges if e.stage == STAGE_SKIPPED),
+        'elapsed_seconds': round(elapsed, 3),
+        'plates_per_hour': round(completed * 3600 / elapsed, 1) if elapsed > 0 and completed else 0.0,
+        'exchanges': [e.as_dict() for e in exchanges],
+    }
+
+
+def _timed(exchange: DrawerExchange, stage: str, func: Callable, *args):
+    exchange.stage = stage
+    start = time.monotonic()
+    try:
+        return func(*args)
+    finally:
+        exchange.timings[stage] = time.monotonic() - start
+
+
+def _run_one(driver, exchange: DrawerExchange, handoff: Optional[HandoffCallback],
+             confirmer: ThreadPoolExecutor, logger: logging.Logger) -> None:
+    position = exchange.tray_position
+
+    if not _timed(exchange, STAGE_EXTRACT, driver.extract_drawer, position):
+        exchange.error = f"Extract({position}) failed"
+        return
+
+    # Confirm the drawer arrived while the plate is being swapped
+    confirmation = confirmer.submit(driver.is_drawer_present, 0)
+    try:
+        if handoff is not None:
+            _timed(exchange, STAGE_HANDOFF, handoff, position)
+    except Exception as e:
+        # The plate state is unknown: leave the drawer in the portal for the operator
+        exchange.error = f"Hand-off failed: {e}"
+        logger.error(f"{exchange.label}: {exchange.error}")
+        confirmation.result()
+        return
+
+    exchange.stage = STAGE_CONFIRM
+    if confirmation.result() is False:
+        exchange.error = "Drawer not present in the portal after extract"
+        logger.error(f"{exchange.label}: {exchange.error}")
+        return
+
+    if not _timed(exchange, STAGE_INSERT, driver.insert_drawer, position):
+        exchange.error = f"Insert({position}) failed"
+        return
+
+    exchange.stage = STAGE_DONE
+    exchange.success = True
+    logger.info(f"{exchange.label}: exchange completed in {sum(exchange.timings.values()):.1f}s")
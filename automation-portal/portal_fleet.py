@@ -0,0 +1,187 @@
+"""
+Waters Automation Portal - Multi-portal fleet manager
+
+Holds a registry of Automation Portals (serial and TCP) and runs status sweeps
+and moves on all of them concurrently. Each portal has its own single worker
+thread, so commands to one portal stay strictly ordered while different portals
+work in parallel: sweeping N portals takes about as long as the slowest one.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime
+from typing import Dict, Any, List, Iterable
+
+from automation_portal_driver import AutomationPortalDriver
+
+
+class PortalFleet:
+    """
+    Registry of Automation Portal drivers with one worker per connection.
+
+    Example:
+        fleet = PortalFleet()
+        fleet.add_portal('upc-1', port='COM4')
+        fleet.add_portal('upc-2', comm_mode='tcp', host='192.168.1.101')
+        fleet.connect_all()
+        print(fleet.aggregate_status())
+    """
+
+    def __init__(self):
+        self.drivers: Dict[str, AutomationPortalDriver] = {}
+        self._workers: Dict[str, ThreadPoolExecutor] = {}
+        self.logger = logging.getLogger(__name__)
+
+    def add_portal(self, name: str, driver: AutomationPortalDriver = None, **driver_kwargs) -> AutomationPortalDriver:
+        """
+        Register a portal.
+
+        Args:
+            name: Unique portal name
+            driver: Existing driver instance; if omitted one is created from driver_kwargs
+            **driver_kwargs: AutomationPortalDriver arguments (port, comm_mode, host, ...)
+
+        Returns:
+            The registered driver
+        """
+        if name in self.drivers:
+            raise ValueError(f"Portal already registered: {name}")
+        driver = driver or AutomationPortalDriver(**driver_kwargs)
+        self.drivers[name] = driver
+        self._workers[name] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"portal-{name}")
+        return driver
+
+    def remove_portal(self, name: str) -> None:
+        """Disconnect and unregister a portal."""
+        driver = self.drivers.pop(name)
+        worker = self._workers.pop(name)
+        worker.submit(driver.disconnect).result()
+        worker.shutdown()
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.drivers)
+
+    def submit(self, name: str, method: str, *args, **kwargs) -> Future:
+        """
+        Queue a driver method call on a portal's worker.
+
+        Args:
+            name: Portal name
+            method: Driver method name, e.g. 'extract_drawer'
+            *args, **kwargs: Arguments for the method
+
+        Returns:
+            Future resolving to the method's return value
+        """
+        driver = self.drivers[name]
+        return self._workers[name].submit(getattr(driver, method), *args, **kwargs)
+
+    def run_all(self, method: str, *args, names: Iterable[str] = None, **kwargs) -> Dict[str, Any]:
+        """
+        Run a driver method on several portals concurrently and wait for all.
+
+        Args:
+            method: Driver method name
+            *args, **kwargs: Arguments for the method
+            names: Portals to run on (default: all)
+
+        Returns:
+            Mapping of portal name to result; a failed call maps to its exception
+        """
+        futures = {name: self.submit(name, method, *args, **kwargs) for name in (names or self.names)}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                self.logger.error(f"{name}: {method} failed: {e}")
+                results[name] = e
+        return results
+
+    def connect_all(self) -> Dict[str, bool]:
+        """Connect all portals concurrently."""
+        return self.run_all('connect')
+
+    def disconnect_all(self) -> None:
+        """Disconnect all portals concurrently."""
+        self.run_all('disconnect')
+
+    def status_sweep(self, names: Iterable[str] = None) -> Dict[str, Dict[str, Any]]:
+        """Read GetStatus from every portal concurrently."""
+        results = self.run_all('get_status', names=names)
+        return {
+            name: result if isinstance(result, dict) else {'success': False, 'error': str(result)}
+            for name, result in results.items()
+        }
+
+    def initialize_all(self, names: Iterable[str] = None) -> Dict[str, Any]:
+        """Initialize portals concurrently."""
+        return self.run_all('initialize', names=names)
+
+    def extract_all(self, tray_position: int, names: Iterable[str] = None) -> Dict[str, Any]:
+        """Extract the drawer at tray_position on each portal concurrently."""
+        return self.run_all('extract_drawer', tray_position, names=names)
+
+    def insert_all(self, tray_position: int, names: Iterable[str] = None) -> Dict[str, Any]:
+        """Insert the drawer into tray_position on each portal concurrently."""
+        return self.run_all('insert_drawer', tray_position, names=names)
+
+    def aggregate_status(self) -> Dict[str, Any]:
+        """
+        Sweep all portals and summarize the fleet.
+
+        Returns:
+            Dictionary with per-portal status, counts by system state and sweep duration
+        """
+        start = time.monotonic()
+        portals = {}
+        disconnected = [name for name, driver in self.drivers.items() if not driver.is_connected]
+        connected = [name for name in self.drivers if name not in disconnected]
+        if connected:
+            portals.update(self.status_sweep(connected))
+        for name in disconnected:
+            portals[name] = {'success': False, 'error': 'Not connected'}
+
+        by_state: Dict[str, int] = {}
+        for status in portals.values():
+            state = status.get('system_state', 'Disconnected' if not status.get('success') else 'Unknown')
+            by_state[state] = by_state.get(state, 0) + 1
+
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'portal_count': len(portals),
+            'by_system_state': by_state,
+            'all_operational': bool(portals) and by_state.get('OPERATIONAL', 0) == len(portals),
+            'sweep_seconds': round(time.monotonic() - start, 4),
+            'portals': portals
+        }
+
+    def move_analytics(self) -> Dict[str, Any]:
+        """
+        Collect the move phase statistics of every portal.
+
+        Phases are only timed on portals whose status monitor is running.
+
+        Returns:
+            Dictionary with per-portal reports and the degraded phases of the fleet
+        """
+        reports = {name: driver.move_analytics.report() for name, driver in self.drivers.items()}
+        degraded = []
+        for name, driver in self.drivers.items():
+            degraded.extend(dict(entry, portal=name) for entry in driver.move_analytics.degraded())
+        return {'portals': reports, 'degraded': degraded}
+
+    def close(self) -> None:
+        """Disconnect all portals and stop the workers."""
+        self.disconnect_all()
+        for worker in self._workers.values():
+            worker.shutdown()
+
+    def __enter__(self):
+        self.connect_all()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
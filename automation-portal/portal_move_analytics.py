@@ -0,0 +1,317 @@
+"""
+Waters Automation Portal - Move phase analytics
+
+Times the phases of each Extract, Insert and Initialize (DoorOpening,
+FeederExpanding, PickUp, ...) from the move states reported by GetStatus, and
+keeps rolling statistics per move and tray position. A phase whose recent
+durations have drifted above its reference durations is flagged as degraded, so
+a slow door or feeder shows up before it fails with error codes 10-14.
+
+Phase boundaries are only seen when the status monitor polls: a transition is
+timestamped halfway between the poll that last showed the old phase and the poll
+that first showed the new one. Durations whose boundaries were bracketed by
+polls further apart than max_gap are too coarse to be useful and are not
+recorded. The start of a move is the exception: the driver reports when it
+wrote the move command (move_sent), which times the first phase and the whole
+move even though the poll before the move was an idle one.
+"""
+
+import logging
+import statistics
+import threading
+from collections import deque
+from typing import Optional, Dict, Any, List, Tuple, Deque
+
+import config
+from portal_protocol import command_name, IDLE_MOVE_STATES
+
+# Pseudo-phase holding the duration of the whole move
+TOTAL_PHASE = 'total'
+
+# Move outcomes
+MOVE_OK = 'ok'
+MOVE_ERROR = 'error'
+MOVE_ABORTED = 'aborted'     # replaced by another move or by ResetSystem before it finished
+
+
+class PhaseStats:
+    """Rolling durations of one phase of one move on one tray position."""
+
+    def __init__(self, window: int, baseline: int, recent: int, tolerance: float):
+        self.durations: Deque[float] = deque(maxlen=window)
+        self.reference: List[float] = []
+        self.baseline = baseline
+        self.recent = recent
+        self.tolerance = tolerance
+        self.count = 0
+        self.was_degraded = False
+
+    def add(self, duration: float) -> None:
+        self.durations.append(duration)
+        self.count += 1
+        if len(self.reference) < self.baseline:
+            self.reference.append(duration)
+
+    @property
+    def reference_median(self) -> Optional[float]:
+        """Median of the first durations recorded, once there are enough of them."""
+        if len(self.reference) < self.baseline:
+            return None
+        return statistics.median(self.reference)
+
+    @property
+    def recent_median(self) -> Optional[float]:
+        """Median of the latest durations recorded after the reference."""
+        if self.count < self.baseline + self.recent:
+            return None
+        return statistics.median(list(self.durations)[-self.recent:])
+
+    @property
+    def slowdown(self) -> Optional[float]:
+        """Recent median relative to the reference median (1.0 means unchanged)."""
+        reference, recent = self.reference_median, self.recent_median
+        if reference is None or recent is None or reference <= 0:
+            return None
+        return recent / reference
+
+    @property
+    def degraded(self) -> bool:
+        slowdown = self.slowdown
+        return slowdown is not None and slowdown > 1.0 + self.tolerance
+
+    def as_dict(self) -> Dict[str, Any]:
+        durations = sorted(self.durations)
+        result: Dict[str, Any] = {'count': self.count}
+        if durations:
+            result.update({
+                'last_s': round(self.durations[-1], 3),
+                'mean_s': round(statistics.fmean(durations), 3),
+                'p50_s': round(durations[len(durations) // 2], 3),
+                'max_s': round(durations[-1], 3),
+            })
+        if self.slowdown is not None:
+            result['slowdown'] = round(self.slowdown, 3)
+            result['degraded'] = self.degraded
+        return result
+
+
+class MoveAnalytics:
+    """
+    Per-phase move timing for one portal, fed by PortalStatusMonitor.
+
+    Statistics are keyed by move ('Extract(0)', 'Insert(1)', 'Initialize') and
+    phase. The driver owns its instance, so statistics outlive monitor restarts
+    and reconnects.
+    """
+
+    def __init__(self,
+                 portal: str = '',
+                 window: int = None,
+                 baseline: int = None,
+                 recent: int = None,
+                 tolerance: float = None,
+                 max_gap: float = None):
+        """
+        Args:
+            portal: Label of the portal in reports and log messages
+            window: Durations kept per phase (default config.MOVE_ANALYTICS_WINDOW)
+            baseline: First durations of a phase that form its reference
+                (default config.MOVE_ANALYTICS_BASELINE)
+            recent: Latest durations compared with the reference (default config.MOVE_ANALYTICS_RECENT)
+            tolerance: Slowdown of the recent median over the reference median flagged
+                as degradation, e.g. 0.25 for 25% (default config.MOVE_ANALYTICS_TOLERANCE)
+            max_gap: Longest poll gap in seconds at a phase boundary for the phase to be
+                recorded (default config.MOVE_ANALYTICS_MAX_GAP)
+        """
+        self.portal = portal
+        self.window = window or config.MOVE_ANALYTICS_WINDOW
+        self.baseline = baseline or config.MOVE_ANALYTICS_BASELINE
+        self.recent = recent or config.MOVE_ANALYTICS_RECENT
+        self.tolerance = config.MOVE_ANALYTICS_TOLERANCE if tolerance is None else tolerance
+        self.max_gap = max_gap or config.MOVE_ANALYTICS_MAX_GAP
+
+        self.stats: Dict[Tuple[str, str], PhaseStats] = {}
+        self.moves: Dict[str, Dict[str, int]] = {}
+        self.last_move: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._previous_at: Optional[float] = None
+        self._move: Optional[str] = None
+        self._move_started: Optional[Tuple[float, float]] = None
+        self._phase: Optional[str] = None
+        self._phase_started: Optional[Tuple[float, float]] = None
+        self._phases: List[Tuple[str, Optional[float]]] = []
+        self._sent_at: Optional[float] = None
+        self.logger = logging.getLogger(__name__)
+
+    def move_sent(self, sent_at: float) -> None:
+        """
+        Note that a move command is being written, to anchor the move's start.
+
+        Args:
+            sent_at: Monotonic time the move command was written
+        """
+        with self._lock:
+            self._sent_at = sent_at
+
+    def observe(self, status: Dict[str, Any], polled_at: float) -> None:
+        """
+        Account for one GetStatus poll.
+
+        Args:
+            status: Status dictionary of the poll
+            polled_at: Monotonic time the GetStatus was sent
+        """
+        if not status.get('success'):
+            return
+        with self._lock:
+            previous_at, self._previous_at = self._previous_at, polled_at
+            # Transition estimate: midpoint of the bracketing polls, and the gap they span
+            if previous_at is None:
+                boundary = (polled_at, float('inf'))
+            else:
+                boundary = ((previous_at + polled_at) / 2, polled_at - previous_at)
+
+            state = status.get('status', 'Unknown')
+            moving = state != 'Unknown' and state not in IDLE_MOVE_STATES
+            failed = status.get('system_state') == 'ERROR'
+
+            # Consumed only by polls sent after the move command
+            sent_at = self._sent_at
+            if sent_at is not None and sent_at < polled_at:
+                self._sent_at = None
+            else:
+                sent_at = None
+            if self._move is None:
+                if moving and not failed:
+                    if sent_at is not None and (previous_at is None or sent_at > previous_at):
+                        # The move started when its command reached the portal, after the
+                        # last poll that showed it idle: no need to estimate from polls
+                        boundary = (sent_at, 0.0)
+                    self._move = status.get('mode', 'Unknown')
+                    self._move_started = boundary
+                    self._phases = []
+                    self._phase, self._phase_started = state, boundary
+                return
+
+            if failed:
+                self._finish_move(boundary, MOVE_ERROR)
+            elif status.get('mode', self._move) != self._move:
+                if not moving:
+                    self._finish_move(boundary, MOVE_ABORTED)
+                    return
+                # The move ended and the next one started between two polls; when the
+                # first one ended is unknown, so its last phase and total are not timed
+                self._finish_move((boundary[0], float('inf')), MOVE_OK)
+                self._move, self._move_started = status.get('mode', 'Unknown'), boundary
+                self._phase, self._phase_started = state, boundary
+            elif not moving:
+                self._finish_move(boundary, MOVE_OK)
+            elif state != self._phase:
+                self._close_phase(boundary)
+                self._phase, self._phase_started = state, boundary
+
+    def _duration(self, started: Tuple[float, float], ended: Tuple[float, float]) -> Optional[float]:
+        if max(started[1], ended[1]) > self.max_gap:
+            return None
+        return ended[0] - started[0]
+
+    def _close_phase(self, boundary: Tuple[float, float]) -> None:
+        duration = self._duration(self._phase_started, boundary)
+        self._phases.append((self._phase, duration))
+        if duration is not None:
+            self._stats(self._move, self._phase).add(duration)
+
+    def _finish_move(self, boundary: Tuple[float, float], outcome: str) -> None:
+        move = self._move
+        counts = self.moves.setdefault(move, {'count': 0, 'failures': 0})
+        counts['count'] += 1
+        if outcome != MOVE_OK:
+            # The last phase seen did not finish; the portal may have failed in a
+            # later phase it never reported, so no duration is recorded for it
+            counts['failures'] += 1
+            self._phases.append((self._phase, None))
+            total = None
+        else:
+            self._close_phase(boundary)
+            total = self._duration(self._move_started, boundary)
+            if total is not None:
+                self._stats(move, TOTAL_PHASE).add(total)
+
+        self.last_move = {
+            'portal': self.portal,
+            'move': move,
+            'outcome': outcome,
+            'total_s': None if total is None else round(total, 3),
+            'phases': [(phase, None if duration is None else round(duration, 3))
+                       for phase, duration in self._phases],
+        }
+        self._move = None
+        self._phase = None
+        self._phases = []
+        self._check_degradation(move)
+
+    def _stats(self, move: str, phase: str) -> PhaseStats:
+        stats = self.stats.get((move, phase))
+        if stats is None:
+            stats = self.stats[(move, phase)] = PhaseStats(self.window, self.baseline, self.recent, self.tolerance)
+        return stats
+
+    def _check_degradation(self, move: str) -> None:
+        for (stats_move, phase), stats in self.stats.items():
+            if stats_move != move:
+                continue
+            degraded = stats.degraded
+            if degraded and not stats.was_degraded:
+                code = config.PORTAL_PHASE_ERROR_CODES.get(phase)
+                hint = f" (precedes error {code}: {config.PORTAL_ERROR_CODES[code]})" if code else ""
+                self.logger.warning(
+                    f"{self.portal or 'Portal'} {move} {phase} is {stats.slowdown:.2f}x slower than its "
+                    f"reference ({stats.recent_median:.2f}s vs {stats.reference_median:.2f}s){hint}"
+                )
+            elif stats.was_degraded and not degraded:
+                self.logger.info(f"{self.portal or 'Portal'} {move} {phase} is back within tolerance")
+            stats.was_degraded = degraded
+
+    def degraded(self) -> List[Dict[str, Any]]:
+        """Phases whose recent durations exceed their reference by more than the tolerance."""
+        with self._lock:
+            return [
+                {
+                    'portal': self.portal,
+                    'move': move,
+                    'phase': phase,
+                    'reference_s': round(stats.reference_median, 3),
+                    'recent_s': round(stats.recent_median, 3),
+                    'slowdown': round(stats.slowdown, 3),
+                    'error_code': config.PORTAL_PHASE_ERROR_CODES.get(phase),
+                }
+                for (move, phase), stats in self.stats.items() if stats.degraded
+            ]
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Rolling statistics of every move and phase seen.
+
+        Returns:
+            Dictionary with per-move counts and per-phase duration statistics,
+            keyed by move then phase, plus the breakdown of the last move
+        """
+        with self._lock:
+            moves: Dict[str, Any] = {}
+            for move, counts in self.moves.items():
+                moves[move] = dict(counts, command=command_name(move), phases={})
+            for (move, phase), stats in self.stats.items():
+                entry = moves.setdefault(move, {'count': 0, 'failures': 0, 'command': command_name(move),
+                                                'phases': {}})
+                if phase == TOTAL_PHASE:
+                    entry[TOTAL_PHASE] = stats.as_dict()
+                else:
+                    entry['phases'][phase] = stats.as_dict()
+            return {'portal': self.portal, 'moves': moves, 'last_move': self.last_move}
+
+    def reset(self) -> None:
+        """Discard all statistics, e.g. after mechanical maintenance."""
+        with self._lock:
+            self.stats.clear()
+            self.moves.clear()
+            self.last_move = None
@@ -0,0 +1,213 @@
+"""
+Waters Automation Portal - Pipelined command dispatch
+
+Tags each command with a sequence number (config.PORTAL_COMM_SETTINGS range) and
+keeps several commands in flight on one connection. A reader thread demultiplexes
+Received/Completed/Error frames back to the waiting command by their sequence
+field, so status reads are answered while a long move is still running instead
+of queueing behind it.
+
+Only one move command is in flight at a time; the portal rejects a second move
+while the first is running, so a new move waits for the previous one to finish.
+Sequence-tagged commands require firmware that echoes the sequence number.
+"""
+
+import logging
+import threading
+from typing import Optional, Dict, Callable
+
+import config
+from portal_protocol import (PortalResponse, parse_frame, command_name, encode_command,
+                             MOVE_COMMANDS)
+from portal_transport import PortalTransport
+
+
+class PendingCommand:
+    """A command waiting for its terminating frame."""
+
+    __slots__ = ('command', 'sequence', 'response', 'acknowledged', 'done', 'is_move', 'error', 'bytes_sent')
+
+    def __init__(self, command: str, sequence: int):
+        self.command = command
+        self.sequence = sequence
+        self.response = PortalResponse(command)
+        self.acknowledged = threading.Event()
+        self.done = threading.Event()
+        self.is_move = command_name(command) in MOVE_COMMANDS
+        self.error: Optional[Exception] = None
+        self.bytes_sent = 0   # tagged command bytes written to the transport
+
+    def wait(self, timeout: float) -> bool:
+        """Wait for the terminating frame. Returns True if it arrived in time."""
+        return self.done.wait(timeout)
+
+
+class CommandPipeline:
+    """
+    Sequence-numbered command dispatcher over a framed transport.
+
+    While the pipeline runs, its reader thread owns all reads from the
+    transport; writes are serialized by the pipeline.
+    """
+
+    def __init__(self, transport: PortalTransport, max_in_flight: int = 8,
+                 on_failure: Callable[[Exception], None] = None):
+        """
+        Initialize the pipeline.
+
+        Args:
+            transport: Connected framed transport
+            max_in_flight: Maximum number of commands awaiting a response
+            on_failure: Called with the error when the reader thread loses the connection
+        """
+        self.transport = transport
+        self.max_in_flight = max_in_flight
+        self.on_failure = on_failure
+        self.pending: Dict[int, PendingCommand] = {}
+        self._sequence = 0
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start the reader thread."""
+        if self.is_running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="portal-pipeline", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the reader thread and fail every pending command."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        self._fail_all(ConnectionError("Pipeline stopped"))
+
+    def _next_sequence(self) -> Optional[int]:
+        low = config.PORTAL_COMM_SETTINGS['SEQUENCE_NUMBER_MIN']
+        high = config.PORTAL_COMM_SETTINGS['SEQUENCE_NUMBER_MAX']
+        for _ in range(high - low + 1):
+            self._sequence = self._sequence + 1 if low <= self._sequence < high else low
+            if self._sequence not in self.pending:
+                return self._sequence
+        return None
+
+    def _can_submit(self, is_move: bool) -> bool:
+        if len(self.pending) >= self.max_in_flight:
+            return False
+        if is_move and any(entry.is_move for entry in self.pending.values()):
+            return False
+        return True
+
+    def submit(self, command: str, timeout: float) -> PendingCommand:
+        """
+        Tag a command with a free sequence number and send it.
+
+        Args:
+            command: Untagged command string, e.g. 'Extract(1)'
+            timeout: Maximum time to wait for a free slot in seconds
+
+        Returns:
+            PendingCommand that completes when the command's terminating frame arrives
+
+        Raises:
+            TimeoutError: If no slot became free in time
+            ConnectionError: If the pipeline is not running
+        """
+        if not self.is_running:
+            raise ConnectionError("Pipeline not running")
+
+        is_move = command_name(command) in MOVE_COMMANDS
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._can_submit(is_move), timeout):
+                raise TimeoutError(f"No pipeline slot for {command}")
+            sequence = self._next_sequence()
+            if sequence is None:
+                raise TimeoutError(f"No free sequence number for {command}")
+            entry = PendingCommand(command, sequence)
+            self.pending[sequence] = entry
+
+        data = encode_command(command, sequence)
+        try:
+            with self._write_lock:
+                self.transport.write(data)
+        except Exception:
+            self.discard(entry)
+            raise
+        entry.bytes_sent = len(data)
+        return entry
+
+    def discard(self, entry: PendingCommand) -> None:
+        """Stop waiting for a command; late frames for it are dropped."""
+        with self._cond:
+            if self.pending.get(entry.sequence) is entry:
+                del self.pending[entry.sequence]
+                self._cond.notify_all()
+
+    def pending_for(self, response: PortalResponse) -> Optional[PendingCommand]:
+        """Return the pending command collecting the given response, if still in flight."""
+        with self._cond:
+            return next((entry for entry in self.pending.values() if entry.response is response), None)
+
+    def _finish(self, entry: PendingCommand) -> None:
+        with self._cond:
+            if self.pending.get(entry.sequence) is entry:
+                del self.pending[entry.sequence]
+                self._cond.notify_all()
+        entry.acknowledged.set()
+        entry.done.set()
+
+    def _fail_all(self, error: Exception) -> None:
+        with self._cond:
+            entries = list(self.pending.values())
+            self.pending.clear()
+            self._cond.notify_all()
+        for entry in entries:
+            entry.error = error
+            entry.acknowledged.set()
+            entry.done.set()
+
+    def _route(self, data: bytes) -> None:
+        frame = parse_frame(data)
+        if not frame.kind:
+            # Command echo or noise
+            return
+
+        with self._cond:
+            entry = self.pending.get(frame.sequence)
+            if entry is None or not frame.answers(entry.command):
+                # Sequence not echoed as sent: fall back to the oldest command of that name
+                entry = next((e for e in self.pending.values() if frame.answers(e.command)), None)
+
+        if entry is None:
+            self.logger.debug("Unsolicited frame: %r", frame)
+            return
+        if entry.response.add_frame(frame):
+            self._finish(entry)
+        else:
+            entry.acknowledged.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                data = self.transport.read_frame(0.2)
+            except Exception as e:
+                if not self._stop.is_set():
+                    self.logger.error(f"Pipeline reader failed: {e}")
+                    self._fail_all(e)
+                    if self.on_failure is not None:
+                        self.on_failure(e)
+                return
+            if data is not None:
+                self._route(data)
+
+    def __len__(self) -> int:
+        return len(self.pending)
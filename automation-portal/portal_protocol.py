@@ -0,0 +1,700 @@
+"""
+Waters Automation Portal - PC Protocol framing and parsing
+
+Incremental decoding of the CR/LF delimited response stream returned by the
+Automation Portal, and parsing of Received/Completed/Error frames into typed
+records. Each frame kind has one precompiled pattern, and GetStatus replies
+have their own, so a frame is parsed with a single match when it is first
+read; drivers and monitors then work on the records instead of rescanning
+response text. The receive path stays in bytes: transports read into the
+decoder's preallocated buffer and each frame is sliced out of it once, at its
+terminator. Shared by the blocking and asyncio drivers so both read the
+protocol the same way.
+
+Based on Waters Automation Portal PC Protocol Specification (715008839).
+"""
+
+import re
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Tuple, Union
+
+import config
+
+# Bytes trimmed from both ends of a frame (the portal indents frames with a tab)
+_FRAME_WHITESPACE = b' \t\r\n'
+
+# Field separator: a comma that is not inside a parenthesised argument such as Insert(1)
+_FIELD_SEPARATOR = re.compile(r',(?![^()]*\))')
+
+TERMINAL_FRAME_PREFIXES = ('Completed(', 'Error(')
+
+FRAME_RECEIVED = 'Received'
+FRAME_COMPLETED = 'Completed'
+FRAME_ERROR = 'Error'
+
+# Frame kinds keyed by first byte, with the prefix the frame must start with
+_FRAME_KINDS = {
+    ord('R'): (b'Received(', FRAME_RECEIVED),
+    ord('C'): (b'Completed(', FRAME_COMPLETED),
+    ord('E'): (b'Error(', FRAME_ERROR),
+}
+
+# Received(seq,Command...) / Completed(seq,Command...) / Error(seq,Command...) headers,
+# one pattern per frame kind. Groups: sequence number, command token including its
+# own (...) arguments, bare command name. The remaining fields follow the match.
+_FRAME_PATTERNS = {
+    kind: re.compile(kind + r'\((\d+),(([^,()]*)(?:\([^)]*\))?)')
+    for kind in (FRAME_RECEIVED, FRAME_COMPLETED, FRAME_ERROR)
+}
+
+# Completed(43,GetStatus,OPERATIONAL,Insert(1),Idle,NoDrawerNoTray,DoorClosed,FeederFullyRetracted,172:16:0:4,00:00:C4:06:01:67)
+_STATUS_PATTERN = re.compile(
+    r'Completed\((\d+),GetStatus,([^,]+),([^,)]+(?:\([^)]*\))?),([^,]+),([^,]+),([^,]+),([^,]+),([^,]+),([^,)]+)\)'
+)
+
+# Parsed frame bodies (the bytes after the sequence number). Status polls return
+# the same body over and over, so each distinct body is matched once.
+_BODY_CACHE_SIZE = 256
+_HEADER_CACHE: Dict[bytes, Tuple[str, str, Tuple[str, ...]]] = {}
+_STATUS_CACHE: Dict[bytes, Tuple] = {}
+
+# Commands that start a mechanical movement and complete asynchronously
+MOVE_COMMANDS = ('Initialize', 'Extract', 'Insert')
+
+# Movement states in which the portal is not moving
+IDLE_MOVE_STATES = frozenset(config.PORTAL_MOVE_STATES)
+
+# Typed record of a response that has not been looked at yet
+_NOT_DECODED = object()
+
+
+class FrameDecoder:
+    """
+    Incremental decoder that turns raw bytes into protocol frames.
+
+    Bytes are received into one preallocated buffer, either by feed() or by a
+    transport reading straight into write_buffer() and calling commit(). Frames
+    are split on config.RESPONSE_TERMINATOR (bare CR or LF is tolerated as
+    well) by scanning the buffer in place: each complete frame is sliced out of
+    the buffer once, at its terminator, as bytes with surrounding whitespace
+    trimmed. A frame split across reads stays in the buffer until its
+    terminator arrives, so callers never see partial lines. Frames are decoded
+    to text only when a caller needs it.
+    """
+
+    def __init__(self, encoding: str = 'utf-8', capacity: int = None):
+        self.encoding = encoding
+        self._buffer = bytearray(capacity or config.DATA_BUFFER_SIZE)
+        self._view = memoryview(self._buffer)
+        self._start = 0   # first byte not yet returned as a frame
+        self._end = 0     # end of received data
+        self._frames = deque()
+
+    @property
+    def capacity(self) -> int:
+        """Current size of the receive buffer in bytes."""
+        return len(self._buffer)
+
+    def write_buffer(self, min_free: int = 1) -> memoryview:
+        """
+        Return the free tail of the receive buffer for a transport to read into.
+
+        Unconsumed bytes are moved to the front of the buffer, and the buffer
+        grows, only when fewer than min_free bytes (or a quarter of the buffer)
+        are free. Call commit() with the number of bytes written.
+
+        Args:
+            min_free: Minimum number of writable bytes required
+
+        Returns:
+            Writable memoryview; it is only valid until the next commit()
+        """
+        free = len(self._buffer) - self._end
+        if free < min_free or free < len(self._buffer) // 4:
+            self._compact(min_free)
+        return self._view[self._end:]
+
+    def commit(self, count: int) -> int:
+        """
+        Account for bytes written into write_buffer() and split complete frames.
+
+        Args:
+            count: Number of bytes written
+
+        Returns:
+            Number of complete frames now waiting to be read
+        """
+        if count:
+            scan = self._end
+            self._end += count
+            self._split(scan)
+        return len(self._frames)
+
+    def feed(self, data: bytes) -> int:
+        """
+        Add received bytes to the decoder.
+
+        Args:
+            data: Raw bytes read from the connection
+
+        Returns:
+            Number of complete frames now waiting to be read
+        """
+        count = len(data)
+        if count:
+            self.write_buffer(count)[:count] = data
+        return self.commit(count)
+
+    def next_frame(self) -> Optional[bytes]:
+        """Return the oldest complete frame, or None if none is waiting."""
+        return self._frames.popleft() if self._frames else None
+
+    def clear(self) -> None:
+        """Discard buffered bytes and any undelivered frames."""
+        self._start = self._end = 0
+        self._frames.clear()
+
+    def _split(self, scan: int) -> None:
+        buffer, view, frames = self._buffer, self._view, self._frames
+        start, end = self._start, self._end
+        if buffer.count(b'\r', scan, end) != buffer.count(b'\r\n', scan, end):
+            # Bare CR terminators (or a CRLF split across reads): end those frames
+            # at an LF too, so one terminator search covers both
+            buffer[scan:end] = buffer[scan:end].replace(b'\r', b'\n')
+
+        # Bytes before scan were searched by the previous call and hold no terminator.
+        # The portal's tab indent and CR are stepped over rather than stripped, so
+        # strip() only copies a frame with unusual padding.
+        find = buffer.find
+        stop = find(b'\n', scan, end)
+        while stop >= 0:
+            first = start + (buffer[start] == 9)
+            last = stop - (buffer[stop - 1] == 13)
+            if last > first:
+                frame = bytes(view[first:last]).strip(_FRAME_WHITESPACE)
+                if frame:
+                    frames.append(frame)
+            start = stop + 1
+            stop = find(b'\n', start, end)
+
+        if start >= end:
+            # Everything consumed: reuse the buffer from the front
+            self._start = self._end = 0
+        else:
+            self._start = start
+
+    def _compact(self, min_free: int) -> None:
+        pending = self._end - self._start
+        if pending + min_free > len(self._buffer):
+            # A frame longer than the buffer: grow (rare, frames are < 200 bytes)
+            size = len(self._buffer)
+            while pending + min_free > size:
+                size *= 2
+            buffer = bytearray(size)
+            buffer[:pending] = self._buffer[self._start:self._end]
+            self._buffer = buffer
+            self._view = memoryview(buffer)
+        elif self._start:
+            self._buffer[:pending] = self._buffer[self._start:self._end]
+        self._start, self._end = 0, pending
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+
+def encode_command(command: str, sequence: Optional[int] = None) -> bytes:
+    """
+    Return the wire bytes for a command: tagged with a sequence number if
+    given, and terminated with config.COMMAND_TERMINATOR.
+
+    Encodings are cached, so repeated commands (status polls) do not rebuild
+    and re-encode the command string.
+    """
+    return _encode_command(command, sequence)
+
+
+@lru_cache(maxsize=1024)
+def _encode_command(command: str, sequence: Optional[int]) -> bytes:
+    text = command if sequence is None else tag_command(command, sequence)
+    return (text + config.COMMAND_TERMINATOR).encode('utf-8')
+
+
+@lru_cache(maxsize=256)
+def command_name(command: str) -> str:
+    """Return the bare command name, e.g. 'Extract' for 'Extract(1)'."""
+    return command.split('(', 1)[0].strip()
+
+
+def tag_command(command: str, sequence: int) -> str:
+    """
+    Add a sequence number as the first command argument.
+
+    'GetStatus' becomes 'GetStatus(12)' and 'Extract(1)' becomes 'Extract(12,1)'.
+    """
+    name, paren, rest = command.partition('(')
+    if not paren:
+        return f"{name}({sequence})"
+    return f"{name}({sequence},{rest}"
+
+
+def _split_fields(content: str) -> Tuple[str, ...]:
+    if '(' not in content:
+        return tuple(content.split(','))
+    return tuple(_FIELD_SEPARATOR.split(content))
+
+
+class PortalFrame:
+    """
+    One decoded protocol frame.
+
+    kind is 'Received', 'Completed' or 'Error' for protocol frames and '' for
+    anything else (command echo, unparseable text). command is the command token
+    as echoed by the portal, e.g. 'Extract(1)'; args holds the remaining fields.
+    data is the frame as received. Only the kind is known up front: the header
+    is filled in when first read, from one match of the kind's precompiled
+    pattern per distinct frame body, so acknowledgements and echoes that nobody
+    reads are never decoded.
+    """
+
+    __slots__ = ('kind', 'data', '_raw', '_sequence', '_command', '_name', '_args')
+
+    def __init__(self, kind: str, data: bytes):
+        self.kind = kind
+        self.data = data
+        self._raw: Optional[str] = None
+        # Only protocol frames have a header to match
+        self._command: Optional[str] = None if kind else ''
+
+    @property
+    def sequence(self) -> Optional[int]:
+        """Sequence number of the frame, None if it has no valid header."""
+        if self._command is None:
+            self._match_header()
+        return self._sequence if self._command else None
+
+    @property
+    def command(self) -> str:
+        """Command token, e.g. 'Extract(1)'; '' if the frame has no valid header."""
+        if self._command is None:
+            self._match_header()
+        return self._command
+
+    @property
+    def name(self) -> str:
+        """Bare command name, e.g. 'Extract'."""
+        if self._command is None:
+            self._match_header()
+        return self._name if self._command else ''
+
+    @property
+    def args(self) -> Tuple[str, ...]:
+        """Fields after the command token."""
+        if self._command is None:
+            self._match_header()
+        return self._args if self._command else ()
+
+    @property
+    def raw(self) -> str:
+        """Frame text, decoded on first access."""
+        if self._raw is None:
+            self._raw = self.data.decode('utf-8', 'replace')
+        return self._raw
+
+    @property
+    def is_terminal(self) -> bool:
+        """True for Completed and Error frames, which end a command exchange."""
+        return self.kind == FRAME_COMPLETED or self.kind == FRAME_ERROR
+
+    def answers(self, command: str) -> bool:
+        """
+        Check whether this frame belongs to the given command.
+
+        A protocol frame whose header could not be matched has no command and is
+        treated as a match, so malformed error replies still end the exchange.
+        """
+        return self._answers_name(command_name(command))
+
+    def _answers_name(self, name: str) -> bool:
+        if not self.command:
+            return bool(self.kind)
+        return self._name == name
+
+    def _match_header(self) -> None:
+        head, _, body = self.data.partition(b',')
+        sequence = head[len(self.kind) + 1:]
+        if not body or not sequence.isdigit():
+            # Protocol frame with a malformed header
+            self._command = ''
+            return
+        header = _HEADER_CACHE.get(body)
+        if header is None:
+            header = _remember(_HEADER_CACHE, body, _match_header(self.kind, self.raw))
+        self._command, self._name, self._args = header
+        self._sequence = int(sequence)
+
+    def __repr__(self) -> str:
+        return f"PortalFrame({self.raw!r})"
+
+
+def _match_header(kind: str, raw: str) -> Tuple[str, str, Tuple[str, ...]]:
+    match = _FRAME_PATTERNS[kind].match(raw)
+    if match is None:
+        return '', '', ()
+    _, command, name = match.groups()
+    end = raw.rfind(')')
+    args = _split_fields(raw[match.end() + 1:end]) if end > match.end() else ()
+    return command, name, args
+
+
+def _remember(cache: Dict[bytes, Any], body: bytes, value: Any) -> Any:
+    if len(cache) >= _BODY_CACHE_SIZE:
+        cache.clear()
+    cache[body] = value
+    return value
+
+
+class PortalStatus:
+    """
+    Typed GetStatus record.
+
+    Records built from a frame share the dictionary form of their status body
+    with every other reply carrying the same body, so as_dict() only copies it.
+    Treat records as read-only.
+    """
+
+    __slots__ = ('sequence', 'system_state', 'mode', 'status', 'drawer_tray_status',
+                 'door_status', 'feeder_status', 'ip_address', 'mac_address', '_dict')
+
+    def __init__(self, sequence: int, system_state: str, mode: str, status: str, drawer_tray_status: str,
+                 door_status: str, feeder_status: str, ip_address: str, mac_address: str):
+        self.sequence = sequence
+        self.system_state = system_state
+        self.mode = mode
+        self.status = status
+        self.drawer_tray_status = drawer_tray_status
+        self.door_status = door_status
+        self.feeder_status = feeder_status
+        self.ip_address = ip_address
+        self.mac_address = mac_address
+        self._dict: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_frame(cls, frame: PortalFrame) -> Optional['PortalStatus']:
+        """Build a status record from a Completed GetStatus frame, or None if it is not one."""
+        if frame.kind != FRAME_COMPLETED:
+            return None
+        # Keyed like the header cache: the status body repeats, its sequence number does not
+        head, _, body = frame.data.partition(b',')
+        cached = _STATUS_CACHE.get(body)
+        if cached is None:
+            match = _STATUS_PATTERN.match(frame.raw)
+            if match is None:
+                cached = ()
+            else:
+                fields = match.groups()[1:]
+                cached = (fields, cls(None, *fields).as_dict())
+            _remember(_STATUS_CACHE, body, cached)
+        sequence = head[len(FRAME_COMPLETED) + 1:]
+        if not cached or not sequence.isdigit():
+            return None
+        fields, status_dict = cached
+        status = cls(int(sequence), *fields)
+        status._dict = status_dict
+        return status
+
+    @classmethod
+    def from_dict(cls, status: Dict[str, Any]) -> 'PortalStatus':
+        """Rebuild a status record from the dictionary form returned by as_dict()."""
+        return cls(status.get('sequence'), *(status.get(field, 'Unknown') for field in cls.__slots__[1:-1]))
+
+    @property
+    def is_idle(self) -> bool:
+        """True when no movement is in progress."""
+        return self.status in IDLE_MOVE_STATES
+
+    @property
+    def drawer_present(self) -> Optional[bool]:
+        """True if a drawer is in the portal, False if not, None if unknown."""
+        if self.drawer_tray_status in ('DrawerAndTray', 'DrawerOnly'):
+            return True
+        if self.drawer_tray_status == 'NoDrawerNoTray':
+            return False
+        return None
+
+    @property
+    def door_open(self) -> Optional[bool]:
+        """True if the door is open, False if closed, None if unknown or moving."""
+        if self.door_status == 'DoorOpened':
+            return True
+        if self.door_status == 'DoorClosed':
+            return False
+        return None
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the status in the dictionary form returned by get_status()."""
+        if self._dict is not None:
+            status = self._dict.copy()
+            status['sequence'] = self.sequence
+            return status
+        return {
+            'success': True,
+            'sequence': self.sequence,
+            'command': 'GetStatus',
+            'system_state': self.system_state,            # OPERATIONAL
+            'mode': self.mode,                            # Insert(1)
+            'status': self.status,                        # Idle
+            'drawer_tray_status': self.drawer_tray_status,  # NoDrawerNoTray
+            'door_status': self.door_status,              # DoorClosed
+            'feeder_status': self.feeder_status,          # FeederFullyRetracted
+            'ip_address': self.ip_address,                # 172:16:0:4
+            'mac_address': self.mac_address               # 00:00:C4:06:01:67
+        }
+
+
+class PortalErrorInfo:
+    """
+    Decoded Error(seq,cmd,code) frame.
+
+    transient errors (busy, communication, timeout) are worth retrying after a
+    short backoff; fatal errors need operator attention and are never retried.
+    """
+
+    __slots__ = ('code', 'description', 'sequence', 'command')
+
+    def __init__(self, code: Optional[int], description: str, sequence: Optional[int], command: str):
+        self.code = code
+        self.description = description
+        self.sequence = sequence
+        self.command = command
+
+    @property
+    def transient(self) -> bool:
+        return self.code in config.PORTAL_TRANSIENT_ERROR_CODES
+
+    @property
+    def fatal(self) -> bool:
+        return self.code in config.PORTAL_FATAL_ERROR_CODES
+
+    def __str__(self) -> str:
+        return f"Error {self.code} on {self.command or 'unknown command'}: {self.description}"
+
+    def __repr__(self) -> str:
+        return f"PortalErrorInfo(code={self.code}, command={self.command!r})"
+
+
+def decode_error(frame: PortalFrame) -> Optional[PortalErrorInfo]:
+    """
+    Decode an Error frame using config.PORTAL_ERROR_CODES.
+
+    Args:
+        frame: Parsed frame
+
+    Returns:
+        PortalErrorInfo, or None if the frame is not an Error frame
+    """
+    if frame.kind != FRAME_ERROR:
+        return None
+    code_field = frame.args[-1].strip() if frame.args else ''
+    if not code_field.isdigit():
+        return PortalErrorInfo(None, f"Unrecognized error frame: {frame.raw}", frame.sequence, frame.command)
+    code = int(code_field)
+    description = config.PORTAL_ERROR_CODES.get(code, "Unknown error code")
+    return PortalErrorInfo(code, description, frame.sequence, frame.command)
+
+
+def parse_frame(data: Union[bytes, str]) -> PortalFrame:
+    """
+    Classify one frame; its header is matched when first read.
+
+    Args:
+        data: Frame without terminator, e.g. b'Received(26,GetStatus)', as
+            returned by FrameDecoder.next_frame(); text is accepted as well
+
+    Returns:
+        PortalFrame record
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    kind = _FRAME_KINDS.get(data[0]) if data else None
+    if kind is None or not data.startswith(kind[0]):
+        return PortalFrame('', data)
+    return PortalFrame(kind[1], data)
+
+
+class PortalResponse:
+    """
+    All frames received for one command exchange.
+
+    terminal is the Completed/Error frame that answered the command, or None if
+    the exchange timed out. Frames answering other commands (e.g. a move
+    completion arriving during a GetStatus) are kept in frames.
+    first_frame_at and terminal_at are time.monotonic() arrival times. The
+    typed status and error records are built from the terminal frame the first
+    time they are read, and only once.
+    """
+
+    __slots__ = ('command', 'frames', 'terminal', 'first_frame_at', 'terminal_at', '_name', '_status', '_error_info')
+
+    def __init__(self, command: str):
+        self.command = command
+        self._name = command_name(command)
+        self.frames: List[PortalFrame] = []
+        self.terminal: Optional[PortalFrame] = None
+        self.first_frame_at: Optional[float] = None
+        self.terminal_at: Optional[float] = None
+        self._status = _NOT_DECODED
+        self._error_info = _NOT_DECODED
+
+    def add(self, data: Union[bytes, str]) -> bool:
+        """
+        Parse and append a frame.
+
+        Returns:
+            True if the frame completes this command's exchange
+        """
+        return self.add_frame(parse_frame(data))
+
+    def add_frame(self, frame: PortalFrame) -> bool:
+        """
+        Append an already parsed frame.
+
+        Returns:
+            True if the frame completes this command's exchange
+        """
+        self.frames.append(frame)
+        if self.first_frame_at is None:
+            self.first_frame_at = time.monotonic()
+        kind = frame.kind
+        if (kind == FRAME_COMPLETED or kind == FRAME_ERROR) and frame._answers_name(self._name):
+            self.terminal = frame
+            self.terminal_at = time.monotonic()
+            self._status = self._error_info = _NOT_DECODED
+            return True
+        return False
+
+    @property
+    def acknowledged(self) -> bool:
+        """True once the portal has answered the command with Received or a terminal frame."""
+        return self.terminal is not None or any(
+            frame.kind == FRAME_RECEIVED and frame._answers_name(self._name) for frame in self.frames)
+
+    @property
+    def completed(self) -> bool:
+        """True if the command was answered with a Completed frame."""
+        return self.terminal is not None and self.terminal.kind == FRAME_COMPLETED
+
+    @property
+    def error(self) -> Optional[PortalFrame]:
+        """The first Error frame received in this exchange, if any."""
+        for frame in self.frames:
+            if frame.kind == FRAME_ERROR:
+                return frame
+        return None
+
+    @property
+    def error_info(self) -> Optional[PortalErrorInfo]:
+        """Decoded error when the command was answered with an Error frame."""
+        if self._error_info is _NOT_DECODED:
+            terminal = self.terminal
+            if terminal is None or terminal.kind != FRAME_ERROR:
+                return None
+            self._error_info = decode_error(terminal)
+        return self._error_info
+
+    @property
+    def status(self) -> Optional[PortalStatus]:
+        """Status record when this is an answered GetStatus exchange."""
+        if self._status is _NOT_DECODED:
+            terminal = self.terminal
+            if terminal is None or terminal.kind != FRAME_COMPLETED:
+                return None
+            self._status = PortalStatus.from_frame(terminal)
+        return self._status
+
+    @property
+    def text(self) -> str:
+        """Raw frames joined by newlines, as returned by _send_command()."""
+        return '\n'.join(frame.raw for frame in self.frames)
+
+    def __str__(self) -> str:
+        return self.text
+
+
+def status_dict(response: PortalResponse) -> Dict[str, Any]:
+    """
+    Convert a GetStatus exchange into the dictionary returned by get_status().
+
+    Args:
+        response: GetStatus exchange
+
+    Returns:
+        Dictionary with system_state, mode, status, drawer_tray_status,
+        door_status, feeder_status, ip_address and mac_address. If the response
+        could not be parsed the state fields are 'Unknown' and raw_response is set.
+    """
+    status = response.status
+    if status is not None:
+        return status.as_dict()
+
+    # If parsing failed, return error but still mark as success since we got a response
+    return {
+        'success': True,
+        'raw_response': response.text,
+        'system_state': 'Unknown',
+        'mode': 'Unknown',
+        'status': 'Unknown',
+        'mac_address': 'Unknown'
+    }
+
+
+def parse_status_response(response: str) -> Dict[str, Any]:
+    """
+    Parse GetStatus response text into a status dictionary.
+
+    Args:
+        response: Response text returned by _send_command("GetStatus")
+
+    Returns:
+        Dictionary in the form returned by get_status()
+    """
+    parsed = PortalResponse("GetStatus")
+    for line in response.splitlines():
+        line = line.strip()
+        if line and parsed.add(line):
+            break
+    return status_dict(parsed)
+
+
+def move_result(response: PortalResponse, command: str) -> Optional[bool]:
+    """
+    Interpret a GetStatus exchange while waiting for a move command to finish.
+
+    The move's own Completed/Error frame is authoritative when it arrives during
+    the exchange; otherwise the status record decides.
+
+    Args:
+        response: GetStatus exchange
+        command: Move command being waited on ('Initialize', 'Extract', 'Insert')
+
+    Returns:
+        True if the command completed, False if it failed, None if still pending
+    """
+    name = command_name(command)
+    for frame in response.frames:
+        if frame.is_terminal and frame.command and frame.name == name:
+            return frame.kind == FRAME_COMPLETED
+
+    status = response.status
+    if status is None:
+        return None
+    if command_name(status.mode) == name:
+        if status.system_state == 'ERROR':
+            return False
+        if status.is_idle:
+            return True
+    if name == 'Initialize' and status.system_state == 'OPERATIONAL':
+        # System already operational, initialization not needed
+        return True
+    return None
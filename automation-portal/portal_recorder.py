@@ -0,0 +1,418 @@
+"""
+Waters Automation Portal - Wire recorder and replay
+
+FrameRecorder appends every command written and every block of bytes received
+by a driver's transport to a compact binary log, stamped with monotonic
+nanoseconds. ReplayTransport feeds such a log back into an unmodified driver,
+at the recorded pace or faster, so slow or failed production moves can be
+reproduced, and the parser and driver state logic profiled, without hardware.
+
+File layout (little-endian):
+    magic     b'WAPREC\\x01\\n'
+    records   kind (u8) | nanoseconds since session start (u64) | length (u32) | payload
+
+Record kinds:
+    RECORD_SESSION  - starts a session (one per connect); payload is JSON metadata
+    RECORD_TX       - command bytes written to the portal
+    RECORD_RX       - bytes received from the portal, as returned by one read
+
+Usage:
+    driver = AutomationPortalDriver(port='COM4', recorder=FrameRecorder('portal.wprec'))
+    replay = AutomationPortalDriver(port='portal.wprec', comm_mode='replay', replay_speed=10)
+
+    python portal_recorder.py summary portal.wprec
+    python portal_recorder.py dump portal.wprec
+    python portal_recorder.py parse portal.wprec --repeat 1000 --profile
+"""
+
+import argparse
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from typing import Optional, Dict, Any, List, Iterable, Iterator
+
+from portal_protocol import (FrameDecoder, parse_frame, command_name,
+                             FRAME_RECEIVED, FRAME_COMPLETED, FRAME_ERROR)
+from portal_transport import PortalTransport, RECORD_TX, RECORD_RX
+
+FILE_MAGIC = b'WAPREC\x01\n'
+
+RECORD_SESSION = 0
+
+RECORD_NAMES = {RECORD_SESSION: 'session', RECORD_TX: 'tx', RECORD_RX: 'rx'}
+
+_RECORD = struct.Struct('<BQI')
+
+logger = logging.getLogger(__name__)
+
+
+class RecordedFrame:
+    """One record of a recording; timestamp is seconds since its session started."""
+
+    __slots__ = ('kind', 'timestamp', 'data', 'session')
+
+    def __init__(self, kind: int, timestamp: float, data: bytes, session: int):
+        self.kind = kind
+        self.timestamp = timestamp
+        self.data = data
+        self.session = session
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        """Session metadata (RECORD_SESSION records only)."""
+        return json.loads(self.data) if self.kind == RECORD_SESSION else {}
+
+    def __repr__(self) -> str:
+        return f"RecordedFrame({RECORD_NAMES.get(self.kind, self.kind)}, {self.timestamp:.6f}, {self.data!r})"
+
+
+class FrameRecorder:
+    """
+    Append-only binary log of a driver's wire traffic.
+
+    Each record is flushed as it is written, so a trace survives a crash of the
+    process being diagnosed. Safe to share between the threads of one driver.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Recording file; appended to if it already exists
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(FILE_MAGIC)
+            self._file.flush()
+        self._started = time.monotonic_ns()
+        self.records = 0
+
+    def start_session(self, **metadata) -> None:
+        """Start a new session; later timestamps are relative to now."""
+        metadata.setdefault('wall_time', time.time())
+        payload = json.dumps(metadata).encode('utf-8')
+        with self._lock:
+            self._started = time.monotonic_ns()
+            self._write(RECORD_SESSION, 0, payload)
+
+    def record(self, kind: int, data) -> None:
+        """
+        Append one record.
+
+        Args:
+            kind: RECORD_TX or RECORD_RX
+            data: Bytes-like payload (a memoryview of the receive buffer is written without a copy)
+        """
+        with self._lock:
+            self._write(kind, time.monotonic_ns() - self._started, data)
+
+    def _write(self, kind: int, timestamp: int, data) -> None:
+        if self._file.closed:
+            return
+        self._file.write(_RECORD.pack(kind, timestamp, len(data)))
+        self._file.write(data)
+        self._file.flush()
+        self.records += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def read_recording(path: str) -> Iterator[RecordedFrame]:
+    """
+    Yield the records of a recording in order.
+
+    A record truncated by a crash while it was being written ends the recording.
+    """
+    with open(path, 'rb') as recording:
+        if recording.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError(f"{path} is not a portal recording")
+        session = -1
+        while True:
+            header = recording.read(_RECORD.size)
+            if len(header) < _RECORD.size:
+                return
+            kind, timestamp, length = _RECORD.unpack(header)
+            data = recording.read(length)
+            if len(data) < length:
+                return
+            if kind == RECORD_SESSION:
+                session += 1
+            yield RecordedFrame(kind, timestamp / 1e9, data, max(session, 0))
+
+
+def iter_frames(records: Iterable[RecordedFrame]) -> Iterator[RecordedFrame]:
+    """
+    Re-split received bytes into frames.
+
+    Yields session and TX records unchanged and one RECORD_RX record per complete
+    response frame (without terminator), stamped with the time its last byte arrived.
+    """
+    decoder = FrameDecoder()
+    for record in records:
+        if record.kind != RECORD_RX:
+            if record.kind == RECORD_SESSION:
+                decoder.clear()
+            yield record
+            continue
+        decoder.feed(record.data)
+        frame = decoder.next_frame()
+        while frame is not None:
+            yield RecordedFrame(RECORD_RX, record.timestamp, frame, record.session)
+            frame = decoder.next_frame()
+
+
+class ReplayTransport(PortalTransport):
+    """
+    Transport that answers a driver from a recording.
+
+    Received bytes are released in recorded order. Bytes that were recorded after
+    a command are held back until the driver writes that command, then delivered
+    with the recorded delay after it, divided by speed. Commands that differ from
+    the recording are counted in mismatches and logged; the replay stays in step
+    with the recording regardless.
+    """
+
+    def __init__(self, records: Iterable[RecordedFrame], speed: float = 1.0):
+        """
+        Args:
+            records: Records to replay, e.g. read_recording(path)
+            speed: Replay speed relative to the recording (0 replays without delays)
+        """
+        super().__init__()
+        self.records = list(records)
+        self.speed = speed
+        self.mismatches = 0
+        self.commands = 0
+        self._index = 0                 # next record to deliver
+        self._next_tx = 0               # next TX record the driver's write is matched to
+        self._anchor_at = time.monotonic()
+        self._anchor_timestamp = 0.0
+        self._sent_at: Dict[int, float] = {}
+        self._pending = memoryview(b'')
+        self._closed = False
+
+    @classmethod
+    def open(cls, path: str, speed: float = 1.0) -> 'ReplayTransport':
+        """Return a transport replaying the recording at path."""
+        return cls(read_recording(path), speed)
+
+    @property
+    def finished(self) -> bool:
+        """True once every recorded byte has been delivered."""
+        return self._index >= len(self.records) and not self._pending
+
+    def _write(self, data: bytes) -> None:
+        if self._closed:
+            raise ConnectionError("Replay transport closed")
+        self.commands += 1
+        index = self._find(RECORD_TX, self._next_tx)
+        if index is None:
+            self.mismatches += 1
+            logger.warning("Replay: %r written after the end of the recording", data)
+            return
+        if self.records[index].data != data:
+            self.mismatches += 1
+            logger.warning("Replay: wrote %r where the recording has %r", data, self.records[index].data)
+        self._sent_at[index] = time.monotonic()
+        self._next_tx = index + 1
+
+    def _find(self, kind: int, start: int) -> Optional[int]:
+        for index in range(start, len(self.records)):
+            if self.records[index].kind == kind:
+                return index
+        return None
+
+    def _read_into(self, buffer: memoryview, timeout: float) -> int:
+        if self._closed:
+            raise ConnectionError("Replay transport closed")
+        if not self._pending:
+            if not self._advance(timeout):
+                return 0
+        count = min(len(buffer), len(self._pending))
+        buffer[:count] = self._pending[:count]
+        self._pending = self._pending[count:]
+        return count
+
+    def _advance(self, timeout: float) -> bool:
+        """Wait for the next received bytes to become due; False on timeout."""
+        deadline = time.monotonic() + timeout
+        while self._index < len(self.records):
+            record = self.records[self._index]
+            if record.kind == RECORD_SESSION:
+                self._anchor_at, self._anchor_timestamp = time.monotonic(), 0.0
+                self._index += 1
+            elif record.kind == RECORD_TX:
+                if self._index not in self._sent_at:
+                    # The driver has not sent this command yet: the wire is quiet
+                    self._idle(deadline)
+                    return False
+                self._anchor_at, self._anchor_timestamp = self._sent_at.pop(self._index), record.timestamp
+                self._index += 1
+            else:
+                if self.speed:
+                    due = self._anchor_at + (record.timestamp - self._anchor_timestamp) / self.speed
+                    if due > deadline:
+                        self._idle(deadline)
+                        return False
+                    self._idle(due)
+                self._pending = memoryview(record.data)
+                self._index += 1
+                return True
+        self._idle(deadline)
+        return False
+
+    def _idle(self, until: float) -> None:
+        if self.speed:
+            delay = until - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def close(self) -> None:
+        self._closed = True
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(records: Iterable[RecordedFrame]) -> Dict[str, Any]:
+    """
+    Per-command timings of a sequential (untagged) recording.
+
+    For every command name, reports how many were sent, the time from the
+    command to its Received acknowledgement and to its Completed/Error frame,
+    and the portal error codes seen.
+    """
+    sessions = 0
+    sent_bytes = received_bytes = 0
+    frames = 0
+    pending: Dict[str, float] = {}
+    acknowledged: Dict[str, List[float]] = {}
+    completed: Dict[str, List[float]] = {}
+    counts: Dict[str, int] = {}
+    errors: Dict[str, int] = {}
+
+    for record in iter_frames(records):
+        if record.kind == RECORD_SESSION:
+            sessions += 1
+            pending.clear()
+        elif record.kind == RECORD_TX:
+            sent_bytes += len(record.data)
+            name = command_name(record.data.decode('ascii', 'replace').strip())
+            counts[name] = counts.get(name, 0) + 1
+            # A move is waited on while status polls go out; keep its original send time
+            if name not in pending or name == 'GetStatus':
+                pending[name] = record.timestamp
+        else:
+            frames += 1
+            received_bytes += len(record.data) + 2
+            frame = parse_frame(record.data)
+            name = command_name(frame.command)
+            if name not in pending:
+                continue
+            elapsed = record.timestamp - pending[name]
+            if frame.kind == FRAME_RECEIVED:
+                acknowledged.setdefault(name, []).append(elapsed)
+            elif frame.kind in (FRAME_COMPLETED, FRAME_ERROR):
+                completed.setdefault(name, []).append(elapsed)
+                del pending[name]
+                if frame.kind == FRAME_ERROR:
+                    code = frame.args[0] if frame.args else '?'
+                    errors[f"{name}:{code}"] = errors.get(f"{name}:{code}", 0) + 1
+
+    commands = {}
+    for name, count in counts.items():
+        entry: Dict[str, Any] = {'count': count}
+        for label, samples in (('ack', acknowledged.get(name)), ('complete', completed.get(name))):
+            if samples:
+                entry[f'{label}_p50_ms'] = round(_percentile(samples, 0.50) * 1000, 2)
+                entry[f'{label}_max_ms'] = round(max(samples) * 1000, 2)
+        commands[name] = entry
+    return {
+        'sessions': sessions,
+        'bytes_sent': sent_bytes,
+        'bytes_received': received_bytes,
+        'frames': frames,
+        'commands': commands,
+        'errors': errors,
+    }
+
+
+def replay_parse(records: Iterable[RecordedFrame], repeat: int = 1) -> Dict[str, Any]:
+    """
+    Run the received bytes of a recording through the decoder and parser.
+
+    Args:
+        records: Recording to replay
+        repeat: Number of passes over the recording
+
+    Returns:
+        Dictionary with the frames parsed and frames per second
+    """
+    chunks = [record.data for record in records if record.kind == RECORD_RX]
+    frames = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        decoder = FrameDecoder()
+        for chunk in chunks:
+            decoder.feed(chunk)
+            frame = decoder.next_frame()
+            while frame is not None:
+                parse_frame(frame)
+                frames += 1
+                frame = decoder.next_frame()
+    elapsed = time.perf_counter() - start
+    return {
+        'frames': frames,
+        'seconds': round(elapsed, 4),
+        'frames_per_second': round(frames / elapsed) if elapsed else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and replay Automation Portal wire recordings")
+    parser.add_argument('action', choices=['summary', 'dump', 'parse'])
+    parser.add_argument('recording', help="Recording written by FrameRecorder")
+    parser.add_argument('--repeat', type=int, default=100, help="Passes over the recording (parse)")
+    parser.add_argument('--profile', action='store_true', help="Run parse under cProfile")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.recording):
+        parser.error(f"{args.recording} not found")
+    records = list(read_recording(args.recording))
+
+    if args.action == 'dump':
+        for record in iter_frames(records):
+            if record.kind == RECORD_SESSION:
+                print(f"--- session {record.session}: {record.metadata}")
+            else:
+                arrow = '>>' if record.kind == RECORD_TX else '<<'
+                print(f"{record.timestamp:12.6f} {arrow} {record.data.decode('ascii', 'replace').strip()}")
+    elif args.action == 'summary':
+        print(json.dumps(summarize(records), indent=2))
+    elif args.profile:
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        result = profiler.runcall(replay_parse, records, args.repeat)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+        print(result)
+    else:
+        print(replay_parse(records, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,708 @@
+#!/usr/bin/env python3
+"""
+Waters Automation Portal - Portal server and client
+
+The serial port can only be opened by one process. PortalServer owns the
+AutomationPortalDriver and serves its commands and status transitions to any
+number of local clients over a Unix or TCP socket, so schedulers, dashboards
+and automation_menu.py share one connection instead of fighting over COM4.
+
+Wire format: each message is a 5-byte header (codec byte, 4-byte big-endian
+payload length) followed by the payload, encoded with msgpack when the msgpack
+package is installed and compact JSON otherwise. The server answers in the
+codec of each request, so clients with and without msgpack can be mixed.
+
+    request   {"id": 7, "method": "extract_drawer", "params": {"tray_position": 1}}
+    response  {"id": 7, "result": true}   or   {"id": 7, "error": "...", "type": "..."}
+    event     {"event": "status", "previous": {...}, "current": {...}}
+
+Concurrent get_status requests that need the wire are coalesced into a single
+GetStatus exchange whose result is shared by all of them.
+
+Usage:
+    python portal_server.py --port COM4 --listen /run/portal.sock
+    python portal_server.py --host 192.168.1.100 --tcp-port 34567 --listen 127.0.0.1:34568
+    python automation_menu.py --server /run/portal.sock
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable, List, Tuple, Union
+
+try:
+    import msgpack
+except ImportError:  # optional: pip install msgpack
+    msgpack = None
+
+import config
+from automation_portal_driver import AutomationPortalDriver, AutomationPortalError
+from portal_exchange import run_exchanges, HandoffCallback
+from portal_protocol import PortalStatus
+from portal_recorder import FrameRecorder
+
+CODEC_JSON = ord('J')
+CODEC_MSGPACK = ord('M')
+
+_HEADER = struct.Struct('>BI')
+
+# Largest accepted message payload
+MAX_MESSAGE_SIZE = 1 << 20
+
+# Driver methods exposed to clients, with the parameters each accepts
+SERVER_METHODS = {
+    'ping': (),
+    'get_status': ('max_age',),
+    'cached_status': ('max_age',),
+    'initialize': (),
+    'extract_drawer': ('tray_position',),
+    'insert_drawer': ('tray_position',),
+    'exchange_drawers': ('exchanges', 'stop_on_error'),
+    'report_version': (),
+    'reset_system': (),
+    'is_drawer_present': ('max_age',),
+    'is_door_open': ('max_age',),
+    'subscribe': (),
+    'unsubscribe': (),
+}
+
+Address = Union[str, Tuple[str, int]]
+EventCallback = Callable[[Dict[str, Any]], None]
+
+
+class PortalServerError(AutomationPortalError):
+    """Raised by PortalClient when the server answers a request with an error."""
+
+    def __init__(self, message: str, error_type: str = None):
+        super().__init__(message)
+        self.error_type = error_type
+
+
+def default_codec() -> int:
+    """msgpack when installed, JSON otherwise."""
+    return CODEC_MSGPACK if msgpack is not None else CODEC_JSON
+
+
+def parse_address(address: Address) -> Tuple[int, Address]:
+    """
+    Resolve a server address.
+
+    Args:
+        address: 'host:port' or (host, port) for TCP, anything else is a Unix socket path
+
+    Returns:
+        (socket family, address)
+    """
+    if isinstance(address, tuple):
+        return socket.AF_INET, address
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and '/' not in address:
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    return socket.AF_UNIX, address
+
+
+def _encode(codec: int, message: Dict[str, Any]) -> bytes:
+    if codec == CODEC_MSGPACK:
+        payload = msgpack.packb(message, use_bin_type=True)
+    else:
+        payload = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    return _HEADER.pack(codec, len(payload)) + payload
+
+
+def _decode(codec: int, payload: bytes) -> Dict[str, Any]:
+    if codec == CODEC_MSGPACK:
+        if msgpack is None:
+            raise ValueError("msgpack message received but msgpack is not installed")
+        return msgpack.unpackb(payload, raw=False)
+    if codec == CODEC_JSON:
+        return json.loads(payload)
+    raise ValueError(f"Unknown codec {codec:#x}")
+
+
+class _MessageSocket:
+    """Length-prefixed messages over a connected stream socket."""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        if sock.family != socket.AF_UNIX:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._header = bytearray(_HEADER.size)
+        self._write_lock = threading.Lock()
+
+    def send(self, codec: int, message: Dict[str, Any]) -> None:
+        data = _encode(codec, message)
+        with self._write_lock:
+            self.sock.sendall(data)
+
+    def receive(self) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """Return (codec, message), or None when the peer closed the connection."""
+        if not self._read_exact(memoryview(self._header)):
+            return None
+        codec, length = _HEADER.unpack(self._header)
+        if length > MAX_MESSAGE_SIZE:
+            raise ValueError(f"Message of {length} bytes exceeds {MAX_MESSAGE_SIZE}")
+        payload = bytearray(length)
+        if not self._read_exact(memoryview(payload)):
+            return None
+        return codec, _decode(codec, bytes(payload))
+
+    def _read_exact(self, view: memoryview) -> bool:
+        while len(view):
+            count = self.sock.recv_into(view)
+            if not count:
+                return False
+            view = view[count:]
+        return True
+
+    def close(self) -> None:
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class _Subscription:
+    """
+    Status events for one subscriber, written by the subscriber's own thread.
+
+    The status monitor only queues events, so a subscriber that stops reading
+    cannot stall the monitor, move waits or other subscribers.
+    """
+
+    def __init__(self, client: _MessageSocket, codec: int, limit: int = None):
+        self.client = client
+        self.codec = codec
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(limit or config.PORTAL_SERVER_EVENT_QUEUE)
+        threading.Thread(target=self._run, name="PortalServer-events", daemon=True).start()
+
+    def offer(self, event: Dict[str, Any]) -> bool:
+        """Queue an event without blocking; False if the subscriber has fallen too far behind."""
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self) -> None:
+        """Stop the writer thread once queued events are sent."""
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            # The writer is stuck on a full socket: closing the socket ends it
+            pass
+
+    def _run(self) -> None:
+        while True:
+            event = self._queue.get()
+            if event is None:
+                return
+            try:
+                self.client.send(self.codec, event)
+            except OSError:
+                return
+
+
+class _SingleFlight:
+    """Run a function once for all callers that arrive while it is in flight."""
+
+    def __init__(self, func: Callable[[], Any]):
+        self.func = func
+        self.calls = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._in_flight: Optional[Future] = None
+
+    def __call__(self) -> Any:
+        with self._lock:
+            self.calls += 1
+            future = self._in_flight
+            leader = future is None
+            if leader:
+                future = self._in_flight = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(self.func())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._in_flight = None
+        return future.result()
+
+
+class PortalServer:
+    """
+    Serves one AutomationPortalDriver to many local clients.
+
+    Example:
+        driver = AutomationPortalDriver(port='COM4')
+        with PortalServer(driver, '/run/portal.sock') as server:
+            server.serve_forever()
+    """
+
+    def __init__(self, driver: AutomationPortalDriver, address: Address = None, max_workers: int = 16):
+        """
+        Args:
+            driver: Driver to serve; connected by start() if it is not connected yet
+            address: Unix socket path or 'host:port' (default config.PORTAL_SERVER_ADDRESS)
+            max_workers: Requests executed concurrently (a move does not block status reads)
+        """
+        self.driver = driver
+        self.family, self.address = parse_address(address or config.PORTAL_SERVER_ADDRESS)
+        self.max_workers = max_workers
+        self.status_poll = _SingleFlight(lambda: driver.get_status(max_age=0))
+
+        self._listener: Optional[socket.socket] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._clients: List[_MessageSocket] = []
+        self._subscribers: Dict[_MessageSocket, _Subscription] = {}
+        self._lock = threading.Lock()
+        self._unsubscribe_monitor: Optional[Callable[[], None]] = None
+        self._stopped = threading.Event()
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def client_count(self) -> int:
+        return len(self._clients)
+
+    def start(self) -> None:
+        """Connect the driver if needed, bind the socket and start accepting clients."""
+        if not self.driver.is_connected and not self.driver.connect():
+            raise AutomationPortalError("Could not connect to Automation Portal")
+
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+        self._listener = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family != socket.AF_UNIX:
+            self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(self.address)
+        self._listener.listen()
+        if self.family != socket.AF_UNIX:
+            self.address = self._listener.getsockname()[:2]
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="portal-server")
+        self._stopped.clear()
+        threading.Thread(target=self._accept, name="PortalServer-accept", daemon=True).start()
+        self.logger.info(f"Portal server listening on {self.address}")
+
+    def serve_forever(self) -> None:
+        """Block until close() is called (e.g. from a signal handler)."""
+        self._stopped.wait()
+
+    def close(self) -> None:
+        """Stop accepting, drop all clients and disconnect the driver."""
+        if self._listener is not None:
+            # shutdown() wakes the blocked accept(); close() alone leaves the socket listening
+            try:
+                self._listener.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._listener.close()
+            self._listener = None
+            if self.family == socket.AF_UNIX and os.path.exists(self.address):
+                os.unlink(self.address)
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            client.close()
+        if self._unsubscribe_monitor is not None:
+            self._unsubscribe_monitor()
+            self._unsubscribe_monitor = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self.driver.disconnect()
+        self._stopped.set()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                conn, _ = self._listener.accept()
+            except (OSError, AttributeError):
+                return
+            client = _MessageSocket(conn)
+            with self._lock:
+                self._clients.append(client)
+            threading.Thread(target=self._serve, args=(client,), name="PortalServer-client", daemon=True).start()
+
+    def _serve(self, client: _MessageSocket) -> None:
+        try:
+            while True:
+                received = client.receive()
+                if received is None:
+                    break
+                codec, request = received
+                if self._answers_inline(request):
+                    # Answered without the wire: skip the hand-off to a worker thread
+                    self._handle(client, codec, request)
+                else:
+                    self._executor.submit(self._handle, client, codec, request)
+        except (OSError, ValueError, AttributeError) as e:
+            self.logger.debug("Client connection ended: %s", e)
+        finally:
+            with self._lock:
+                if client in self._clients:
+                    self._clients.remove(client)
+                subscription = self._subscribers.pop(client, None)
+            if subscription is not None:
+                subscription.close()
+            client.close()
+
+    def _answers_inline(self, request: Dict[str, Any]) -> bool:
+        method = request.get('method')
+        if method == 'get_status':
+            params = request.get('params') or {}
+            return self.driver.cached_status(params.get('max_age')) is not None
+        return method in ('ping', 'cached_status', 'unsubscribe')
+
+    def _handle(self, client: _MessageSocket, codec: int, request: Dict[str, Any]) -> None:
+        request_id = request.get('id')
+        try:
+            reply = {'id': request_id, 'result': self._dispatch(client, codec, request)}
+        except Exception as e:
+            reply = {'id': request_id, 'error': str(e), 'type': type(e).__name__}
+        try:
+            client.send(codec, reply)
+        except OSError:
+            pass
+
+    def _dispatch(self, client: _MessageSocket, codec: int, request: Dict[str, Any]) -> Any:
+        method = request.get('method')
+        params = request.get('params') or {}
+        if method not in SERVER_METHODS:
+            raise ValueError(f"Unknown method: {method}")
+        unknown = set(params) - set(SERVER_METHODS[method])
+        if unknown:
+            raise ValueError(f"Unexpected parameters for {method}: {', '.join(sorted(unknown))}")
+
+        if method == 'ping':
+            return True
+        if method == 'get_status':
+            return self._get_status(params.get('max_age'))
+        if method == 'cached_status':
+            status = self.driver.cached_status(params.get('max_age'))
+            return status.as_dict() if status is not None else None
+        if method == 'subscribe':
+            return self._subscribe(client, codec)
+        if method == 'unsubscribe':
+            with self._lock:
+                subscription = self._subscribers.pop(client, None)
+            if subscription is not None:
+                subscription.close()
+            return True
+        return getattr(self.driver, method)(**params)
+
+    def _get_status(self, max_age: Optional[float]) -> Dict[str, Any]:
+        snapshot = self.driver.cached_status(max_age)
+        if snapshot is not None:
+            return snapshot.as_dict()
+        # Needs the wire: share one GetStatus with every request already waiting for one
+        return self.status_poll()
+
+    def _subscribe(self, client: _MessageSocket, codec: int) -> Dict[str, Any]:
+        with self._lock:
+            if client not in self._subscribers:
+                self._subscribers[client] = _Subscription(client, codec)
+            if self._unsubscribe_monitor is None:
+                monitor = self.driver.status_monitor
+                if monitor is None or not monitor.is_running:
+                    monitor = self.driver.start_status_monitor()
+                self._unsubscribe_monitor = monitor.subscribe(self._publish)
+        return self._get_status(None)
+
+    def _publish(self, previous: Dict[str, Any], current: Dict[str, Any]) -> None:
+        # Runs on the status monitor thread: only queue, never write to a socket here
+        with self._lock:
+            subscriptions = list(self._subscribers.values())
+        event = {'event': 'status', 'previous': previous, 'current': current}
+        for subscription in subscriptions:
+            if not subscription.offer(event):
+                # Dropping events would leave the subscriber with a wrong picture of the
+                # portal; disconnect it instead (its connection thread cleans up)
+                with self._lock:
+                    if self._subscribers.get(subscription.client) is not subscription:
+                        continue
+                    del self._subscribers[subscription.client]
+                self.logger.warning("Disconnecting status subscriber that stopped reading events")
+                subscription.client.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class PortalClient:
+    """
+    Client for a PortalServer with the command surface of AutomationPortalDriver.
+
+    Calls from several threads share the connection; responses are matched to
+    requests by id. Status events from subscribe() are delivered on the client's
+    reader thread.
+    """
+
+    def __init__(self, address: Address = None, codec: int = None, timeout: float = None,
+                 status_cache_ttl: float = None):
+        """
+        Args:
+            address: Unix socket path or 'host:port' (default config.PORTAL_SERVER_ADDRESS)
+            codec: CODEC_MSGPACK or CODEC_JSON (default msgpack when installed)
+            timeout: Seconds to wait for a reply to a non-move request (default config.DEFAULT_TIMEOUT)
+            status_cache_ttl: Seconds cached_status() returns the last status seen
+                (default config.STATUS_CACHE_TTL)
+        """
+        self.family, self.address = parse_address(address or config.PORTAL_SERVER_ADDRESS)
+        self.codec = codec or default_codec()
+        self.timeout = timeout or config.DEFAULT_TIMEOUT
+        self.status_cache_ttl = config.STATUS_CACHE_TTL if status_cache_ttl is None else status_cache_ttl
+        self.is_connected = False
+
+        self._connection: Optional[_MessageSocket] = None
+        self._pending: Dict[int, Future] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._subscribers: List[EventCallback] = []
+        # Last status seen and the time.monotonic() it arrived, replaced as one tuple
+        # because the reader thread updates it
+        self._status: Tuple[Optional[PortalStatus], float] = (None, 0.0)
+        self.logger = logging.getLogger(__name__)
+
+    def connect(self) -> bool:
+        """Connect to the server. Returns True if connected."""
+        try:
+            sock = socket.socket(self.family, socket.SOCK_STREAM)
+            sock.connect(self.address)
+        except OSError as e:
+            self.logger.error(f"Could not reach portal server at {self.address}: {e}")
+            return False
+        self._connection = _MessageSocket(sock)
+        self.is_connected = True
+        threading.Thread(target=self._read, name="PortalClient-reader", daemon=True).start()
+        return True
+
+    def disconnect(self) -> None:
+        """Close the connection to the server (the server keeps the portal connected)."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        self.is_connected = False
+
+    def call(self, method: str, timeout: float = None, **params) -> Any:
+        """
+        Send a request and wait for its result.
+
+        Args:
+            method: One of SERVER_METHODS
+            timeout: Seconds to wait for the reply (default: the client timeout,
+                or the move timeout for moves)
+            **params: Method parameters
+
+        Raises:
+            AutomationPortalError: If not connected or the server connection is lost
+            PortalServerError: If the server answered with an error
+            TimeoutError: If no reply arrived in time
+        """
+        connection = self._connection
+        if connection is None:
+            raise AutomationPortalError("Not connected to portal server")
+        request_id = next(self._ids)
+        future = Future()
+        with self._lock:
+            self._pending[request_id] = future
+        try:
+            connection.send(self.codec, {'id': request_id, 'method': method, 'params': params})
+            return future.result(timeout or self._timeout_for(method))
+        finally:
+            with self._lock:
+                self._pending.pop(request_id, None)
+
+    def _timeout_for(self, method: str) -> Optional[float]:
+        if method == 'exchange_drawers':
+            return None
+        if method in ('initialize', 'extract_drawer', 'insert_drawer'):
+            return float(config.PORTAL_TIMEOUTS['Initialize']) + self.timeout
+        return self.timeout
+
+    def _read(self) -> None:
+        connection = self._connection
+        error: Exception = AutomationPortalError("Portal server closed the connection")
+        try:
+            while True:
+                received = connection.receive()
+                if received is None:
+                    break
+                message = received[1]
+                if 'event' in message:
+                    self._dispatch_event(message)
+                    continue
+                with self._lock:
+                    future = self._pending.get(message.get('id'))
+                if future is None:
+                    continue
+                if 'error' in message:
+                    future.set_exception(PortalServerError(message['error'], message.get('type')))
+                else:
+                    future.set_result(message.get('result'))
+        except (OSError, ValueError) as e:
+            error = AutomationPortalError(f"Portal server connection lost: {e}")
+        self.is_connected = False
+        with self._lock:
+            pending = list(self._pending.values())
+        for future in pending:
+            if not future.done():
+                future.set_exception(error)
+
+    def _dispatch_event(self, event: Dict[str, Any]) -> None:
+        if event.get('event') == 'status':
+            self._set_status(event.get('current'))
+        for callback in list(self._subscribers):
+            try:
+                callback(event)
+            except Exception:
+                self.logger.exception("Portal event callback failed")
+
+    def subscribe(self, callback: EventCallback) -> Callable[[], None]:
+        """
+        Receive status transition events, published by the server's status monitor.
+
+        Args:
+            callback: Called as callback(event) on the client's reader thread
+
+        Returns:
+            Function that removes the callback
+        """
+        self._subscribers.append(callback)
+        self._set_status(self.call('subscribe'))
+        return lambda: self._subscribers.remove(callback)
+
+    def get_status(self, max_age: float = None) -> Dict[str, Any]:
+        try:
+            status = self.call('get_status', max_age=max_age)
+        except Exception as e:
+            self.logger.error(f"Error getting status: {e}")
+            return {'success': False, 'error': str(e)}
+        self._set_status(status)
+        return status
+
+    def _set_status(self, status: Optional[Dict[str, Any]]) -> None:
+        self._status = (_status_from_dict(status), time.monotonic())
+
+    def cached_status(self, max_age: float = None) -> Optional[PortalStatus]:
+        """
+        Return the last status seen by this client (from a read or an event), without a request.
+
+        Args:
+            max_age: Maximum status age in seconds (default status_cache_ttl)
+
+        Returns:
+            PortalStatus, or None if there is none young enough
+        """
+        if max_age is None:
+            max_age = self.status_cache_ttl
+        status, received_at = self._status
+        if status is None or time.monotonic() - received_at > max_age:
+            return None
+        return status
+
+    def _current_status(self, max_age: float = None) -> Optional[PortalStatus]:
+        return _status_from_dict(self.call('get_status', max_age=max_age))
+
+    def initialize(self) -> bool:
+        return self.call('initialize')
+
+    def extract_drawer(self, tray_position: int) -> bool:
+        if tray_position not in [0, 1]:
+            raise ValueError("Tray position must be 0 or 1")
+        return self.call('extract_drawer', tray_position=tray_position)
+
+    def insert_drawer(self, tray_position: int) -> bool:
+        if tray_position not in [0, 1]:
+            raise ValueError("Tray position must be 0 or 1")
+        return self.call('insert_drawer', tray_position=tray_position)
+
+    def exchange_drawers(self, exchanges: List[int], handoff: HandoffCallback = None,
+                         stop_on_error: bool = True) -> Dict[str, Any]:
+        """
+        Run a batch of plate exchanges.
+
+        Without a handoff the whole batch runs in the server; with one, the batch
+        runs here so the hand-off (robot or operator) happens in this process.
+        """
+        if handoff is None:
+            return self.call('exchange_drawers', exchanges=list(exchanges), stop_on_error=stop_on_error)
+        return run_exchanges(self, exchanges, handoff, stop_on_error)
+
+    def is_drawer_present(self, max_age: float = None) -> Optional[bool]:
+        return self.call('is_drawer_present', max_age=max_age)
+
+    def is_door_open(self, max_age: float = None) -> Optional[bool]:
+        return self.call('is_door_open', max_age=max_age)
+
+    def report_version(self) -> str:
+        return self.call('report_version')
+
+    def reset_system(self) -> bool:
+        return self.call('reset_system')
+
+    def __enter__(self):
+        if not self.connect():
+            raise AutomationPortalError(f"Could not reach portal server at {self.address}")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.disconnect()
+
+
+def _status_from_dict(status: Optional[Dict[str, Any]]) -> Optional[PortalStatus]:
+    if not status or 'drawer_tray_status' not in status:
+        return None
+    return PortalStatus.from_dict(status)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve one Automation Portal connection to many local clients")
+    parser.add_argument('--listen', default=config.PORTAL_SERVER_ADDRESS,
+                        help="Unix socket path or host:port to listen on")
+    parser.add_argument('--port', help="Serial port (e.g. COM4, or a simulator pty)")
+    parser.add_argument('--host', help="Portal IP address for TCP mode")
+    parser.add_argument('--tcp-port', type=int, help="Portal TCP port (selects TCP mode)")
+    parser.add_argument('--supervise', action='store_true', help="Reconnect automatically when the link drops")
+    parser.add_argument('--record', help="Append all wire traffic to this recording (see portal_recorder.py)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format=config.LOG_FORMAT)
+    comm_mode = 'tcp' if args.tcp_port or args.host else None
+    recorder = FrameRecorder(args.record) if args.record else None
+    driver = AutomationPortalDriver(port=args.port, host=args.host, tcp_port=args.tcp_port, comm_mode=comm_mode,
+                                    recorder=recorder)
+    server = PortalServer(driver, args.listen)
+    server.start()
+    if args.supervise:
+        driver.start_supervisor()
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.close())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+Waters Automation Portal - Local protocol simulator
+
+Simulates the Automation Portal PC Protocol so the driver, automation_menu.py
+flows and benchmarks can run without hardware. The simulator implements the
+system state machine (UNINIT -> OPERATIONAL -> ERROR), timed Extract/Insert
+moves with door and feeder phases, drawer bookkeeping for both tray positions,
+and the error codes in config.PORTAL_ERROR_CODES. It is served over a Linux pty
+(for the serial driver) and/or a local TCP socket, with configurable latency,
+jitter and fault injection.
+
+Movement-state names reported while a move is running (DoorOpening,
+FeederExpanding, ...) are simulator conventions; idle states match
+config.PORTAL_MOVE_STATES.
+
+Usage:
+    python portal_simulator.py --pty --tcp 34567 --time-scale 0.1
+"""
+
+import argparse
+import heapq
+import itertools
+import logging
+import os
+import random
+import re
+import socket
+import threading
+import time
+from typing import Optional, List, Tuple, Callable
+
+import config
+from portal_protocol import MOVE_COMMANDS
+
+# Command(args) with optional arguments, e.g. GetStatus, Extract(1), Extract(12,1)
+_COMMAND = re.compile(r'^([A-Za-z]+)(?:\(([^()]*)\))?$')
+
+# (move state, door status, feeder status, duration in seconds) for each phase of a move
+EXTRACT_PHASES = [
+    ('DoorOpening', 'DoorIntermediate', 'FeederFullyRetracted', 2.0),
+    ('FeederExpanding', 'DoorOpened', 'FeederIntermediate', 4.0),
+    ('PickUp', 'DoorOpened', 'FeederFullyInSM', 1.0),
+    ('FeederRetracting', 'DoorOpened', 'FeederIntermediate', 4.0),
+    ('DoorClosing', 'DoorIntermediate', 'FeederFullyRetracted', 2.0),
+]
+INSERT_PHASES = [
+    ('DoorOpening', 'DoorIntermediate', 'FeederFullyRetracted', 2.0),
+    ('FeederExpanding', 'DoorOpened', 'FeederIntermediate', 4.0),
+    ('PlaceDown', 'DoorOpened', 'FeederFullyInSM', 1.0),
+    ('FeederRetracting', 'DoorOpened', 'FeederIntermediate', 4.0),
+    ('DoorClosing', 'DoorIntermediate', 'FeederFullyRetracted', 2.0),
+]
+INITIALIZE_PHASES = [
+    ('DoorClosing', 'DoorIntermediate', 'FeederNotCalibrated', 1.0),
+    ('FeederCalibrating', 'DoorClosed', 'FeederIntermediate', 3.0),
+    ('FeederRetracting', 'DoorClosed', 'FeederIntermediate', 1.0),
+]
+
+# Error code raised by an injected fault, per move phase
+PHASE_FAULT_CODES = {
+    'DoorOpening': 10,
+    'DoorClosing': 11,
+    'FeederCalibrating': 12,
+    'FeederExpanding': 13,
+    'FeederRetracting': 14,
+    'PickUp': 21,
+    'PlaceDown': 23,
+}
+
+TRANSIENT_FAULT_CODES = config.PORTAL_TRANSIENT_ERROR_CODES
+
+
+class PortalSimulator:
+    """
+    State machine of one simulated Automation Portal.
+
+    Commands are submitted with handle_command() together with a send callback
+    for the session that issued them; response frames (including the delayed
+    Completed/Error frame of a move) are delivered through that callback.
+    """
+
+    def __init__(self,
+                 time_scale: float = 1.0,
+                 latency: float = 0.0,
+                 jitter: float = 0.0,
+                 fault_rate: float = 0.0,
+                 echo: bool = True,
+                 seed: Optional[int] = None):
+        """
+        Initialize the simulator.
+
+        Args:
+            time_scale: Multiplier applied to all move phase durations
+            latency: Fixed delay in seconds before each response frame
+            jitter: Maximum random extra delay in seconds per response frame
+            fault_rate: Probability that a command is answered with a transient error
+            echo: Echo received command lines, as the portal does
+            seed: Random seed for reproducible jitter and faults
+        """
+        self.time_scale = time_scale
+        self.latency = latency
+        self.jitter = jitter
+        self.fault_rate = fault_rate
+        self.echo = echo
+        self.random = random.Random(seed)
+
+        self.system_mode = 'UNINIT'
+        self.move_command = 'NoMoveCmd'
+        self.move_state = 'Idle'
+        self.door_status = 'DoorClosed'
+        self.feeder_status = 'FeederNotCalibrated'
+        self.portal_drawer = 'NoDrawerNoTray'
+        self.sm_positions = {0: 'DrawerAndTray', 1: 'DrawerAndTray'}
+        self.ip_address = '172:16:0:4'
+        self.mac_address = '00:00:C4:06:01:67'
+        self.version = 'SIM-1.0.0'
+
+        self.command_count = 0
+        self._sequence = 0
+        self._injected_faults: List[Tuple[str, int]] = []
+        self._lock = threading.RLock()
+        self._move_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.logger = logging.getLogger(__name__)
+
+    # Fault injection
+
+    def inject_fault(self, code: int, phase: str = None) -> None:
+        """
+        Make the next move fail with the given error code.
+
+        Args:
+            code: Error code from config.PORTAL_ERROR_CODES
+            phase: Move phase at which to fail (default: first phase of the move)
+        """
+        with self._lock:
+            self._injected_faults.append((phase, code))
+
+    def stop(self) -> None:
+        """Abort any running move."""
+        self._stop.set()
+
+    # Protocol
+
+    def _next_sequence(self, requested: Optional[int]) -> int:
+        if requested is not None:
+            return requested
+        self._sequence = (self._sequence % config.PORTAL_COMM_SETTINGS['SEQUENCE_NUMBER_MAX']) + 1
+        return self._sequence
+
+    def status_frame(self, seq: int) -> str:
+        """Build the Completed frame for GetStatus."""
+        return (f"Completed({seq},GetStatus,{self.system_mode},{self.move_command},{self.move_state},"
+                f"{self.portal_drawer},{self.door_status},{self.feeder_status},{self.ip_address},{self.mac_address})")
+
+    def handle_command(self, line: str, send: Callable[[str], None]) -> None:
+        """
+        Process one command line and emit its response frames.
+
+        Args:
+            line: Command text without terminator
+            send: Callback that delivers a frame to the issuing session
+        """
+        with self._lock:
+            self.command_count += 1
+            if self.echo:
+                send(line)
+
+            if len(line) > config.PORTAL_COMM_SETTINGS['MAX_COMMAND_LENGTH']:
+                send(f"Error(0,{line[:16]},4)")
+                return
+
+            match = _COMMAND.match(line.strip())
+            if match is None:
+                send(f"Error(0,{line.strip()[:32]},1)")
+                return
+            name, arg_text = match.groups()
+            args = [a.strip() for a in arg_text.split(',')] if arg_text else []
+
+            # Extract/Insert take a tray argument; any extra leading argument is a sequence number
+            requested = None
+            takes_tray = name in ('Extract', 'Insert')
+            if len(args) > (1 if takes_tray else 0):
+                seq_field = args.pop(0)
+                if not seq_field.isdigit():
+                    send(f"Error(0,{name},1)")
+                    return
+                requested = int(seq_field)
+                if requested < config.PORTAL_COMM_SETTINGS['SEQUENCE_NUMBER_MIN']:
+                    send(f"Error({requested},{name},2)")
+                    return
+                if requested > config.PORTAL_COMM_SETTINGS['SEQUENCE_NUMBER_MAX']:
+                    send(f"Error({requested},{name},3)")
+                    return
+            seq = self._next_sequence(requested)
+            command = f"{name}({args[0]})" if takes_tray and args else name
+
+            send(f"\tReceived({seq},{command})")
+
+            if self.fault_rate and self.random.random() < self.fault_rate:
+                send(f"\tError({seq},{command},{self.random.choice(TRANSIENT_FAULT_CODES)})")
+                return
+
+            if name == 'GetStatus':
+                send("\t" + self.status_frame(seq))
+            elif name == 'ReportVersion':
+                send(f"\tCompleted({seq},ReportVersion,{self.version})")
+            elif name == 'ResetSystem':
+                self._stop.set()
+                self.system_mode = 'UNINIT'
+                self.move_command = 'NoMoveCmd'
+                self.move_state = 'Idle'
+                self.feeder_status = 'FeederNotCalibrated'
+                send(f"\tCompleted({seq},ResetSystem)")
+            elif name in MOVE_COMMANDS:
+                self._start_move(name, command, args, seq, send)
+            else:
+                send(f"\tError({seq},{command},1)")
+
+    def _start_move(self, name: str, command: str, args: List[str], seq: int, send: Callable[[str], None]) -> None:
+        if self.move_state != 'Idle':
+            send(f"\tError({seq},{command},7)")
+            return
+
+        if name == 'Initialize':
+            phases = INITIALIZE_PHASES
+            tray = None
+        else:
+            if self.system_mode != 'OPERATIONAL':
+                send(f"\tError({seq},{command},8)")
+                return
+            if not args or not args[0].isdigit() or int(args[0]) not in config.PORTAL_VALIDATION['TRAY_POSITIONS']:
+                send(f"\tError({seq},{command},15)")
+                return
+            tray = int(args[0])
+            if name == 'Extract':
+                if self.sm_positions[tray] == 'NoDrawerNoTray':
+                    send(f"\tError({seq},{command},28)")
+                    return
+                if self.portal_drawer != 'NoDrawerNoTray':
+                    send(f"\tError({seq},{command},{19 if self.portal_drawer == 'DrawerAndTray' else 20})")
+                    return
+                phases = EXTRACT_PHASES
+            else:
+                if self.sm_positions[tray] != 'NoDrawerNoTray':
+                    send(f"\tError({seq},{command},27)")
+                    return
+                if self.portal_drawer == 'NoDrawerNoTray':
+                    send(f"\tError({seq},{command},22)")
+                    return
+                phases = INSERT_PHASES
+
+        fault = self._injected_faults.pop(0) if self._injected_faults else None
+        self.move_command = command
+        self.move_state = phases[0][0]
+        self._stop.clear()
+        self._move_thread = threading.Thread(
+            target=self._run_move, args=(name, command, tray, phases, fault, seq, send),
+            name=f"PortalSimulator-{command}", daemon=True
+        )
+        self._move_thread.start()
+
+    def _run_move(self, name: str, command: str, tray: Optional[int], phases, fault, seq: int,
+                  send: Callable[[str], None]) -> None:
+        for move_state, door, feeder, duration in phases:
+            with self._lock:
+                self.move_state = move_state
+                self.door_status = door
+                self.feeder_status = feeder
+                if fault is not None and fault[0] in (None, move_state):
+                    self.system_mode = 'ERROR'
+                    self.move_state = 'Idle'
+                    send(f"\tError({seq},{command},{fault[1]})")
+                    return
+                if move_state == 'PickUp':
+                    self.portal_drawer, self.sm_positions[tray] = self.sm_positions[tray], 'NoDrawerNoTray'
+                elif move_state == 'PlaceDown':
+                    self.sm_positions[tray], self.portal_drawer = self.portal_drawer, 'NoDrawerNoTray'
+
+            if self._stop.wait(duration * self.time_scale):
+                return
+
+        with self._lock:
+            self.move_state = 'Idle'
+            self.door_status = 'DoorClosed'
+            self.feeder_status = 'FeederFullyRetracted'
+            if name == 'Initialize':
+                self.system_mode = 'OPERATIONAL'
+            send(f"\tCompleted({seq},{command})")
+
+
+class _Session:
+    """One client connection: delivers frames in order after the configured latency."""
+
+    def __init__(self, simulator: PortalSimulator, write: Callable[[bytes], None]):
+        self.simulator = simulator
+        self.write = write
+        self._queue: List[Tuple[float, int, bytes]] = []
+        self._counter = itertools.count()
+        self._last_due = 0.0
+        self._ready = threading.Condition()
+        self._closed = False
+        self._buffer = b''
+        threading.Thread(target=self._writer, name="PortalSimulator-writer", daemon=True).start()
+
+    def send(self, frame: str) -> None:
+        delay = self.simulator.latency
+        if self.simulator.jitter:
+            delay += self.simulator.random.uniform(0, self.simulator.jitter)
+        with self._ready:
+            # Frames never overtake each other
+            due = max(time.monotonic() + delay, self._last_due)
+            self._last_due = due
+            heapq.heappush(self._queue, (due, next(self._counter), (frame + config.RESPONSE_TERMINATOR).encode('utf-8')))
+            self._ready.notify()
+
+    def feed(self, data: bytes) -> None:
+        self._buffer += data
+        while True:
+            end = self._buffer.find(config.COMMAND_TERMINATOR.encode('utf-8'))
+            if end < 0:
+                return
+            line, self._buffer = self._buffer[:end], self._buffer[end + 1:]
+            text = line.decode('utf-8', errors='replace').strip('\n')
+            if text:
+                self.simulator.handle_command(text, self.send)
+
+    def close(self) -> None:
+        with self._ready:
+            self._closed = True
+            self._ready.notify()
+
+    def _writer(self) -> None:
+        while True:
+            with self._ready:
+                while not self._closed and (not self._queue or self._queue[0][0] > time.monotonic()):
+                    self._ready.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                if self._closed:
+                    return
+                _, _, data = heapq.heappop(self._queue)
+            try:
+                self.write(data)
+            except OSError:
+                return
+
+
+class TcpSimulatorServer:
+    """Serve a PortalSimulator on a local TCP socket."""
+
+    def __init__(self, simulator: PortalSimulator, host: str = '127.0.0.1', port: int = 0):
+        self.simulator = simulator
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen()
+        self.host, self.port = self.sock.getsockname()[:2]
+        self._connections: List[socket.socket] = []
+        threading.Thread(target=self._accept, name="PortalSimulator-tcp", daemon=True).start()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._connections.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: socket.socket) -> None:
+        session = _Session(self.simulator, conn.sendall)
+        try:
+            while True:
+                data = conn.recv(config.DATA_BUFFER_SIZE)
+                if not data:
+                    break
+                session.feed(data)
+        except OSError:
+            pass
+        finally:
+            session.close()
+            conn.close()
+
+    def close(self) -> None:
+        """Stop accepting and drop all client connections."""
+        # shutdown() wakes the blocked accept(); close() alone leaves the port listening
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        for conn in self._connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+                conn.close()
+            except OSError:
+                pass
+
+
+class PtySimulatorServer:
+    """Serve a PortalSimulator on a Linux pseudo-terminal for the serial driver."""
+
+    def __init__(self, simulator: PortalSimulator):
+        import tty
+        self.simulator = simulator
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        self.port_name = os.ttyname(self.slave_fd)
+        self._session = _Session(simulator, self._write)
+        threading.Thread(target=self._serve, name="PortalSimulator-pty", daemon=True).start()
+
+    def _write(self, data: bytes) -> None:
+        os.write(self.master_fd, data)
+
+    def _serve(self) -> None:
+        while True:
+            try:
+                data = os.read(self.master_fd, config.DATA_BUFFER_SIZE)
+            except OSError:
+                break
+            if not data:
+                break
+            self._session.feed(data)
+        self._session.close()
+
+    def close(self) -> None:
+        """Close the pseudo-terminal."""
+        self._session.close()
+        for fd in (self.master_fd, self.slave_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Waters Automation Portal protocol simulator")
+    parser.add_argument('--pty', action='store_true', help="Serve on a pseudo-terminal")
+    parser.add_argument('--tcp', type=int, metavar='PORT', help="Serve on a local TCP port")
+    parser.add_argument('--host', default='127.0.0.1', help="TCP bind address")
+    parser.add_argument('--time-scale', type=float, default=1.0, help="Move duration multiplier")
+    parser.add_argument('--latency', type=float, default=0.0, help="Response latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Maximum extra random latency in seconds")
+    parser.add_argument('--fault-rate', type=float, default=0.0, help="Probability of a transient error per command")
+    parser.add_argument('--operational', action='store_true', help="Start initialized instead of UNINIT")
+    parser.add_argument('--seed', type=int, help="Random seed")
+    args = parser.parse_args()
+
+    if not args.pty and args.tcp is None:
+        parser.error("choose --pty and/or --tcp PORT")
+
+    logging.basicConfig(level=logging.INFO, format=config.LOG_FORMAT)
+    simulator = PortalSimulator(args.time_scale, args.latency, args.jitter, args.fault_rate, seed=args.seed)
+    if args.operational:
+        simulator.system_mode = 'OPERATIONAL'
+        simulator.feeder_status = 'FeederFullyRetracted'
+
+    if args.pty:
+        pty_server = PtySimulatorServer(simulator)
+        print(f"Serial (pty): {pty_server.port_name}")
+    if args.tcp is not None:
+        tcp_server = TcpSimulatorServer(simulator, args.host, args.tcp)
+        print(f"TCP: {tcp_server.host}:{tcp_server.port}")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Waters Automation Portal - Background status monitor
+
+A single background poller that owns all GetStatus traffic for a driver and
+publishes parsed state transitions to subscribers. Move commands wait on the
+monitor's condition instead of running their own poll-and-sleep loops, and the
+poll rate adapts: faster while a move is in progress (every 0.5 s, like the fixed
+loop it replaces, or on the driver's timing policy schedule), slow while the
+portal is idle.
+Every poll is also passed to a MoveAnalytics, which times the phases of each move.
+"""
+
+import logging
+import threading
+import time
+from typing import Optional, Dict, Any, Callable, List
+
+from portal_protocol import PortalResponse, status_dict, move_result, IDLE_MOVE_STATES
+from portal_move_analytics import MoveAnalytics
+
+# Status fields whose change is published as a transition
+STATE_FIELDS = ('system_state', 'mode', 'status', 'drawer_tray_status', 'door_status', 'feeder_status')
+
+StatusCallback = Callable[[Dict[str, Any], Dict[str, Any]], None]
+
+
+class PortalStatusMonitor:
+    """
+    Background GetStatus poller with publish/subscribe of state transitions.
+
+    Subscribers are called from the monitor thread as callback(previous, current)
+    whenever one of STATE_FIELDS changes.
+    """
+
+    def __init__(self, driver, idle_interval: float = 2.0, moving_interval: Optional[float] = 0.5,
+                 analytics: MoveAnalytics = None):
+        """
+        Initialize the status monitor.
+
+        Args:
+            driver: Connected AutomationPortalDriver used for GetStatus
+            idle_interval: Poll interval in seconds while the portal is idle
+            moving_interval: Poll interval in seconds while a move is in progress, or None
+                to follow the driver's timing_policy schedule for the move (fewest polls,
+                but phases are only timed where consecutive polls are close together)
+            analytics: Receives every poll to time move phases (default: a new MoveAnalytics)
+        """
+        self.driver = driver
+        self.idle_interval = idle_interval
+        self.moving_interval = moving_interval
+        self.analytics = analytics if analytics is not None else MoveAnalytics()
+
+        self.latest: Dict[str, Any] = {}
+        self.latest_response = PortalResponse("GetStatus")
+        self.latest_polled_at = 0.0
+        self.poll_count = 0
+
+        self._subscribers: List[StatusCallback] = []
+        self._condition = threading.Condition()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._active_moves = 0
+        self._move_sent_until = 0.0
+        self._move_command: Optional[str] = None
+        self._move_started = 0.0
+        self._policy_interval: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def is_running(self) -> bool:
+        """True while the monitor thread is alive."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start the monitor thread."""
+        if self.is_running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="PortalStatusMonitor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the monitor thread and wait for it to exit."""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def subscribe(self, callback: StatusCallback) -> Callable[[], None]:
+        """
+        Register a callback for state transitions.
+
+        Args:
+            callback: Called as callback(previous, current) on each transition
+
+        Returns:
+            Function that removes the subscription
+        """
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def move_sent(self, command: str, hold: float) -> None:
+        """
+        Poll at the moving interval from now on, because a move command is being written.
+
+        The first poll queues for the wire, so the move's exchange hands the wire
+        over right after the acknowledgement instead of reading on until its read
+        timeout; wait_for_move() keeps the fast interval once it is called.
+
+        Args:
+            command: Move command being written
+            hold: Seconds to keep the moving interval if wait_for_move() is never
+                called (e.g. the move command was rejected)
+        """
+        with self._condition:
+            now = time.monotonic()
+            self._move_sent_until = now + hold
+            self._move_command, self._move_started = command, now
+            self._policy_interval = None
+        self._wakeup.set()
+
+    def wait_for_move(self, command: str, timeout: float) -> Optional[bool]:
+        """
+        Block until a move command completes or fails.
+
+        Only status requested after this call is considered, so a snapshot taken
+        before the move command was sent cannot end the wait.
+
+        Args:
+            command: Move command being waited on ('Initialize', 'Extract', 'Insert')
+            timeout: Maximum time to wait in seconds
+
+        Returns:
+            True if completed, False if failed, None on timeout
+        """
+        since = time.monotonic()
+        deadline = since + timeout
+        with self._condition:
+            self._active_moves += 1
+            if self._move_command is None:
+                self._move_command, self._move_started = command, since
+        self._wakeup.set()
+
+        try:
+            with self._condition:
+                while True:
+                    if self.latest_polled_at > since:
+                        result = move_result(self.latest_response, command)
+                        if result is not None:
+                            return result
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self.is_running:
+                        return None
+                    self._condition.wait(remaining)
+        finally:
+            with self._condition:
+                self._active_moves -= 1
+
+    def _is_moving(self) -> bool:
+        status = self.latest.get('status', 'Unknown')
+        return (self._active_moves > 0 or time.monotonic() < self._move_sent_until
+                or (status != 'Unknown' and status not in IDLE_MOVE_STATES))
+
+    def _next_interval(self) -> float:
+        if not self._is_moving():
+            self._move_command, self._policy_interval = None, None
+            return self.idle_interval
+        if self.moving_interval is not None:
+            return self.moving_interval
+        policy = self.driver.timing_policy
+        if self._move_command is None:
+            return policy.initial_interval
+        self._policy_interval = policy.next_interval(
+            self._move_command, time.monotonic() - self._move_started, self._policy_interval)
+        return self._policy_interval
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                polled_at = time.monotonic()
+                response = self.driver._exchange("GetStatus")
+                self._publish(response, status_dict(response), polled_at)
+            except Exception as e:
+                self.logger.warning(f"Status poll failed: {e}")
+
+            self._wakeup.wait(self._next_interval())
+            self._wakeup.clear()
+
+        with self._condition:
+            self._condition.notify_all()
+
+    def _publish(self, response: PortalResponse, status: Dict[str, Any], polled_at: float) -> None:
+        with self._condition:
+            previous = self.latest
+            self.latest = status
+            self.latest_response = response
+            self.latest_polled_at = polled_at
+            self.poll_count += 1
+            self._condition.notify_all()
+
+        self.analytics.observe(status, polled_at)
+
+        if any(previous.get(field) != status.get(field) for field in STATE_FIELDS):
+            for callback in list(self._subscribers):
+                try:
+                    callback(previous, status)
+                except Exception as e:
+                    self.logger.error(f"Status subscriber failed: {e}")
@@ -0,0 +1,190 @@
+"""
+Waters Automation Portal - Connection health supervisor
+
+Keeps a driver's link to the portal alive through long unattended sessions.
+Dead links are detected from I/O errors reported by the driver and from
+unanswered heartbeat GetStatus commands sent while the link is otherwise idle.
+The supervisor then reconnects with jittered exponential backoff and re-syncs
+the portal (GetStatus, plus Initialize only when it came back UNINIT) before
+releasing callers. Commands issued while the link is down wait for it to come
+back instead of failing, so a move being waited on resumes transparently.
+"""
+
+import logging
+import random
+import threading
+import time
+from typing import Optional
+
+import config
+from portal_wire_lock import PRIORITY_LINK
+
+
+class PortalConnectionSupervisor:
+    """
+    Background heartbeat and reconnect loop for one AutomationPortalDriver.
+
+    Started with AutomationPortalDriver.start_supervisor(); the driver reports
+    link failures through report_failure() and waits on wait_connected().
+    """
+
+    def __init__(self, driver,
+                 heartbeat_interval: float = None,
+                 max_missed: int = None,
+                 backoff_initial: float = None,
+                 backoff_max: float = None,
+                 resume_timeout: float = None,
+                 seed: Optional[int] = None):
+        """
+        Initialize the supervisor.
+
+        Args:
+            driver: AutomationPortalDriver to supervise
+            heartbeat_interval: Idle seconds before a heartbeat (default config.HEARTBEAT_INTERVAL)
+            max_missed: Unanswered heartbeats before reconnecting (default config.HEARTBEAT_MAX_MISSED)
+            backoff_initial: First reconnect delay in seconds (default config.RECONNECT_BACKOFF_INITIAL)
+            backoff_max: Longest reconnect delay in seconds (default config.RECONNECT_BACKOFF_MAX)
+            resume_timeout: How long commands wait for the link (default config.RECONNECT_RESUME_TIMEOUT)
+            seed: Random seed for the backoff jitter
+        """
+        self.driver = driver
+        self.heartbeat_interval = heartbeat_interval or config.HEARTBEAT_INTERVAL
+        self.max_missed = max_missed or config.HEARTBEAT_MAX_MISSED
+        self.backoff_initial = backoff_initial or config.RECONNECT_BACKOFF_INITIAL
+        self.backoff_max = backoff_max or config.RECONNECT_BACKOFF_MAX
+        self.resume_timeout = resume_timeout or config.RECONNECT_RESUME_TIMEOUT
+        self.random = random.Random(seed)
+
+        self.reconnect_count = 0
+        self.failure_count = 0
+        self.last_error: Optional[Exception] = None
+        self.missed_heartbeats = 0
+
+        self._link_up = threading.Event()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def is_running(self) -> bool:
+        """True while the supervisor thread is alive."""
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def link_up(self) -> bool:
+        """True when the link is connected and re-synced."""
+        return self._link_up.is_set()
+
+    def in_supervisor_thread(self) -> bool:
+        """True when called from the supervisor's own thread (heartbeat or re-sync)."""
+        return threading.current_thread() is self._thread
+
+    def start(self) -> None:
+        """Start the supervisor thread; reconnects first if the driver is not connected."""
+        if self.is_running:
+            return
+        self._stop.clear()
+        if self.driver.is_connected:
+            self._link_up.set()
+        else:
+            self._link_up.clear()
+        self._thread = threading.Thread(target=self._run, name="PortalConnectionSupervisor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the supervisor thread and release any waiting callers."""
+        self._stop.set()
+        self._wakeup.set()
+        # Waiters re-check driver.is_connected and fail normally
+        self._link_up.set()
+        if self._thread is not None and not self.in_supervisor_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def report_failure(self, error: Exception) -> None:
+        """Mark the link as dead and wake the supervisor to reconnect."""
+        if self._stop.is_set() or not self._link_up.is_set():
+            return
+        self.failure_count += 1
+        self.last_error = error
+        self.logger.warning(f"Portal link failed: {error}")
+        self._link_up.clear()
+        self._wakeup.set()
+
+    def wait_connected(self, timeout: float = None) -> bool:
+        """
+        Wait until the link is connected and re-synced.
+
+        Args:
+            timeout: Maximum wait in seconds (default resume_timeout)
+
+        Returns:
+            True if the link is up
+        """
+        return self._link_up.wait(self.resume_timeout if timeout is None else timeout)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if not self._link_up.is_set():
+                self._reconnect()
+                continue
+
+            self._wakeup.wait(self.heartbeat_interval)
+            self._wakeup.clear()
+            if self._stop.is_set() or not self._link_up.is_set():
+                continue
+
+            # Regular traffic already proves the link is alive
+            if time.monotonic() - self.driver.last_exchange_at >= self.heartbeat_interval:
+                self._heartbeat()
+
+    def _heartbeat(self) -> None:
+        try:
+            response = self.driver._exchange("GetStatus", retries=0)
+        except Exception as e:
+            # I/O errors were already reported by the driver
+            self.logger.debug(f"Heartbeat failed: {e}")
+            return
+
+        if response.terminal is not None:
+            self.missed_heartbeats = 0
+            return
+        self.missed_heartbeats += 1
+        self.logger.warning(f"Heartbeat unanswered ({self.missed_heartbeats}/{self.max_missed})")
+        if self.missed_heartbeats >= self.max_missed:
+            self.report_failure(TimeoutError(f"{self.missed_heartbeats} heartbeats unanswered"))
+
+    def _reconnect(self) -> None:
+        attempt = 0
+        while not self._stop.is_set():
+            with self.driver._io_lock.hold(PRIORITY_LINK):
+                self.driver._close_link()
+                connected = self.driver.connect()
+            if connected and self._resync():
+                self.reconnect_count += 1
+                self.missed_heartbeats = 0
+                self.logger.info(f"Portal link restored (reconnect #{self.reconnect_count})")
+                self._link_up.set()
+                return
+
+            # Jittered exponential backoff: between half and all of the nominal delay
+            delay = min(self.backoff_initial * (2 ** attempt), self.backoff_max)
+            delay *= self.random.uniform(0.5, 1.0)
+            attempt += 1
+            self.logger.warning(f"Reconnect attempt {attempt} failed, retrying in {delay:.2f}s")
+            self._stop.wait(delay)
+
+    def _resync(self) -> bool:
+        """Read the portal state after a reconnect; Initialize only if it restarted."""
+        try:
+            status = self.driver._exchange("GetStatus").status
+            if status is None:
+                return False
+            if status.system_state == 'UNINIT':
+                self.logger.info("Portal came back UNINIT, initializing")
+                return self.driver.initialize()
+            return True
+        except Exception as e:
+            self.logger.warning(f"Re-sync failed: {e}")
+            return False
@@ -0,0 +1,344 @@
+"""
+Waters Automation Portal - Command telemetry
+
+Per-command spans emitted by the drivers to pluggable sinks. A span records the
+command, its sequence number, bytes on the wire, wire latency (first response
+frame), time to the Completed/Error frame (for moves: to the end of the move),
+retry count and portal error code.
+
+Sinks:
+    HistogramSink   - in-memory latency histograms and counters per command
+    JsonlSink       - one JSON object per span appended to a file
+    PrometheusSink  - HistogramSink rendered in the Prometheus text format,
+                      optionally written to a node_exporter textfile
+
+Telemetry is off unless a Telemetry instance is passed to the driver; with no
+sinks, no spans are built.
+"""
+
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from typing import Optional, Dict, Any, List, Iterable
+
+from portal_protocol import PortalResponse, command_name, MOVE_COMMANDS
+
+# Span outcomes
+OUTCOME_OK = 'ok'
+OUTCOME_ERROR = 'error'
+OUTCOME_TIMEOUT = 'timeout'
+OUTCOME_EXCEPTION = 'exception'
+OUTCOME_PENDING = 'pending'
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class CommandSpan:
+    """Telemetry record of one command exchange."""
+
+    __slots__ = ('command', 'sequence', 'timestamp', 'bytes_sent', 'bytes_received',
+                 'wire_latency', 'completion_time', 'retries', 'error_code', 'outcome')
+
+    def __init__(self, command: str, sequence: Optional[int], bytes_sent: int, bytes_received: int,
+                 wire_latency: Optional[float], completion_time: Optional[float], retries: int,
+                 error_code: Optional[int], outcome: str):
+        self.command = command
+        self.sequence = sequence
+        self.timestamp = time.time()
+        self.bytes_sent = bytes_sent
+        self.bytes_received = bytes_received
+        self.wire_latency = wire_latency
+        self.completion_time = completion_time
+        self.retries = retries
+        self.error_code = error_code
+        self.outcome = outcome
+
+    @property
+    def name(self) -> str:
+        return command_name(self.command)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"CommandSpan({self.command!r}, outcome={self.outcome!r}, completion_time={self.completion_time})"
+
+
+def build_span(command: str, response: Optional[PortalResponse], sent_at: float, retries: int,
+               bytes_sent: int) -> CommandSpan:
+    """
+    Build a span from a finished exchange.
+
+    Args:
+        command: Command string that was sent
+        response: Response of the final attempt, or None if it raised
+        sent_at: time.monotonic() when the final attempt was written
+        retries: Number of resends before the final attempt
+        bytes_sent: Bytes written to the transport over all attempts, sequence
+            tags and terminators included
+
+    Returns:
+        CommandSpan; a move that was only acknowledged has outcome 'pending'
+    """
+    if response is None:
+        return CommandSpan(command, None, bytes_sent, 0, None, None, retries, None, OUTCOME_EXCEPTION)
+
+    terminal = response.terminal
+    error = response.error_info
+    if response.completed:
+        outcome = OUTCOME_OK
+    elif error is not None:
+        outcome = OUTCOME_ERROR
+    elif command_name(command) in MOVE_COMMANDS:
+        outcome = OUTCOME_PENDING
+    else:
+        outcome = OUTCOME_TIMEOUT
+
+    sequence = terminal.sequence if terminal is not None else next(
+        (frame.sequence for frame in response.frames if frame.sequence is not None), None)
+    return CommandSpan(
+        command, sequence, bytes_sent,
+        sum(len(frame.data) + 2 for frame in response.frames),
+        response.first_frame_at - sent_at if response.first_frame_at is not None else None,
+        response.terminal_at - sent_at if response.terminal_at is not None else None,
+        retries,
+        error.code if error is not None else None,
+        outcome)
+
+
+def complete_move_span(span: CommandSpan, result: Optional[bool], response: Optional[PortalResponse],
+                       started: float) -> CommandSpan:
+    """
+    Close the span of a move once the move has finished.
+
+    Args:
+        span: Pending span returned by build_span() for the move command
+        result: True if the move completed, False if it failed, None on timeout
+        response: Last response seen while waiting (may carry the move's Error frame)
+        started: time.monotonic() when the move command was sent
+    """
+    span.completion_time = time.monotonic() - started
+    span.outcome = OUTCOME_OK if result is True else OUTCOME_ERROR if result is False else OUTCOME_TIMEOUT
+    error = response.error_info if response is not None else None
+    if error is not None:
+        span.error_code = error.code
+    return span
+
+
+class TelemetrySink:
+    """Base class for span sinks."""
+
+    def emit(self, span: CommandSpan) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class Telemetry:
+    """
+    Fan-out of command spans to sinks.
+
+    Example:
+        histogram = HistogramSink()
+        driver = AutomationPortalDriver(port='COM4', telemetry=Telemetry([histogram, JsonlSink('spans.jsonl')]))
+        ...
+        print(histogram.summary())
+    """
+
+    def __init__(self, sinks: Iterable[TelemetrySink] = ()):
+        self.sinks: List[TelemetrySink] = list(sinks)
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.sinks)
+
+    def add_sink(self, sink: TelemetrySink) -> None:
+        self.sinks.append(sink)
+
+    def remove_sink(self, sink: TelemetrySink) -> None:
+        self.sinks.remove(sink)
+
+    def emit(self, span: CommandSpan) -> None:
+        """Send a span to every sink; a failing sink never breaks the command."""
+        for sink in self.sinks:
+            try:
+                sink.emit(span)
+            except Exception:
+                self.logger.exception("Telemetry sink %r failed", sink)
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
+
+    def __len__(self) -> int:
+        return len(self.sinks)
+
+
+class _CommandHistogram:
+    __slots__ = ('bucket_counts', 'count', 'total', 'outcomes', 'errors', 'retries', 'bytes_sent', 'bytes_received')
+
+    def __init__(self, bucket_count: int):
+        self.bucket_counts = [0] * (bucket_count + 1)   # last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.outcomes: Dict[str, int] = {}
+        self.errors: Dict[int, int] = {}
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+
+class HistogramSink(TelemetrySink):
+    """In-memory time-to-Completed histograms and counters, keyed by command name."""
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.commands: Dict[str, _CommandHistogram] = {}
+        self._lock = threading.Lock()
+
+    def emit(self, span: CommandSpan) -> None:
+        name = span.name
+        with self._lock:
+            histogram = self.commands.get(name)
+            if histogram is None:
+                histogram = self.commands[name] = _CommandHistogram(len(self.buckets))
+            histogram.outcomes[span.outcome] = histogram.outcomes.get(span.outcome, 0) + 1
+            histogram.retries += span.retries
+            histogram.bytes_sent += span.bytes_sent
+            histogram.bytes_received += span.bytes_received
+            if span.error_code is not None:
+                histogram.errors[span.error_code] = histogram.errors.get(span.error_code, 0) + 1
+            if span.completion_time is not None:
+                histogram.bucket_counts[bisect.bisect_left(self.buckets, span.completion_time)] += 1
+                histogram.count += 1
+                histogram.total += span.completion_time
+
+    def quantile(self, command: str, q: float) -> Optional[float]:
+        """
+        Estimate a completion-time quantile from the histogram.
+
+        Returns:
+            Upper bound of the bucket holding the quantile, or None without data
+        """
+        histogram = self.commands.get(command_name(command))
+        if histogram is None or histogram.count == 0:
+            return None
+        rank = q * histogram.count
+        seen = 0
+        for index, count in enumerate(histogram.bucket_counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Per-command count, mean and p50/p99 completion time, outcomes, errors and retries."""
+        with self._lock:
+            return {
+                name: {
+                    'count': histogram.count,
+                    'mean': histogram.total / histogram.count if histogram.count else None,
+                    'p50': self.quantile(name, 0.5),
+                    'p99': self.quantile(name, 0.99),
+                    'outcomes': dict(histogram.outcomes),
+                    'errors': dict(histogram.errors),
+                    'retries': histogram.retries,
+                }
+                for name, histogram in self.commands.items()
+            }
+
+
+class PrometheusSink(HistogramSink):
+    """
+    HistogramSink exposed in the Prometheus text exposition format.
+
+    Serve render() from an HTTP endpoint, or pass textfile_path to have the
+    metrics written (atomically, at most every flush_interval seconds) for the
+    node_exporter textfile collector.
+    """
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS, prefix: str = 'portal',
+                 textfile_path: str = None, flush_interval: float = 10.0):
+        super().__init__(buckets)
+        self.prefix = prefix
+        self.textfile_path = textfile_path
+        self.flush_interval = flush_interval
+        self._flushed_at = 0.0
+
+    def emit(self, span: CommandSpan) -> None:
+        super().emit(span)
+        if self.textfile_path and time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.write_textfile()
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text format."""
+        p = self.prefix
+        lines = [
+            f"# HELP {p}_command_duration_seconds Time from sending a command to its Completed/Error frame",
+            f"# TYPE {p}_command_duration_seconds histogram",
+        ]
+        with self._lock:
+            commands = sorted(self.commands.items())
+            for name, histogram in commands:
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), histogram.bucket_counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{p}_command_duration_seconds_bucket{{command="{name}",le="{le}"}} {cumulative}')
+                lines.append(f'{p}_command_duration_seconds_sum{{command="{name}"}} {histogram.total}')
+                lines.append(f'{p}_command_duration_seconds_count{{command="{name}"}} {histogram.count}')
+
+            lines.append(f"# TYPE {p}_commands_total counter")
+            for name, histogram in commands:
+                for outcome, count in sorted(histogram.outcomes.items()):
+                    lines.append(f'{p}_commands_total{{command="{name}",outcome="{outcome}"}} {count}')
+
+            lines.append(f"# TYPE {p}_command_errors_total counter")
+            for name, histogram in commands:
+                for code, count in sorted(histogram.errors.items()):
+                    lines.append(f'{p}_command_errors_total{{command="{name}",code="{code}"}} {count}')
+
+            for metric, attribute in (('command_retries_total', 'retries'),
+                                      ('bytes_sent_total', 'bytes_sent'),
+                                      ('bytes_received_total', 'bytes_received')):
+                lines.append(f"# TYPE {p}_{metric} counter")
+                for name, histogram in commands:
+                    lines.append(f'{p}_{metric}{{command="{name}"}} {getattr(histogram, attribute)}')
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str = None) -> None:
+        """Atomically write the metrics to path (default textfile_path)."""
+        path = path or self.textfile_path
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(temp_path, path)
+        self._flushed_at = time.monotonic()
+
+    def close(self) -> None:
+        if self.textfile_path:
+            self.write_textfile()
+
+
+class JsonlSink(TelemetrySink):
+    """Append each span as one JSON line to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8', buffering=1)
+        self._lock = threading.Lock()
+
+    def emit(self, span: CommandSpan) -> None:
+        line = json.dumps(span.as_dict())
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,111 @@
+"""
+Waters Automation Portal - Command timeout and poll scheduling policy
+
+Per-command timeouts come from config.PORTAL_TIMEOUTS. While a move is waited on,
+the poll interval starts short and grows; once typical completion times have
+been observed, polls that cannot succeed yet are skipped and polling tightens
+around the expected completion time.
+"""
+
+import statistics
+from collections import deque
+from typing import Optional, Dict, Deque
+
+import config
+from portal_protocol import command_name, MOVE_COMMANDS
+
+
+class CommandTimingPolicy:
+    """
+    Timeout and poll-schedule policy keyed by command name.
+
+    Completion times recorded with record() are kept per command and used to
+    predict how long the next one will take.
+    """
+
+    def __init__(self,
+                 timeouts: Optional[Dict[str, float]] = None,
+                 initial_interval: float = 0.1,
+                 max_interval: float = 2.0,
+                 growth: float = 1.5,
+                 history_size: int = 20):
+        """
+        Initialize the policy.
+
+        Args:
+            timeouts: Per-command timeouts in seconds (default config.PORTAL_TIMEOUTS)
+            initial_interval: First poll interval in seconds
+            max_interval: Longest poll interval in seconds
+            growth: Factor applied to the interval after each poll
+            history_size: Number of completion times kept per command
+        """
+        self.timeouts = dict(config.PORTAL_TIMEOUTS if timeouts is None else timeouts)
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.growth = growth
+        self.history: Dict[str, Deque[float]] = {}
+        self.history_size = history_size
+
+    def timeout(self, command: str) -> float:
+        """
+        Return how long to wait for a command to finish.
+
+        Uses the configured timeout, extended to 1.5x the slowest observed
+        completion if history shows the configured value is too tight.
+        """
+        name = command_name(command)
+        timeout = float(self.timeouts.get(name, config.COMMAND_TIMEOUT))
+        history = self.history.get(name)
+        if history:
+            timeout = max(timeout, 1.5 * max(history))
+        return timeout
+
+    def read_timeout(self, command: str, default: float) -> float:
+        """
+        Return the read window for a command's response frames.
+
+        Move commands use the default window for their acknowledgement; their
+        completion is waited on separately with timeout(). Other commands use
+        their configured timeout.
+        """
+        name = command_name(command)
+        if name in MOVE_COMMANDS or name not in self.timeouts:
+            return default
+        return float(self.timeouts[name])
+
+    def expected_duration(self, command: str) -> Optional[float]:
+        """Median observed completion time, or None without history."""
+        history = self.history.get(command_name(command))
+        return statistics.median(history) if history else None
+
+    def record(self, command: str, duration: float) -> None:
+        """Record the completion time of a successful command."""
+        name = command_name(command)
+        if name not in self.history:
+            self.history[name] = deque(maxlen=self.history_size)
+        self.history[name].append(duration)
+
+    def next_interval(self, command: str, elapsed: float, previous: Optional[float] = None) -> float:
+        """
+        Return how long to sleep before the next status poll.
+
+        Args:
+            command: Command being waited on
+            elapsed: Seconds since the command was sent
+            previous: Previous interval, or None for the first poll
+
+        Returns:
+            Sleep interval in seconds
+        """
+        interval = self.initial_interval if previous is None else min(previous * self.growth, self.max_interval)
+
+        expected = self.expected_duration(command)
+        if expected is not None:
+            remaining = expected - elapsed
+            if remaining > self.initial_interval:
+                # Completion is not expected yet: sleep toward it
+                interval = min(max(remaining, interval), self.max_interval)
+            elif remaining > -expected * 0.25:
+                # Around the expected completion: poll fast
+                interval = self.initial_interval
+        return interval
@@ -0,0 +1,147 @@
+"""
+Waters Automation Portal - Framed transports
+
+Serial and TCP/IP transports that write PC Protocol commands and return
+response frames. Received bytes go into the decoder's persistent receive
+buffer: TCP reads straight into it with recv_into(), while pyserial has no
+native readinto() and returns each read as a new bytes object, which is copied
+in. Bytes that arrive after a command's response are kept for the next read
+instead of being lost or mixed into the wrong reply. A transport given a recorder (see
+portal_recorder.py) logs every write and read on the way through.
+"""
+
+import socket
+import time
+from typing import Optional
+
+from portal_protocol import FrameDecoder
+
+# Record kinds passed to a transport's recorder (mirrored in portal_recorder.py)
+RECORD_TX = 1
+RECORD_RX = 2
+
+
+class PortalTransport:
+    """Base class for framed Automation Portal transports."""
+
+    def __init__(self):
+        self.decoder = FrameDecoder()
+        # FrameRecorder receiving every write and read (None: not recording)
+        self.recorder = None
+
+    def write(self, data: bytes) -> None:
+        """Write raw command bytes to the connection."""
+        if self.recorder is not None:
+            self.recorder.record(RECORD_TX, data)
+        self._write(data)
+
+    def _write(self, data: bytes) -> None:
+        raise NotImplementedError
+
+    def _read_into(self, buffer: memoryview, timeout: float) -> int:
+        """
+        Read available bytes into buffer, waiting up to timeout seconds.
+
+        Returns:
+            Number of bytes read, 0 on timeout
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Close the underlying connection."""
+        raise NotImplementedError
+
+    def read_frame(self, timeout: float) -> Optional[bytes]:
+        """
+        Return the next complete response frame.
+
+        Args:
+            timeout: Maximum time to wait for a frame in seconds
+
+        Returns:
+            Frame bytes without terminator, or None if no complete frame arrived in time
+        """
+        frame = self.decoder.next_frame()
+        if frame is not None:
+            return frame
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            buffer = self.decoder.write_buffer()
+            count = self._read_into(buffer, remaining)
+            if not count:
+                return None
+            if self.recorder is not None:
+                self.recorder.record(RECORD_RX, buffer[:count])
+            if self.decoder.commit(count):
+                return self.decoder.next_frame()
+
+    def reset(self) -> None:
+        """Drop any buffered bytes and undelivered frames."""
+        self.decoder.clear()
+
+
+class SerialTransport(PortalTransport):
+    """Framed transport over an open pyserial port."""
+
+    def __init__(self, serial_port):
+        super().__init__()
+        self.serial_port = serial_port
+        # pyserial reconfigures the port on every timeout assignment
+        self._timeout = serial_port.timeout
+
+    def _write(self, data: bytes) -> None:
+        self.serial_port.write(data)
+
+    def _read_into(self, buffer: memoryview, timeout: float) -> int:
+        # Block for the first byte only, then take everything already waiting
+        if timeout != self._timeout:
+            self.serial_port.timeout = timeout
+            self._timeout = timeout
+        # pyserial's readinto() is read() plus a copy, so do that directly
+        data = self.serial_port.read(min(self.serial_port.in_waiting or 1, len(buffer)))
+        count = len(data)
+        buffer[:count] = data
+        return count
+
+    def close(self) -> None:
+        self.serial_port.close()
+
+
+class TcpTransport(PortalTransport):
+    """
+    Framed transport over a connected TCP socket.
+
+    Commands are a few bytes long, so Nagle's algorithm is disabled to send them
+    immediately, and keepalive is enabled so a dead peer is eventually detected.
+    """
+
+    def __init__(self, sock: socket.socket):
+        super().__init__()
+        self.sock = sock
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+    @classmethod
+    def open(cls, host: str, port: int, timeout: float) -> 'TcpTransport':
+        """Connect to host:port and return a transport for the socket."""
+        return cls(socket.create_connection((host, port), timeout=timeout))
+
+    def _write(self, data: bytes) -> None:
+        self.sock.sendall(data)
+
+    def _read_into(self, buffer: memoryview, timeout: float) -> int:
+        self.sock.settimeout(timeout)
+        try:
+            count = self.sock.recv_into(buffer)
+        except socket.timeout:
+            return 0
+        if not count:
+            raise ConnectionError("Connection closed by Automation Portal")
+        return count
+
+    def close(self) -> None:
+        self.sock.close()
@@ -0,0 +1,148 @@
+"""
+Waters Automation Portal - Prioritized wire lock
+
+Arbitrates the single command/response channel of a driver shared by several
+threads (a UI status poller, a workflow thread, the status monitor, the
+connection supervisor). The wire is handed to waiting threads in priority order
+instead of whichever thread the OS wakes first: link recovery goes first, then
+read-only queries (GetStatus, ReportVersion), then commands that change portal
+state. A waiter that has been passed over max_bypass times is served next, so
+commands are delayed by queries but never starved by them.
+"""
+
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, List
+
+from portal_protocol import command_name
+
+# Lower values are served first
+PRIORITY_LINK = 0       # reconnect and re-sync
+PRIORITY_QUERY = 1      # read-only commands
+PRIORITY_COMMAND = 2    # commands that change portal state
+
+# Commands that only read portal state
+QUERY_COMMANDS = ('GetStatus', 'ReportVersion')
+
+
+def command_priority(command: str) -> int:
+    """Return the wire priority of a command."""
+    return PRIORITY_QUERY if command_name(command) in QUERY_COMMANDS else PRIORITY_COMMAND
+
+
+class _Waiter:
+    __slots__ = ('priority', 'ticket', 'bypassed')
+
+    def __init__(self, priority: int, ticket: int):
+        self.priority = priority
+        self.ticket = ticket
+        self.bypassed = 0
+
+
+class WireLock:
+    """
+    Reentrant lock granted by priority, then arrival order.
+
+    Usable as a plain context manager (PRIORITY_COMMAND) or through hold():
+
+        with driver._io_lock.hold(PRIORITY_QUERY):
+            ...
+    """
+
+    def __init__(self, max_bypass: int = 4):
+        """
+        Args:
+            max_bypass: Grants to later, higher-priority waiters before a waiter
+                is served regardless of its priority
+        """
+        self.max_bypass = max_bypass
+        self.contended = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._owner: Optional[int] = None
+        self._depth = 0
+        self._waiters: List[_Waiter] = []
+        self._tickets = itertools.count()
+
+    def acquire(self, priority: int = PRIORITY_COMMAND, timeout: float = None) -> bool:
+        """
+        Acquire the lock.
+
+        Args:
+            priority: PRIORITY_LINK, PRIORITY_QUERY or PRIORITY_COMMAND
+            timeout: Maximum wait in seconds (None waits forever)
+
+        Returns:
+            True if the lock was acquired
+        """
+        me = threading.get_ident()
+        with self._cond:
+            if self._owner == me:
+                self._depth += 1
+                return True
+            if self._owner is None and not self._waiters:
+                self._owner, self._depth = me, 1
+                return True
+
+            waiter = _Waiter(priority, next(self._tickets))
+            self._waiters.append(waiter)
+            self.contended += 1
+            deadline = None if timeout is None else time.monotonic() + timeout
+            granted = False
+            try:
+                while self._owner is not None or self._next_waiter() is not waiter:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                granted = True
+            finally:
+                self._waiters.remove(waiter)
+                if not granted and self._owner is None and self._waiters:
+                    # Gave up while the wire was free: the next waiter may now go
+                    self._cond.notify_all()
+
+            for other in self._waiters:
+                if other.ticket < waiter.ticket:
+                    other.bypassed += 1
+            self._owner, self._depth = me, 1
+            return True
+
+    def release(self) -> None:
+        """Release one level of ownership."""
+        with self._cond:
+            if self._owner != threading.get_ident():
+                raise RuntimeError("cannot release un-acquired wire lock")
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner = None
+                if self._waiters:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def hold(self, priority: int = PRIORITY_COMMAND):
+        """Context manager that holds the lock at the given priority."""
+        self.acquire(priority)
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def waiting(self, max_priority: int = PRIORITY_QUERY) -> int:
+        """Number of threads waiting at max_priority or a more urgent priority."""
+        with self._cond:
+            return sum(1 for waiter in self._waiters if waiter.priority <= max_priority)
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        starving = [waiter for waiter in self._waiters if waiter.bypassed >= self.max_bypass]
+        if starving:
+            return min(starving, key=lambda waiter: waiter.ticket)
+        return min(self._waiters, key=lambda waiter: (waiter.priority, waiter.ticket), default=None)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
@@ -46,6 +46,9 @@ setup(
             "flake8>=3.8",
             "mypy>=0.910",
         ],
+        "server": [
+            "msgpack>=1.0",
+        ],
     },
     entry_points={
         "console_scripts": [
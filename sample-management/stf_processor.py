@@ -4,17 +4,266 @@ STF (Sample Transfer File) Processor
 Handles Waters STF specification 715008535 JSON file creation and processing
 """
 
+import ctypes
+import ctypes.util
+import errno
 import json
+import os
+import secrets
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Callable
+
+from stf_watcher import STFWatcher, PENDING_SUFFIX
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Waters STF file states: written (.new), claimed by a processor (.wip), processed (.prc)
+CLAIMED_SUFFIX = ".wip.json"
+PROCESSED_SUFFIX = ".prc.json"
+
+# Files that failed to process, set aside for an operator; rename to .new.json to retry
+FAILED_SUFFIX = ".failed.json"
+STF_SUFFIXES = (PENDING_SUFFIX, CLAIMED_SUFFIX, PROCESSED_SUFFIX, FAILED_SUFFIX)
+
+# In-progress writes; never matched by the STF service or the watcher
+TEMP_SUFFIX = ".tmp"
+
+# Claims older than this are assumed abandoned by a crashed processor
+STALE_CLAIM_SECONDS = 300.0
+
+# Temporary files older than this were left by a writer that crashed
+STALE_TEMP_SECONDS = 60.0
+
+# Per-directory sequence counter used in STF filenames
+SEQUENCE_FILE = ".stf_sequence"
+SEQUENCE_DIGITS = 6
+
+
+def stf_stem(filename: str) -> str:
+    """
+    Strip the STF state suffix (and claimant tag of a .wip.json file) from a filename
+    
+    Args:
+        filename: STF filename, e.g. "Execute_x_001_250101_1200.new.json"
+        
+    Returns:
+        str: Name shared by all states of the file, e.g. "Execute_x_001_250101_1200"
+    """
+    for suffix in STF_SUFFIXES:
+        if filename.endswith(suffix):
+            stem = filename[:-len(suffix)]
+            return stem.rsplit(".", 1)[0] if suffix == CLAIMED_SUFFIX else stem
+    return filename
+
+
+def _claimant() -> str:
+    """Host, process and thread that claims a file, safe for use in a filename"""
+    host = socket.gethostname().replace(".", "-") or "host"
+    return f"{host}-{os.getpid()}-{threading.get_ident()}"
+
+
+# renameat2() flags (linux/fs.h)
+AT_FDCWD = -100
+RENAME_NOREPLACE = 1
+
+
+def _load_renameat2():
+    """Return libc's renameat2 if available, else None"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        renameat2 = libc.renameat2
+    except (OSError, AttributeError):
+        return None
+    renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    return renameat2
+
+
+_renameat2 = _load_renameat2()
+
+
+def _publish_file(temp_path: Path, file_path: Path, overwrite: bool):
+    """Rename temp_path to file_path; unless overwrite, fail with FileExistsError if it exists"""
+    if overwrite:
+        os.replace(temp_path, file_path)
+        return
+    if os.name == 'nt':
+        # Windows rename never replaces an existing file
+        os.rename(temp_path, file_path)
+        return
+    if _renameat2 is not None:
+        # A rename, unlike link(), is seen by the watcher's IN_MOVED_TO
+        result = _renameat2(AT_FDCWD, os.fsencode(temp_path), AT_FDCWD, os.fsencode(file_path), RENAME_NOREPLACE)
+        if result == 0:
+            return
+        error = ctypes.get_errno()
+        if error not in (errno.EINVAL, errno.ENOSYS, errno.ENOTSUP, errno.EOPNOTSUPP):
+            raise OSError(error, os.strerror(error), str(file_path))
+    # No atomic no-replace rename (other platforms, some shares): unique names make this safe in practice
+    if file_path.exists():
+        raise FileExistsError(errno.EEXIST, "File exists", str(file_path))
+    os.rename(temp_path, file_path)
+
+
+def atomic_write_json(file_path: Path, data: Dict, fsync: bool = True, overwrite: bool = True, **dump_kwargs):
+    """
+    Write JSON so that readers see either the complete file or no file
+    
+    The data is written to a hidden temporary file in the same directory and
+    renamed over file_path, so the STF service can never pick up a half-written
+    file, and a crash leaves only a temporary file behind.
+    
+    Args:
+        file_path: Destination file
+        data: JSON data
+        fsync: Flush the file (and on POSIX the directory entry) to disk before
+            returning, so the file survives a power loss
+        overwrite: Replace an existing file_path; if False, raise FileExistsError instead
+        **dump_kwargs: Passed to json.dumps (e.g. indent)
+    """
+    file_path = Path(file_path)
+    temp_path = file_path.with_name(f".{file_path.name}.{_claimant()}{TEMP_SUFFIX}")
+    payload = json.dumps(data, **dump_kwargs).encode('utf-8')
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(payload)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        _publish_file(temp_path, file_path, overwrite)
+    except BaseException:
+        try:
+            temp_path.unlink()
+        except OSError:
+            pass
+        raise
+    if fsync and hasattr(os, 'O_DIRECTORY'):
+        directory_fd = os.open(file_path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+
+class STFSequence:
+    """
+    Per-directory STF sequence counter
+    
+    The next free number is kept in a small file in the STF directory, updated
+    under an exclusive file lock, so processes (and hosts sharing the directory)
+    never hand out the same number. Numbers are reserved block_size at a time:
+    with block_size 1 every file takes the lock and numbers follow creation
+    order across all writers; larger blocks take the lock once per block.
+    """
+    
+    def __init__(self, stf_directory: Path, block_size: int = 1):
+        self.path = Path(stf_directory) / SEQUENCE_FILE
+        self.block_size = max(1, block_size)
+        self._lock = threading.Lock()
+        self._next = 0
+        self._limit = 0
+    
+    def __getstate__(self):
+        # Locks cannot be pickled (process pool workers), and a reserved block
+        # must not be handed out again by a copy in another process
+        return {"path": self.path, "block_size": self.block_size}
+    
+    def __setstate__(self, state):
+        self.__init__(state["path"].parent, state["block_size"])
+    
+    def next(self) -> int:
+        """
+        Reserve the next sequence number
+        
+        Returns:
+            int: Sequence number, starting at 1
+        """
+        with self._lock:
+            if self._next >= self._limit:
+                self._next = self._reserve()
+                self._limit = self._next + self.block_size
+            number = self._next
+            self._next += 1
+            return number
+    
+    def _reserve(self) -> int:
+        with open(self.path, 'a+b') as f:
+            _lock_file(f)
+            try:
+                f.seek(0)
+                text = f.read().decode('ascii', 'replace').strip()
+                try:
+                    start = int(text)
+                except ValueError:
+                    # New or damaged counter: continue after the highest number in use
+                    if text:
+                        print(f"⚠️ Sequence file {self.path} unreadable, rebuilding from filenames")
+                    start = _highest_sequence(self.path.parent) + 1
+                f.seek(0)
+                f.truncate()
+                f.write(str(start + self.block_size).encode('ascii'))
+                f.flush()
+            finally:
+                _unlock_file(f)
+        return start
+
+
+def _lock_file(f):
+    """Block until an exclusive lock on the whole of f is held"""
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _highest_sequence(stf_directory: Path) -> int:
+    """Highest sequence number in the names of the STF files in a directory"""
+    highest = 0
+    with os.scandir(stf_directory) as entries:
+        for entry in entries:
+            if not entry.name.endswith(STF_SUFFIXES):
+                continue
+            for field in stf_stem(entry.name).split("_"):
+                if len(field) == SEQUENCE_DIGITS and field.isdigit():
+                    highest = max(highest, int(field))
+                    break
+    return highest
 
 class STFProcessor:
     """Process STF files for Empower sample set automation"""
     
-    def __init__(self, stf_directory: str = "C:\\STF"):
+    def __init__(self, stf_directory: str = "C:\\STF", fsync: bool = True, sequence_block: int = 1):
+        """
+        Args:
+            stf_directory: Directory the STF files are written to
+            fsync: Flush every STF file to disk before it is renamed into place
+                (turn off for higher write rates when power loss is not a concern)
+            sequence_block: Sequence numbers reserved per lock of the counter file
+                (1 keeps numbers in creation order across writers)
+        """
         self.stf_directory = Path(stf_directory)
         self.stf_directory.mkdir(exist_ok=True)
+        self.fsync = fsync
+        self.sequence = STFSequence(self.stf_directory, sequence_block)
     
     def create_stf_json(
         self,
@@ -83,6 +332,12 @@ class STFProcessor:
         """
         Save STF JSON to .new.json file
         
+        Files are named {prefix}_{sequence}_{yymmdd_HHMMSS_microseconds}_{random}.new.json.
+        The sequence number comes from the directory's counter file, so names
+        sort in submission order; the timestamp and random part keep names
+        unique even if the counter file is reset or shared by another tool.
+        An existing file is never replaced: on a clash a new name is drawn.
+        
         Args:
             stf_data: STF JSON data
             filename_prefix: Prefix for filename
@@ -90,29 +345,164 @@ class STFProcessor:
         Returns:
             Path: Path to created file
         """
-        timestamp = datetime.now().strftime("%y%m%d_%H%M")
-        filename = f"{filename_prefix}_001_{timestamp}.new.json"
-        file_path = self.stf_directory / filename
-        
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(stf_data, f, indent=2, ensure_ascii=False)
+        for _ in range(5):
+            file_path = self.stf_directory / self.new_stf_filename(filename_prefix)
+            try:
+                atomic_write_json(file_path, stf_data, self.fsync, overwrite=False,
+                                  indent=2, ensure_ascii=False)
+                break
+            except FileExistsError:
+                print(f"⚠️ STF file {file_path.name} already exists, retrying with a new name")
+        else:
+            raise FileExistsError(f"Could not find a free STF filename in {self.stf_directory}")
         
         print(f"✅ STF file created: {file_path}")
         return file_path
     
+    def new_stf_filename(self, filename_prefix: str = "STF") -> str:
+        """
+        Generate a new, unused .new.json filename
+        
+        Args:
+            filename_prefix: Prefix for filename
+            
+        Returns:
+            str: Filename
+        """
+        sequence = self.sequence.next()
+        timestamp = datetime.now().strftime("%y%m%d_%H%M%S_%f")
+        return (f"{filename_prefix}_{sequence:0{SEQUENCE_DIGITS}d}_{timestamp}_"
+                f"{secrets.token_hex(2)}{PENDING_SUFFIX}")
+    
+    def claim_stf_file(self, stf_file_path: Path) -> Optional[Path]:
+        """
+        Claim a .new.json STF file by renaming it to .wip.json
+        
+        The rename is atomic within one directory, also on a share used by
+        several hosts, so exactly one processor wins each file. The claimant
+        (host, process, thread) is part of the .wip.json name.
+        
+        Args:
+            stf_file_path: Pending .new.json file
+            
+        Returns:
+            Optional[Path]: The claimed .wip.json file, or None if another processor got it first
+        """
+        claimed = self.stf_directory / f"{stf_stem(stf_file_path.name)}.{_claimant()}{CLAIMED_SUFFIX}"
+        try:
+            os.rename(stf_file_path, claimed)
+        except (FileNotFoundError, FileExistsError, PermissionError):
+            # Lost the race - unless a retried rename on a network share already succeeded
+            return claimed if claimed.exists() else None
+        # Restart the claim's age for release_stale_claims()
+        os.utime(claimed)
+        return claimed
+    
+    def release_stale_claims(self, max_age: float = STALE_CLAIM_SECONDS) -> List[Path]:
+        """
+        Return .wip.json files abandoned by a crashed processor to .new.json
+        
+        Args:
+            max_age: Seconds after which a claim is considered abandoned
+            
+        Returns:
+            List[Path]: Files returned to pending
+        """
+        released = []
+        now = time.time()
+        with os.scandir(self.stf_directory) as entries:
+            stale = [entry.name for entry in entries
+                     if entry.name.endswith(CLAIMED_SUFFIX) and now - entry.stat().st_mtime > max_age]
+        for name in stale:
+            pending = self.stf_directory / f"{stf_stem(name)}{PENDING_SUFFIX}"
+            try:
+                os.rename(self.stf_directory / name, pending)
+            except OSError:
+                continue
+            print(f"♻️ Released stale claim: {name}")
+            released.append(pending)
+        return released
+    
+    def recover(self) -> Dict[str, List[str]]:
+        """
+        Reconcile files left behind by a crash; run before processing starts
+        
+        - Temporary files of interrupted writes are deleted
+        - A .new.json or .wip.json file whose .prc.json already exists with the
+          same submission was processed before the crash and is deleted
+        - Stale claims are returned to .new.json
+        
+        Returns:
+            Dict[str, List[str]]: Filenames per action taken
+        """
+        report = {"removed_temp": [], "removed_duplicates": [], "kept_conflicts": [], "released_claims": []}
+        now = time.time()
+        states: Dict[str, List[str]] = {}
+        with os.scandir(self.stf_directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith(".") and name.endswith(TEMP_SUFFIX):
+                    if now - entry.stat().st_mtime > STALE_TEMP_SECONDS:
+                        Path(entry.path).unlink(missing_ok=True)
+                        report["removed_temp"].append(name)
+                elif name.endswith(STF_SUFFIXES):
+                    states.setdefault(stf_stem(name), []).append(name)
+        
+        for stem, names in states.items():
+            processed = f"{stem}{PROCESSED_SUFFIX}"
+            if processed not in names:
+                continue
+            for name in names:
+                if name == processed:
+                    continue
+                if self._same_submission(self.stf_directory / name, self.stf_directory / processed):
+                    (self.stf_directory / name).unlink(missing_ok=True)
+                    report["removed_duplicates"].append(name)
+                else:
+                    report["kept_conflicts"].append(name)
+        
+        report["released_claims"] = [path.name for path in self.release_stale_claims()]
+        
+        actions = sum(len(names) for names in report.values())
+        if actions:
+            print(f"🩹 Recovery: {', '.join(f'{len(v)} {k}' for k, v in report.items() if v)}")
+        return report
+    
+    @staticmethod
+    def _same_submission(stf_file: Path, processed_file: Path) -> bool:
+        """True if both files hold the same header and sample sets"""
+        try:
+            with open(stf_file, 'r', encoding='utf-8') as f:
+                stf_data = json.load(f)
+            with open(processed_file, 'r', encoding='utf-8') as f:
+                processed_data = json.load(f)
+        except (OSError, ValueError):
+            # Unreadable: keep it for a person to look at rather than lose a submission
+            return False
+        return all(stf_data.get(key) == processed_data.get(key) for key in ("HeaderFields", "SampleSetDetails"))
+    
     def process_stf_file(self, stf_file_path: Path) -> Dict:
         """
-        Process a .new.json STF file
+        Claim and process a .new.json STF file
         
         Args:
             stf_file_path: Path to STF file to process
             
         Returns:
-            Dict: Processing results
+            Dict: Processing results ("claimed": False if another processor took the file)
         """
+        stf_file_path = Path(stf_file_path)
+        claimed_file = self.claim_stf_file(stf_file_path)
+        if claimed_file is None:
+            return {
+                "success": False,
+                "claimed": False,
+                "error": f"Already claimed by another processor: {stf_file_path.name}"
+            }
+        
         try:
             # Load STF file
-            with open(stf_file_path, 'r') as f:
+            with open(claimed_file, 'r', encoding='utf-8') as f:
                 stf_data = json.load(f)
             
             # Update trailer report
@@ -121,51 +511,130 @@ class STFProcessor:
             stf_data["TrailerReport"]["ProcessedAt"] = datetime.now().isoformat()
             
             # Create processed filename
-            processed_file = stf_file_path.with_suffix('.prc.json')
-            processed_file = processed_file.with_name(
-                processed_file.name.replace('.new.prc.json', '.prc.json')
-            )
+            processed_file = self.stf_directory / f"{stf_stem(claimed_file.name)}{PROCESSED_SUFFIX}"
             
-            # Save processed file
-            with open(processed_file, 'w') as f:
-                json.dump(stf_data, f, indent=2)
+            # Save processed file; recover() removes the claimed file if we crash before unlinking it
+            atomic_write_json(processed_file, stf_data, self.fsync, indent=2)
             
-            # Remove original .new file
-            stf_file_path.unlink()
+            # Remove the claimed file (recover() may already have removed it)
+            claimed_file.unlink(missing_ok=True)
             
             print(f"✅ STF file processed: {processed_file}")
             
             return {
                 "success": True,
                 "processed_file": str(processed_file),
-                "sample_sets": [detail["SampleSetName"] for detail in stf_data.get("SampleSetDetails", [])]
+                "sample_sets": [detail["SampleSetName"] for detail in stf_data.get("SampleSetDetails", [])],
+                "sample_set_details": stf_data.get("SampleSetDetails", [])
             }
             
         except Exception as e:
+            # Set the file aside instead of leaving it claimed: release_stale_claims() would
+            # return it to pending every STALE_CLAIM_SECONDS and it would fail again forever
             print(f"❌ STF processing failed: {e}")
+            failed_file = self.stf_directory / f"{stf_stem(claimed_file.name)}{FAILED_SUFFIX}"
+            try:
+                os.replace(claimed_file, failed_file)
+            except OSError as rename_error:
+                print(f"⚠️ Could not set aside {claimed_file.name}: {rename_error}")
+                failed_file = claimed_file
+            else:
+                print(f"🚫 Set aside as {failed_file.name}; rename it to {PENDING_SUFFIX} to retry")
             return {
                 "success": False,
-                "error": str(e)
+                "error": str(e),
+                "failed_file": str(failed_file)
             }
     
-    def process_pending_files(self) -> List[Dict]:
+    def pending_files(self) -> List[Path]:
+        """
+        List pending .new.json STF files, oldest name first
+        
+        Returns:
+            List[Path]: Pending files
+        """
+        # Only pending names become Path objects; processed files are skipped by name
+        with os.scandir(self.stf_directory) as entries:
+            return sorted(
+                self.stf_directory / entry.name for entry in entries if entry.name.endswith(PENDING_SUFFIX)
+            )
+    
+    def _executor(self, workers: int, use_processes: bool) -> Executor:
+        if use_processes:
+            return ProcessPoolExecutor(max_workers=workers)
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="STFWorker")
+    
+    def process_pending_files(self, workers: int = 1, use_processes: bool = False) -> List[Dict]:
         """
         Process all pending .new.json STF files
         
+        Files are claimed before they are processed, so several processors
+        (threads, processes or hosts) can work on the same directory.
+        
+        Args:
+            workers: Number of files processed concurrently
+            use_processes: Use worker processes instead of threads (for CPU-bound
+                parsing of large files)
+            
         Returns:
-            List[Dict]: List of processing results
+            List[Dict]: List of processing results, in file order
         """
-        pending_files = list(self.stf_directory.glob("*.new.json"))
-        results = []
+        pending_files = self.pending_files()
         
         print(f"🔍 Found {len(pending_files)} pending STF files")
         
-        for stf_file in pending_files:
-            print(f"📄 Processing: {stf_file.name}")
-            result = self.process_stf_file(stf_file)
-            results.append(result)
+        if workers <= 1:
+            results = []
+            for stf_file in pending_files:
+                print(f"📄 Processing: {stf_file.name}")
+                results.append(self.process_stf_file(stf_file))
+            return results
         
-        return results
+        # Processes receive files in batches to amortise the hand-off between processes
+        chunksize = max(1, len(pending_files) // (workers * 4)) if use_processes else 1
+        with self._executor(workers, use_processes) as executor:
+            return list(executor.map(self.process_stf_file, pending_files, chunksize=chunksize))
+    
+    def watch(
+        self,
+        stop_event: threading.Event = None,
+        on_result: Callable[[Dict], None] = None,
+        backend: str = "auto",
+        workers: int = 1,
+        use_processes: bool = False
+    ):
+        """
+        Process STF files as they appear until stop_event is set
+        
+        Files already pending are processed first. New files are picked up from
+        filesystem events (or a cheap directory poll) instead of re-globbing the
+        whole directory. Claims left by a crashed processor are released every
+        STALE_CLAIM_SECONDS and so retried; files that failed to process are set
+        aside as .failed.json instead.
+        
+        Args:
+            stop_event: Event that ends the watch (default: run until interrupted)
+            on_result: Called with each processing result
+            backend: Watcher backend: "inotify", "polling", or "auto"
+            workers: Number of files processed concurrently
+            use_processes: Use worker processes instead of threads
+        """
+        stop_event = stop_event or threading.Event()
+        self.recover()
+        with STFWatcher(self.stf_directory, backend=backend) as watcher, \
+                self._executor(workers, use_processes) as executor:
+            next_release = time.monotonic() + STALE_CLAIM_SECONDS
+            while not stop_event.is_set():
+                if time.monotonic() >= next_release:
+                    # Released files reappear as .new.json and are queued by the watcher
+                    self.release_stale_claims()
+                    next_release = time.monotonic() + STALE_CLAIM_SECONDS
+                stf_file = watcher.get(timeout=0.2)
+                if stf_file is None:
+                    continue
+                future = executor.submit(self.process_stf_file, stf_file)
+                if on_result:
+                    future.add_done_callback(lambda done: on_result(done.result()))
     
     def create_stf_for_sample_set(self, sample_set_name: str, **kwargs) -> Path:
         """
@@ -180,6 +649,22 @@ class STFProcessor:
         """
         stf_data = self.create_stf_json([sample_set_name], **kwargs)
         return self.save_stf_file(stf_data, f"Execute_{sample_set_name.replace(' ', '_')}")
+    
+    def create_stf_for_sample_sets(self, sample_set_names: List[str], **kwargs) -> Path:
+        """
+        Convenience method to create one STF for several sample sets
+        
+        Args:
+            sample_set_names: Names of sample sets to execute, in execution order
+            **kwargs: Additional parameters for create_stf_json
+            
+        Returns:
+            Path: Path to created STF file
+        """
+        if len(sample_set_names) == 1:
+            return self.create_stf_for_sample_set(sample_set_names[0], **kwargs)
+        stf_data = self.create_stf_json(sample_set_names, **kwargs)
+        return self.save_stf_file(stf_data, f"ExecuteBatch_{len(sample_set_names)}")
 
 def main():
     """Test STF processor"""
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+STF Directory Watcher
+Picks up new .new.json STF files as they appear and queues them for processing
+
+On Linux the directory is watched with inotify (through ctypes, no extra
+packages): a file is queued as soon as its writer closes it or renames it into
+the directory. Elsewhere, or on network shares where inotify does not see writes
+from other hosts, the directory is polled. A poll only stats the directory and
+lists it again when its modification time has changed, so an idle poll costs the
+same however many .prc.json files have accumulated.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Set, Iterator
+
+PENDING_SUFFIX = ".new.json"
+
+# inotify constants (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+# Directory mtimes newer than this are not trusted to have caught every change:
+# coarse filesystem timestamps (FAT, SMB) can hide a second write in the same tick
+MTIME_SETTLE_SECONDS = 2.0
+
+
+def _load_inotify():
+    """Return libc if it provides inotify, else None"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class STFWatcher:
+    """Watch an STF directory and queue pending .new.json files"""
+
+    def __init__(
+        self,
+        stf_directory: str,
+        backend: str = "auto",
+        poll_interval: float = 0.05,
+        rescan_interval: float = 30.0
+    ):
+        """
+        Initialize the watcher
+
+        Args:
+            stf_directory: Directory the STF files are written to
+            backend: "inotify", "polling", or "auto" (inotify where available)
+            poll_interval: Seconds between directory checks when polling
+            rescan_interval: Seconds between safety checks of the directory when
+                using inotify (catches files written by other hosts on a share)
+        """
+        self.stf_directory = Path(stf_directory)
+        self.poll_interval = poll_interval
+        self.rescan_interval = rescan_interval
+        self.queue: "queue.Queue[Path]" = queue.Queue()
+
+        self._libc = _load_inotify() if backend in ("auto", "inotify") else None
+        if backend == "inotify" and self._libc is None:
+            raise OSError("inotify is not available on this system")
+        self.backend = "inotify" if self._libc is not None else "polling"
+
+        self._queued: Set[str] = set()
+        self._known: Set[str] = set()
+        self._directory_mtime: Optional[int] = None
+        self._recheck = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake_read, self._wake_write = None, None
+        self._thread: Optional[threading.Thread] = None
+        self.scans = 0
+
+    @property
+    def is_running(self) -> bool:
+        """True while the watcher thread is alive"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "STFWatcher":
+        """
+        Start watching; files already pending are queued first
+
+        Returns:
+            STFWatcher: self
+        """
+        if self.is_running:
+            return self
+        self._stop.clear()
+        inotify_fd = self._open_inotify() if self._libc is not None else None
+        self._scan(force=True)
+        self._thread = threading.Thread(
+            target=self._run_inotify if inotify_fd is not None else self._run_polling,
+            args=(inotify_fd,) if inotify_fd is not None else (),
+            name="STFWatcher",
+            daemon=True
+        )
+        self._thread.start()
+        print(f"👀 Watching {self.stf_directory} for *{PENDING_SUFFIX} ({self.backend})")
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        """Stop watching and wait for the watcher thread to exit"""
+        self._stop.set()
+        if self._wake_write is not None:
+            os.write(self._wake_write, b"x")
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def get(self, timeout: float = None) -> Optional[Path]:
+        """
+        Take the next pending file from the queue
+
+        Args:
+            timeout: Seconds to wait (None waits until a file arrives)
+
+        Returns:
+            Optional[Path]: Pending file, or None on timeout
+        """
+        try:
+            path = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self._lock:
+            self._queued.discard(path.name)
+        return path
+
+    def __iter__(self) -> Iterator[Path]:
+        """Yield pending files until the watcher is stopped"""
+        while not (self._stop.is_set() and self.queue.empty()):
+            path = self.get(timeout=0.5)
+            if path is not None:
+                yield path
+
+    def _enqueue(self, name: str):
+        with self._lock:
+            if name in self._queued:
+                return
+            self._queued.add(name)
+        self.queue.put(self.stf_directory / name)
+
+    def _scan(self, force: bool = False):
+        """List the directory if it may have changed since the last scan"""
+        try:
+            mtime = os.stat(self.stf_directory).st_mtime_ns
+        except OSError as e:
+            print(f"⚠️ Cannot stat STF directory: {e}")
+            return
+        settled = time.time() - mtime / 1e9 > MTIME_SETTLE_SECONDS
+        if not force and mtime == self._directory_mtime:
+            # Unchanged. A listing taken while the mtime was still fresh may have
+            # missed a change in the same timestamp tick: list once more when it settles
+            if not (self._recheck and settled):
+                return
+        self._directory_mtime = mtime
+        self._recheck = not settled
+        self.scans += 1
+
+        with os.scandir(self.stf_directory) as entries:
+            current = {entry.name for entry in entries if entry.name.endswith(PENDING_SUFFIX)}
+        for name in sorted(current - self._known):
+            self._enqueue(name)
+        self._known = current
+
+    def _run_polling(self):
+        while not self._stop.wait(self.poll_interval):
+            self._scan()
+
+    def _open_inotify(self) -> Optional[int]:
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            print(f"⚠️ inotify unavailable ({os.strerror(ctypes.get_errno())}), polling instead")
+            self.backend = "polling"
+            return None
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+        if self._libc.inotify_add_watch(fd, os.fsencode(self.stf_directory), mask) < 0:
+            print(f"⚠️ Cannot watch {self.stf_directory} ({os.strerror(ctypes.get_errno())}), polling instead")
+            os.close(fd)
+            self.backend = "polling"
+            return None
+        self._wake_read, self._wake_write = os.pipe()
+        return fd
+
+    def _run_inotify(self, fd: int):
+        next_rescan = time.monotonic() + self.rescan_interval
+        try:
+            while not self._stop.is_set():
+                timeout = max(0.0, next_rescan - time.monotonic())
+                readable, _, _ = select.select([fd, self._wake_read], [], [], timeout)
+                if fd in readable and not self._read_events(fd):
+                    print(f"⚠️ STF directory {self.stf_directory} was removed or moved")
+                    break
+                if time.monotonic() >= next_rescan:
+                    self._scan()
+                    next_rescan = time.monotonic() + self.rescan_interval
+        finally:
+            os.close(fd)
+            os.close(self._wake_read)
+            os.close(self._wake_write)
+            self._wake_read, self._wake_write = None, None
+
+    def _read_events(self, fd: int) -> bool:
+        """Queue the files named by pending inotify events; False if the watch is gone"""
+        try:
+            data = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            return True
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="surrogateescape")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped by the kernel: fall back to one listing
+                self._scan(force=True)
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                return False
+            elif name.endswith(PENDING_SUFFIX):
+                self._known.add(name)
+                self._enqueue(name)
+        return True
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def main():
+    """Watch the STF directory and process files as they arrive"""
+    from stf_processor import STFProcessor
+
+    processor = STFProcessor(sys.argv[1] if len(sys.argv) > 1 else "C:\\STF")
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    try:
+        processor.watch(workers=workers)
+    except KeyboardInterrupt:
+        print("\n👋 Stopped watching")
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,7 @@ from empower_com_interface import EmpowerConnection
 from stf_processor import STFProcessor
 from datetime import datetime
 import time
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 class WatersGPCAutomation:
     """Main automation class for Waters GPC Training project"""
@@ -20,6 +20,9 @@ class WatersGPCAutomation:
     NODE_NAME = "Waters-h4q6k34"
     DATABASE_NAME = "Waters GPC Training"
     
+    # Most sample sets packed into one STF file by batched execution
+    MAX_SAMPLE_SETS_PER_STF = 20
+    
     def __init__(self, stf_directory: str = "C:\\STF"):
         self.empower = EmpowerConnection(stf_directory)
         self.stf_processor = STFProcessor(stf_directory)
@@ -170,6 +173,8 @@ class WatersGPCAutomation:
             print("🔌 Disconnecting from Empower...")
             self.empower.disconnect()
             execution_log["end_time"] = datetime.now()
+    
+    def execute_sample_set(self, sample_set_name: str) -> Dict:
         """
         Execute a sample set using STF automation
         
@@ -233,22 +238,35 @@ class WatersGPCAutomation:
                 "sample_set": sample_set_name
             }
     
-    def execute_multiple_sample_sets(self, sample_set_names: List[str]) -> List[Dict]:
+    def execute_multiple_sample_sets(
+        self,
+        sample_set_names: List[str],
+        batched: bool = False,
+        max_per_stf: Optional[int] = None
+    ) -> List[Dict]:
         """
         Execute multiple sample sets
         
         Args:
             sample_set_names: List of sample set names to execute
+            batched: Pack the sample sets into as few STF files as possible and
+                use one Empower session for all of them, instead of one STF file
+                and one session per sample set
+            max_per_stf: Most sample sets per STF file when batched
+                (default MAX_SAMPLE_SETS_PER_STF)
             
         Returns:
-            List[Dict]: List of execution results
+            List[Dict]: List of execution results, one per sample set in input order
         """
         print(f"🎯 Executing {len(sample_set_names)} sample sets...")
         
-        results = []
-        for sample_set_name in sample_set_names:
-            result = self.execute_sample_set(sample_set_name)
-            results.append(result)
+        if batched:
+            results = self.execute_sample_sets_batched(sample_set_names, max_per_stf)
+        else:
+            results = []
+            for sample_set_name in sample_set_names:
+                result = self.execute_sample_set(sample_set_name)
+                results.append(result)
         
         # Summary
         successful = sum(1 for r in results if r["success"])
@@ -256,6 +274,92 @@ class WatersGPCAutomation:
         
         return results
     
+    def execute_sample_sets_batched(
+        self,
+        sample_set_names: List[str],
+        max_per_stf: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        Execute sample sets packed into shared STF files in one Empower session
+        
+        The sample sets are split into chunks of at most max_per_stf; each chunk
+        is written as one STF file and processed once. A chunk that fails marks
+        only its own sample sets as failed.
+        
+        Args:
+            sample_set_names: List of sample set names to execute
+            max_per_stf: Most sample sets per STF file (default MAX_SAMPLE_SETS_PER_STF)
+            
+        Returns:
+            List[Dict]: List of execution results, one per sample set in input order
+        """
+        if not sample_set_names:
+            return []
+        max_per_stf = max(1, max_per_stf or self.MAX_SAMPLE_SETS_PER_STF)
+        chunks = [sample_set_names[i:i + max_per_stf] for i in range(0, len(sample_set_names), max_per_stf)]
+        
+        # Verify Empower connection once for all chunks
+        if not self.verify_empower_connection():
+            return [
+                {"success": False, "error": "Failed to connect to Empower", "sample_set": name}
+                for name in sample_set_names
+            ]
+        
+        results = []
+        try:
+            for batch, chunk in enumerate(chunks, 1):
+                print(f"📦 STF batch {batch}/{len(chunks)}: {len(chunk)} sample sets")
+                results.extend(self._execute_stf_batch(chunk, batch))
+        finally:
+            self.empower.disconnect()
+        
+        return results
+    
+    def _execute_stf_batch(self, sample_set_names: List[str], batch: int) -> List[Dict]:
+        """Write and process one STF file for a chunk of sample sets; one result per sample set"""
+        try:
+            stf_file = self.stf_processor.create_stf_for_sample_sets(
+                sample_set_names,
+                project_path=self.PROJECT_NAME,
+                database=self.DATABASE_NAME,
+                system=self.SYSTEM_NAME,
+                node=self.NODE_NAME
+            )
+            result = self.stf_processor.process_stf_file(stf_file)
+        except Exception as e:
+            print(f"❌ STF batch {batch} failed: {e}")
+            return [
+                {"success": False, "error": str(e), "sample_set": name, "batch": batch}
+                for name in sample_set_names
+            ]
+        
+        if not result["success"]:
+            print(f"❌ STF batch {batch} processing failed: {result['error']}")
+            return [
+                {"success": False, "error": result["error"], "sample_set": name,
+                 "stf_file": str(stf_file), "batch": batch}
+                for name in sample_set_names
+            ]
+        
+        # SampleSetDetails keep the order they were written in
+        details = result.get("sample_set_details", [])
+        timestamp = datetime.now().isoformat()
+        results = []
+        for i, name in enumerate(sample_set_names):
+            detail = details[i] if i < len(details) else {}
+            results.append({
+                "success": True,
+                "sample_set": name,
+                "stf_file": str(stf_file),
+                "processed_file": result["processed_file"],
+                "batch": batch,
+                "status": detail.get("Status"),
+                "execution_report": detail.get("ExecutionReport"),
+                "timestamp": timestamp
+            })
+        print(f"✅ STF batch {batch} initiated: {', '.join(sample_set_names)}")
+        return results
+    
     def get_system_status(self) -> Dict:
         """
         Get current system status